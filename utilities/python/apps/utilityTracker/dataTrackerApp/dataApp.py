@@ -2,8 +2,6 @@ from flask import Flask, render_template, request, redirect, url_for, flash, mak
 import pandas as pd
 import os
 from processFiles import process_xml, process_csv
-import plotly.express as px
-from plotly.utils import PlotlyJSONEncoder
 import json
 
 
@@ -28,6 +26,9 @@ def allowed_file(filename):
 def index():
     global DATAFRAME
     if DATAFRAME is not None and not DATAFRAME.empty:
+        # Plotly is only needed once there is data to plot
+        import plotly.express as px
+        from plotly.utils import PlotlyJSONEncoder
         fig = px.line(DATAFRAME, x='start_datetime', y='correctedValue', title='Corrected Value Over Time')
         graphJSON = json.dumps(fig, cls=PlotlyJSONEncoder)
         return render_template('index.html', plot=graphJSON, dataframe=DATAFRAME.to_html())
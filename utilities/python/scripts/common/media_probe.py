@@ -0,0 +1,250 @@
+import os
+import json
+import sqlite3
+import threading
+import subprocess
+from fractions import Fraction
+from datetime import datetime
+from collections import namedtuple
+
+"""
+Shared ffprobe layer for the video scripts in this folder.
+
+Scraping the human-readable stderr of `ffmpeg -i` for "fps" or "Stream #0" starts
+a full ffmpeg per question, breaks when the wording changes, and every script
+repeats it for the same files. probe() instead runs `ffprobe -of json` once per
+file and returns a ProbeResult with the streams, frame rate as an exact fraction,
+duration, rotation, codecs and creation time. The keyframe times are read only
+when asked for, because that means reading every packet header of the file.
+
+Results are cached in a SQLite database keyed by path, size and modification
+time, so planning a batch over thousands of clips that were probed before costs
+one stat and one index lookup per file. The cache is safe to share between
+threads and processes.
+
+Scripts in sibling folders import it the same way as scanner.py:
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+    from media_probe import probe
+"""
+
+CACHE_PATH = os.environ.get("MEDIA_PROBE_CACHE",
+                            os.path.join(os.path.expanduser("~"), ".cache", "media_probe.db"))
+
+
+class Stream(namedtuple("Stream", "index codec_type codec_name width height fps rotation sample_rate channels "
+                                  "duration tags disposition")):
+    """
+    One stream of a probed file. fps is a Fraction (None for non-video streams),
+    rotation is in degrees counter-clockwise, the display-matrix convention, and
+    disposition is ffprobe's dict of flags such as attached_pic.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, stream):
+        fps = None
+        if stream.get("codec_type") == "video":
+            for key in ("avg_frame_rate", "r_frame_rate"):
+                numerator, _, denominator = stream.get(key, "0/0").partition("/")
+                if denominator and int(denominator) and int(numerator):
+                    fps = Fraction(int(numerator), int(denominator))
+                    break
+        rotation = 0
+        for side_data in stream.get("side_data_list", []):
+            if "rotation" in side_data:
+                rotation = int(float(side_data["rotation"]))
+                break
+        else:
+            # The old rotate tag counts clockwise
+            rotation = -int(stream.get("tags", {}).get("rotate", 0))
+        return cls(stream.get("index"), stream.get("codec_type"), stream.get("codec_name"), stream.get("width"),
+                   stream.get("height"), fps, rotation, int(stream["sample_rate"]) if "sample_rate" in stream else None,
+                   stream.get("channels"), float(stream["duration"]) if "duration" in stream else None,
+                   stream.get("tags", {}), stream.get("disposition", {}))
+
+
+class ProbeResult(namedtuple("ProbeResult", "path format_name duration bit_rate tags streams keyframes")):
+    """
+    A probed file. keyframes is a list of keyframe times of the first video stream
+    in seconds, or None if they were not asked for.
+    """
+    __slots__ = ()
+
+    @property
+    def video(self):
+        """First video stream (cover art excluded), or None."""
+        return next((stream for stream in self.streams if stream.codec_type == "video"
+                     and not stream.disposition.get("attached_pic")), None)
+
+    @property
+    def audio(self):
+        return next((stream for stream in self.streams if stream.codec_type == "audio"), None)
+
+    @property
+    def has_audio(self):
+        return self.audio is not None
+
+    @property
+    def fps(self):
+        return self.video.fps if self.video else None
+
+    @property
+    def rotation(self):
+        return self.video.rotation if self.video else 0
+
+    @property
+    def creation_time(self):
+        """The container's creation_time tag as a naive UTC datetime, or None."""
+        value = self.tags.get("creation_time") or (self.video.tags.get("creation_time") if self.video else None)
+        if not value:
+            return None
+        try:
+            created = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if created.utcoffset():
+            created = created - created.utcoffset()
+        created = created.replace(tzinfo=None)
+        # Cameras without a clock write the QuickTime epoch
+        return created if created.year > 1970 else None
+
+    @classmethod
+    def from_json(cls, path, data, keyframes=None):
+        container = data.get("format", {})
+        return cls(path, container.get("format_name"),
+                   float(container["duration"]) if "duration" in container else None,
+                   int(container["bit_rate"]) if "bit_rate" in container else None,
+                   container.get("tags", {}),
+                   [Stream.from_json(stream) for stream in data.get("streams", [])],
+                   keyframes)
+
+
+class ProbeError(Exception):
+    pass
+
+
+def run_ffprobe(path):
+    """Runs ffprobe on a file and returns its parsed JSON output."""
+    result = subprocess.run(["ffprobe", "-v", "error", "-show_format", "-show_streams", "-of", "json", path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace")
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe could not read {path}")
+    return json.loads(result.stdout)
+
+
+def read_keyframes(path):
+    """Returns the times of the keyframes of the first video stream, from packet headers only."""
+    result = subprocess.run(["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries",
+                             "packet=pts_time,flags", "-of", "csv=p=0", path],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors="replace")
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe could not read {path}")
+    keyframes = []
+    for line in result.stdout.splitlines():
+        time, _, flags = line.partition(",")
+        if "K" in flags and time not in ("", "N/A"):
+            keyframes.append(float(time))
+    return sorted(keyframes)
+
+
+class ProbeCache:
+    """
+    Args:
+        cache_path (str): SQLite database file.
+    """
+
+    def __init__(self, cache_path=CACHE_PATH):
+        directory = os.path.dirname(cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(cache_path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS probes (
+                path      TEXT PRIMARY KEY,
+                size      INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                probe     TEXT NOT NULL,
+                keyframes TEXT
+            )
+            """
+        )
+        self.connection.commit()
+        self.lock = threading.Lock()
+
+    def probe(self, path, keyframes=False):
+        path = os.path.abspath(path)
+        stat_result = os.stat(path)
+        try:
+            with self.lock:
+                row = self.connection.execute("SELECT size, mtime_ns, probe, keyframes FROM probes WHERE path = ?",
+                                              (path,)).fetchone()
+        except sqlite3.Error:
+            # A locked or unreadable cache only costs the ffprobe run
+            row = None
+        if row is not None and (row[0], row[1]) == (stat_result.st_size, stat_result.st_mtime_ns):
+            data, stored_keyframes = json.loads(row[2]), row[3]
+            if not keyframes or stored_keyframes is not None:
+                return ProbeResult.from_json(path, data, json.loads(stored_keyframes) if keyframes else None)
+        else:
+            data, stored_keyframes = run_ffprobe(path), None
+
+        keyframe_times = read_keyframes(path) if keyframes else None
+        if keyframe_times is not None:
+            stored_keyframes = json.dumps(keyframe_times)
+        try:
+            with self.lock:
+                self.connection.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?)",
+                                        (path, stat_result.st_size, stat_result.st_mtime_ns, json.dumps(data),
+                                         stored_keyframes))
+                self.connection.commit()
+        except sqlite3.Error:
+            pass
+        return ProbeResult.from_json(path, data, keyframe_times)
+
+    def close(self):
+        self.connection.close()
+
+
+default_cache = None
+default_cache_pid = None
+default_cache_lock = threading.Lock()
+
+
+def probe(path, keyframes=False, cache=None):
+    """
+    Probes a media file, using the on-disk cache (CACHE_PATH, or the MEDIA_PROBE_CACHE
+    environment variable) unless `cache` is given. If the default cache cannot be
+    opened (read-only home, locked database), the file is probed without it.
+
+    Args:
+        path (str or Path): File to probe.
+        keyframes (bool): Also read the keyframe times of the first video stream.
+        cache (ProbeCache): Cache to use instead of the default one.
+
+    Returns:
+        ProbeResult
+
+    Raises:
+        ProbeError: ffprobe could not read the file.
+        FileNotFoundError: The file, or ffprobe itself, does not exist.
+    """
+    global default_cache, default_cache_pid
+    if cache is None:
+        with default_cache_lock:
+            # A connection must not be carried into a forked worker process
+            if default_cache_pid != os.getpid():
+                default_cache_pid = os.getpid()
+                try:
+                    default_cache = ProbeCache()
+                except (sqlite3.Error, OSError) as e:
+                    print(f"Warning: probe cache {CACHE_PATH} unavailable ({e}); probing without it.")
+                    default_cache = None
+        cache = default_cache
+    if cache is None:
+        path = os.path.abspath(path)
+        return ProbeResult.from_json(path, run_ffprobe(path), read_keyframes(path) if keyframes else None)
+    return cache.probe(os.fspath(path), keyframes)
@@ -0,0 +1,150 @@
+import os
+from collections import namedtuple
+
+"""
+Shared directory scanner for the scripts in this folder.
+
+Built on os.scandir, which returns the file type of every entry with the directory
+listing itself, and caches the stat result of each entry. Compared to os.walk
+followed by os.path.isfile / os.path.getsize, or Path.iterdir followed by is_file,
+every file costs at most one stat call instead of two or three.
+
+- Excluded directories (such as a "duplicates" folder) are pruned as soon as they
+  are listed, so nothing below them is ever read.
+- scan_files can list several directories at once on a thread pool, which helps on
+  network shares and cold disks where each listing waits on I/O.
+- Everything is a generator, so callers can start working on the first files
+  while the rest of the tree is still being listed.
+
+Scripts in sibling folders import it by adding this folder to sys.path:
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+    from scanner import scan_files
+"""
+
+
+class FileEntry(namedtuple("FileEntry", "path stat")):
+    """A scanned file: its path and os.stat_result. Unpacks like a (path, stat) tuple."""
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+
+def normalize(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def list_directory(directory, excluded, extensions, follow_symlinks, identity, with_stat):
+    """
+    Lists one directory.
+
+    Returns:
+        tuple: (list of FileEntry, list of paths of sub-directories to descend into)
+    """
+    files, subdirectories = [], []
+    try:
+        with os.scandir(directory) as iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        if not excluded or normalize(entry.path) not in excluded:
+                            subdirectories.append(entry.path)
+                    elif entry.is_file():
+                        if extensions and not entry.name.lower().endswith(extensions):
+                            continue
+                        stat_result = None
+                        if with_stat:
+                            # DirEntry.stat() leaves st_dev and st_ino zero on Windows
+                            stat_result = os.stat(entry.path) if identity and os.name == "nt" else entry.stat()
+                        files.append(FileEntry(entry.path, stat_result))
+                except OSError:
+                    continue
+    except OSError:
+        # Unreadable directories are skipped, like os.walk does by default
+        pass
+    return files, subdirectories
+
+
+def scan_files(directory, exclude=(), extensions=None, recursive=True, workers=1, follow_symlinks=False,
+               identity=False, with_stat=True):
+    """
+    Yields a FileEntry for every regular file below `directory`.
+
+    Args:
+        directory (str or Path): Root directory.
+        exclude (iterable): Directories whose whole subtree is skipped.
+        extensions (tuple): Lower-case extensions such as (".jpg", ".mp4") to keep. Default: all files.
+        recursive (bool): Descend into sub-directories.
+        workers (int): Directories listed in parallel. 1 lists them in order on the
+            calling thread; more lists them on a thread pool and yields files in the
+            order the listings finish.
+        follow_symlinks (bool): Descend into symlinked directories. Symlinked files
+            are always followed.
+        identity (bool): Make sure st_dev and st_ino are filled in, which costs one
+            extra stat call per file on Windows.
+        with_stat (bool): Fill in FileEntry.stat. Without it, most file systems
+            report the file type in the listing and no stat call is made at all.
+    """
+    excluded = {normalize(path) for path in exclude}
+    if extensions:
+        extensions = tuple(extension.lower() for extension in extensions)
+    options = (excluded, extensions, follow_symlinks, identity, with_stat)
+
+    if workers <= 1:
+        pending = [os.fspath(directory)]
+        while pending:
+            files, subdirectories = list_directory(pending.pop(), *options)
+            yield from files
+            if recursive:
+                # Reversed so the tree is visited in listing order, like os.walk
+                pending.extend(reversed(subdirectories))
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as executor:
+        running = {executor.submit(list_directory, os.fspath(directory), *options)}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirectories = future.result()
+                if recursive:
+                    running.update(executor.submit(list_directory, path, *options) for path in subdirectories)
+                yield from files
+
+
+def walk(directory, exclude=(), follow_symlinks=False):
+    """
+    os.walk replacement that yields (root, directory entries, file entries) with
+    os.DirEntry objects, top-down. Removing entries from the directory list prunes them.
+    """
+    excluded = {normalize(path) for path in exclude}
+    pending = [os.fspath(directory)]
+    while pending:
+        root = pending.pop()
+        directories, files = [], []
+        try:
+            with os.scandir(root) as iterator:
+                for entry in iterator:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            if not excluded or normalize(entry.path) not in excluded:
+                                directories.append(entry)
+                        else:
+                            files.append(entry)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        yield root, directories, files
+        pending.extend(entry.path for entry in reversed(directories))
+
+
+def subdirectories(directory):
+    """Returns the os.DirEntry of every immediate sub-directory of `directory`."""
+    try:
+        with os.scandir(directory) as iterator:
+            return [entry for entry in iterator if entry.is_dir()]
+    except OSError:
+        return []
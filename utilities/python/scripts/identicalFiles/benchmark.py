@@ -0,0 +1,258 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+from datetime import datetime
+from findDuplicateFiles import iter_files, find_identical_videos, move_to_duplicates_folder
+from hash_index import HashIndex
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+"""
+Benchmark harness for findDuplicateFiles.py.
+
+Generates a reproducible synthetic tree, then times each phase of the duplicate
+finder separately and appends the results to a JSON file so runs can be compared.
+
+The tree contains three kinds of files:
+- unique files, with a size drawn from a log-normal distribution;
+- exact duplicates of unique files;
+- "near misses": same size and same head and tail as a unique file, but a
+  different middle. They survive the partial hash stage and are the worst case
+  for the pipeline.
+
+Files are sparse by default: each file is truncated to its size and only small
+marker blocks at the head, middle and tail are written. A multi-GB tree then
+costs almost no disk space or time to create, and the benchmark measures the
+pipeline and hashing cost. Use --dense to fill files with random data when the
+disk itself is what you want to measure.
+
+Phases:
+    scan   walk only (iter_files)
+    hash   find_identical_videos with an empty hash index
+    rescan find_identical_videos again with the warm index
+    move   move_to_duplicates_folder
+
+For each phase the report includes wall time, files/s, MB/s, bytes read by the
+process versus bytes in the tree (Linux, from /proc/self/io), and peak RSS.
+
+Usage:
+    python benchmark.py --files 20000 --median-size 2000000 --duplicates 0.2 --near-misses 0.05
+    python benchmark.py --files 2000 --median-size 200000000 --sigma 0.5 --output results.json
+"""
+
+MARKER_SIZE = 4096  # Bytes of random data written at the head, middle and tail of each file
+
+
+def draw_size(rng, median_size, sigma, max_size):
+    return max(1, min(max_size, int(rng.lognormvariate(0, sigma) * median_size)))
+
+
+def write_file(path, size, seed, middle_seed=None, dense=False):
+    """
+    Writes a synthetic file. Files made with the same `seed` and `middle_seed` are
+    identical; files that only differ in `middle_seed` share their head and tail.
+    """
+    rng = random.Random(seed)
+    middle_rng = random.Random(seed if middle_seed is None else middle_seed)
+    with open(path, "wb") as file:
+        if dense:
+            remaining = size
+            while remaining:
+                chunk = min(remaining, 1024 * 1024)
+                file.write(rng.randbytes(chunk))
+                remaining -= chunk
+            if size > 3 * MARKER_SIZE:
+                file.seek(size // 2)
+                file.write(middle_rng.randbytes(MARKER_SIZE))
+            return
+        file.truncate(size)
+        for offset, marker_rng in ((0, rng), (size // 2, middle_rng), (max(0, size - MARKER_SIZE), rng)):
+            file.seek(offset)
+            file.write(marker_rng.randbytes(min(MARKER_SIZE, size - offset)))
+
+
+def generate_tree(root, file_count=1000, seed=0, median_size=1024 * 1024, sigma=1.5,
+                  max_size=4 * 1024 ** 3, duplicate_ratio=0.2, near_miss_ratio=0.05,
+                  files_per_directory=200, dense=False):
+    """
+    Creates a reproducible synthetic tree below `root`.
+
+    Args:
+        root (str): Directory to create the files in.
+        file_count (int): Total number of files.
+        seed (int): Seed for sizes, contents and layout.
+        median_size (int): Median file size in bytes.
+        sigma (float): Spread of the log-normal size distribution.
+        max_size (int): Largest allowed file size.
+        duplicate_ratio (float): Fraction of files that are exact copies of another file.
+        near_miss_ratio (float): Fraction of files that only differ from another file in the middle.
+        files_per_directory (int): Files per generated sub-directory.
+        dense (bool): Fill files with random data instead of leaving sparse holes.
+
+    Returns:
+        dict: Summary with file counts and the total number of bytes.
+    """
+    rng = random.Random(seed)
+    duplicate_count = int(file_count * duplicate_ratio)
+    near_miss_count = int(file_count * near_miss_ratio)
+    unique_count = max(1, file_count - duplicate_count - near_miss_count)
+
+    # (size, content seed, middle seed) for every file
+    uniques = [(draw_size(rng, median_size, sigma, max_size), rng.getrandbits(64), None) for _ in range(unique_count)]
+    files = list(uniques)
+    files += [rng.choice(uniques) for _ in range(duplicate_count)]
+    files += [(size, content, rng.getrandbits(64)) for size, content, _ in
+              (rng.choice(uniques) for _ in range(near_miss_count))]
+    rng.shuffle(files)
+
+    total_bytes = 0
+    for number, (size, content, middle) in enumerate(files):
+        directory = os.path.join(root, f"dir_{number // files_per_directory:05d}")
+        os.makedirs(directory, exist_ok=True)
+        write_file(os.path.join(directory, f"file_{number:08d}.bin"), size, content, middle, dense)
+        total_bytes += size
+
+    return {
+        "files": len(files),
+        "unique": unique_count,
+        "duplicates": duplicate_count,
+        "near_misses": near_miss_count,
+        "bytes": total_bytes,
+    }
+
+
+def io_counters():
+    """Returns (bytes read through syscalls, bytes read from storage) for this process, or (None, None)."""
+    try:
+        with open("/proc/self/io") as file:
+            fields = dict(line.split(": ") for line in file.read().splitlines())
+        return int(fields["rchar"]), int(fields["read_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def measure(name, tree, function):
+    """Runs `function` and returns its result and a report for the phase."""
+    rchar_before, read_before = io_counters()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    rchar_after, read_after = io_counters()
+
+    report = {
+        "phase": name,
+        "seconds": round(elapsed, 4),
+        "files_per_second": round(tree["files"] / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+    }
+    if rchar_before is not None:
+        bytes_read = rchar_after - rchar_before
+        report.update({
+            "bytes_read": bytes_read,
+            "bytes_read_from_storage": read_after - read_before,
+            "read_ratio": round(bytes_read / tree["bytes"], 4) if tree["bytes"] else None,
+            "mb_per_second": round(bytes_read / 1024 ** 2 / elapsed, 1) if elapsed else None,
+        })
+    print(f"{name:>6}: {elapsed:8.3f} s  {report['files_per_second'] or 0:10.1f} files/s"
+          + (f"  {report['mb_per_second']:8.1f} MB/s  read {report['read_ratio']:.2%} of tree"
+             if "mb_per_second" in report and report["read_ratio"] is not None else ""))
+    return result, report
+
+
+def run_benchmark(root, tree, find_options):
+    """Times the scan, hash, rescan and move phases over a generated tree."""
+    reports = []
+    index_path = os.path.join(root, "benchmark_index.db")
+    tree_root = os.path.join(root, "tree")
+
+    _, report = measure("scan", tree, lambda: sum(1 for _ in iter_files(tree_root)))
+    reports.append(report)
+
+    def hash_phase():
+        with HashIndex(index_path) as index:
+            return find_identical_videos(tree_root, index, **find_options)
+
+    duplicates, report = measure("hash", tree, hash_phase)
+    report["groups"] = len(duplicates)
+    report["duplicate_files"] = sum(len(group) - 1 for group in duplicates)
+    reports.append(report)
+
+    _, report = measure("rescan", tree, hash_phase)
+    reports.append(report)
+
+    _, report = measure("move", tree, lambda: move_to_duplicates_folder(
+        duplicates, os.path.join(tree_root, "duplicates")))
+    reports.append(report)
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark findDuplicateFiles.py on a synthetic tree.")
+    parser.add_argument("--files", type=int, default=5000, help="Number of files (default: 5000).")
+    parser.add_argument("--median-size", type=int, default=1024 * 1024, help="Median file size in bytes.")
+    parser.add_argument("--sigma", type=float, default=1.5, help="Spread of the log-normal size distribution.")
+    parser.add_argument("--max-size", type=int, default=4 * 1024 ** 3, help="Largest file size in bytes.")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Fraction of exact duplicates.")
+    parser.add_argument("--near-misses", type=float, default=0.05,
+                        help="Fraction of same-size files that only differ in the middle.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the tree.")
+    parser.add_argument("--dense", action="store_true", help="Write real data instead of sparse files.")
+    parser.add_argument("--verify", choices=["hash", "bytes"], default="hash")
+    parser.add_argument("--low-memory", action="store_true")
+    parser.add_argument("--workdir", help="Directory for the tree (default: a temporary directory).")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated tree.")
+    parser.add_argument("--name", default="", help="Label stored with the results.")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="JSON file the results are appended to (default: benchmark_results.json).")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="dupbench_", dir=args.workdir)
+    try:
+        start = time.perf_counter()
+        tree = generate_tree(os.path.join(root, "tree"), args.files, args.seed, args.median_size, args.sigma,
+                             args.max_size, args.duplicates, args.near_misses, dense=args.dense)
+        print(f"Generated {tree['files']} files, {tree['bytes'] / 1024 ** 3:.2f} GB "
+              f"in {time.perf_counter() - start:.1f} s")
+
+        reports = run_benchmark(root, tree, {"verify": args.verify, "low_memory": args.low_memory})
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    results = []
+    if os.path.exists(args.output):
+        with open(args.output, "r") as file:
+            results = json.load(file)
+    results.append({
+        "name": args.name,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": vars(args),
+        "tree": tree,
+        "phases": reports,
+    })
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
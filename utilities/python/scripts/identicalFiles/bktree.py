@@ -0,0 +1,75 @@
+"""
+BK-tree for nearest-neighbour search over 64-bit perceptual hashes, and grouping of
+matches, shared by the photo and video near-duplicate finders.
+"""
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over 64-bit hashes with Hamming distance as the metric.
+    Each child edge is labelled with its distance to the parent, and the triangle
+    inequality lets a search skip every subtree whose edge label is further than
+    `max_distance` from the query's distance to the parent.
+    """
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = self.root
+        if node is None:
+            self.root = (value, [item], {})
+            return
+        while True:
+            stored, items, children = node
+            distance = (value ^ stored).bit_count()
+            if distance == 0:
+                items.append(item)
+                return
+            if distance not in children:
+                children[distance] = (value, [item], {})
+                return
+            node = children[distance]
+
+    def search(self, value, max_distance):
+        """Returns (distance, item) for every item within `max_distance` bits of `value`."""
+        matches = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            stored, items, children = nodes.pop()
+            distance = (value ^ stored).bit_count()
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in items)
+            for edge, child in children.items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    nodes.append(child)
+        return matches
+
+
+def leader_groups(items, neighbours):
+    """
+    Groups items around leaders instead of chaining them: the first item not yet
+    grouped leads a group of every ungrouped item that `neighbours` matches to it.
+    Each member is therefore within the match distance of its leader, even when
+    A~B and B~C but A and C are far apart.
+
+    Args:
+        items (iterable): Hashable items, the preferred leaders first.
+        neighbours (callable): Returns the items that match a given item.
+
+    Returns:
+        list: Groups with at least two members, each led by its leader and then in
+        the order of `items`.
+    """
+    order = {item: i for i, item in enumerate(items)}
+    grouped = set()
+    groups = []
+    for leader in order:
+        if leader in grouped:
+            continue
+        grouped.add(leader)
+        members = sorted((item for item in set(neighbours(leader)) if item not in grouped), key=order.__getitem__)
+        if members:
+            grouped.update(members)
+            groups.append([leader] + members)
+    return groups
@@ -0,0 +1,105 @@
+import os
+from array import array
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+"""
+Compact, column-oriented table of scanned files for very large duplicate scans.
+
+Keeping a path string, an os.stat_result and a tuple per file costs around half a
+kilobyte per file, which adds up to gigabytes at tens of millions of files. The
+CandidateTable stores the same information in typed arrays instead:
+
+- directory paths are interned, and each file only stores a 4-byte directory id;
+- file names are packed into one bytearray with an offsets array;
+- sizes, mtimes, devices and inodes live in `array` columns of 8-byte integers.
+
+That is roughly 60-80 bytes per file. Files are grouped by size by sorting the
+size column (with NumPy when installed) instead of building a dict of lists, and
+path strings and stat records are only materialised for files whose size collides.
+"""
+
+FileStat = namedtuple("FileStat", "st_dev st_ino st_size st_mtime_ns")
+
+
+class CandidateTable:
+    def __init__(self):
+        self.directories = []
+        self.directory_ids = {}
+        self.directory_column = array("I")
+        self.names = bytearray()
+        self.name_offsets = array("Q", [0])
+        self.sizes = array("Q")
+        self.mtimes = array("q")
+        self.devices = array("Q")
+        self.inodes = array("Q")
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def append(self, path, stat_result):
+        directory, name = os.path.split(path)
+        directory_id = self.directory_ids.get(directory)
+        if directory_id is None:
+            directory_id = self.directory_ids[directory] = len(self.directories)
+            self.directories.append(directory)
+
+        self.directory_column.append(directory_id)
+        self.names += os.fsencode(name)
+        self.name_offsets.append(len(self.names))
+        self.sizes.append(stat_result.st_size)
+        self.mtimes.append(stat_result.st_mtime_ns)
+        self.devices.append(stat_result.st_dev)
+        self.inodes.append(stat_result.st_ino)
+
+    def path(self, row):
+        name = os.fsdecode(bytes(self.names[self.name_offsets[row]:self.name_offsets[row + 1]]))
+        return os.path.join(self.directories[self.directory_column[row]], name)
+
+    def entry(self, row):
+        """Returns a (path, FileStat) entry usable wherever (path, os.stat_result) is expected."""
+        return self.path(row), FileStat(self.devices[row], self.inodes[row], self.sizes[row], self.mtimes[row])
+
+    def paths(self):
+        for row in range(len(self)):
+            yield self.path(row)
+
+    def rows_by_size(self):
+        """Yields the row numbers ordered by file size."""
+        if np is None or not len(self):
+            yield from sorted(range(len(self)), key=self.sizes.__getitem__)
+            return
+        order = np.argsort(np.frombuffer(self.sizes, dtype=np.uint64), kind="stable")
+        # Convert to Python ints a chunk at a time rather than as one huge list
+        for start in range(0, len(order), 65536):
+            yield from order[start:start + 65536].tolist()
+
+    def size_groups(self):
+        """
+        Yields lists of row numbers of files that share a size with at least one
+        other file. Hardlinks of a row already in the group are left out.
+        """
+        group, group_size = [], None
+        for row in self.rows_by_size():
+            size = self.sizes[row]
+            if size != group_size:
+                if len(group) > 1 and len(group := self.without_hardlinks(group)) > 1:
+                    yield group
+                group, group_size = [], size
+            group.append(row)
+        if len(group) > 1 and len(group := self.without_hardlinks(group)) > 1:
+            yield group
+
+    def without_hardlinks(self, rows):
+        inodes = set()
+        unique = []
+        for row in rows:
+            inode = (self.devices[row], self.inodes[row])
+            if inode not in inodes:
+                inodes.add(inode)
+                unique.append(row)
+        return unique
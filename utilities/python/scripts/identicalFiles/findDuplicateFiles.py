@@ -1,53 +1,333 @@
 import os
-import hashlib
+import sys
+import contextlib
 import shutil
-import json
-import tkinter as tk
-from tkinter import filedialog
+import queue
+import threading
+import argparse
+import itertools
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from scanner import scan_files
+from hash_index import HashIndex
+from hashing import (DIGESTS, DEFAULT_ALGORITHM, BLOCK_SIZE, PARTIAL_BLOCK_SIZE, SAMPLE_COUNT,
+                     DEFAULT_DEVICE_CONCURRENCY, HashScheduler, device_limits_from_paths, digest_profile, new_digest,
+                     hash_partial, hash_samples, hash_full)
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409              # ioctl request from linux/fs.h
+LOCKSTEP_BLOCK_SIZE = 256 * 1024  # Bytes read per file and step by split_by_content
+MAX_LOCKSTEP_FILES = 32           # Files open at once per lockstep comparison; larger groups are compared in chunks
+
+
+def read_block(file, size):
+    """
+    Reads `size` bytes, or up to EOF. Unbuffered reads may return less than asked
+    (network shares do), which would misalign the blocks of identical files.
+    """
+    parts = []
+    while size > 0:
+        part = file.read(size)
+        if not part:
+            break
+        parts.append(part)
+        size -= len(part)
+    return b"".join(parts)
+
+
+def split_by_content(file_paths, block_size=LOCKSTEP_BLOCK_SIZE):
+    """
+    Reads all files of a same-size group in lockstep and splits the group as soon
+    as their blocks diverge. A file stops being read once no other file shares its
+    content so far, so clips that differ early cost almost no I/O, while files that
+    stay together to EOF are verified byte for byte. At most MAX_LOCKSTEP_FILES files
+    are open at once: larger groups are compared in chunks against their first file,
+    see split_in_chunks.
+
+    Args:
+        file_paths (list): Paths of files with the same size.
+        block_size (int): Bytes read from each file per step.
+
+    Returns:
+        list: Groups of byte-identical paths with at least two members, each group
+        and its members in the order of `file_paths`.
+    """
+    if len(file_paths) > MAX_LOCKSTEP_FILES:
+        return split_in_chunks(file_paths, block_size)
+    position = {path: i for i, path in enumerate(file_paths)}
+    identical = []
+
+    with contextlib.ExitStack() as stack:
+        files = []
+        for path in file_paths:
+            try:
+                files.append((path, stack.enter_context(open(path, "rb", buffering=0))))
+            except OSError as e:
+                print(f"Warning: Unable to read {path}: {e}")
+
+        pending = [files] if len(files) > 1 else []
+        while pending:
+            # Compare against one representative block per sub-group; bytes equality
+            # is a memcmp and is cheaper than hashing each block for a dict key
+            sub_groups = []
+            for path, file in pending.pop():
+                try:
+                    block = read_block(file, block_size)
+                except OSError as e:
+                    print(f"Warning: Unable to read {path}: {e}")
+                    file.close()
+                    continue
+                for reference, members in sub_groups:
+                    if block == reference:
+                        members.append((path, file))
+                        break
+                else:
+                    sub_groups.append((block, [(path, file)]))
+
+            for block, members in sub_groups:
+                if len(members) < 2:
+                    members[0][1].close()
+                elif not block:
+                    identical.append([path for path, file in members])
+                    for _, file in members:
+                        file.close()
+                else:
+                    pending.append(members)
+
+    return sorted(identical, key=lambda group: position[group[0]])
+
+
+def split_in_chunks(file_paths, block_size=LOCKSTEP_BLOCK_SIZE):
+    """
+    split_by_content for groups larger than MAX_LOCKSTEP_FILES. The first file is
+    compared with the others MAX_LOCKSTEP_FILES - 1 at a time; the files that match
+    it form a group, and the rest are split again the same way. Groups that reach
+    this stage have matching partial hashes, so there is usually only one round.
+    """
+    identical = []
+    remaining = list(file_paths)
+    while len(remaining) > 1:
+        first, others = remaining[0], remaining[1:]
+        members, rest = [first], []
+        for start in range(0, len(others), MAX_LOCKSTEP_FILES - 1):
+            chunk = others[start:start + MAX_LOCKSTEP_FILES - 1]
+            matched = next((group for group in split_by_content([first] + chunk, block_size)
+                            if group[0] == first), [first])
+            members.extend(matched[1:])
+            rest.extend(path for path in chunk if path not in matched)
+        if len(members) > 1:
+            identical.append(members)
+        remaining = rest
+    return identical
+
 
 def compare_file_contents(file_path_1, file_path_2):
-    BLOCK_SIZE = 65536
-    hash1 = hashlib.sha256()
-    hash2 = hashlib.sha256()
+    if os.path.getsize(file_path_1) != os.path.getsize(file_path_2):
+        return False
+    return len(split_by_content([file_path_1, file_path_2])) == 1
+
+
+SAMPLE_THRESHOLD = 256 * 1024 * 1024  # Only files at least this large are sample-fingerprinted
+WALK_QUEUE_SIZE = 10000               # Maximum number of walked files waiting to be bucketed
+LOW_MEMORY_BATCH = 20000              # Colliding files hashed per batch in low-memory mode
+
+
+def iter_files(directory, workers=1):
+    """
+    Yields a (path, os.stat_result) entry for every regular file below `directory`,
+    pruning the "duplicates" folder.
+
+    Args:
+        directory (str): Root directory.
+        workers (int): Directories listed in parallel, see scanner.scan_files.
+    """
+    return scan_files(directory, exclude=[os.path.join(directory, "duplicates")], workers=workers, identity=True)
+
+
+def walk_into_queue(directory, file_queue, workers=1):
+    """
+    Producer thread: streams the entries of `iter_files` into a bounded queue,
+    followed by a None sentinel.
+    """
+    try:
+        for entry in iter_files(directory, workers):
+            file_queue.put(entry)
+    finally:
+        file_queue.put(None)
+
+
+def find_identical_videos(directory, index=None, sample_large=False, algorithm=DEFAULT_ALGORITHM,
+                          block_size=BLOCK_SIZE, partial_block_size=PARTIAL_BLOCK_SIZE,
+                          device_limits=None, default_concurrency=DEFAULT_DEVICE_CONCURRENCY, verify="hash",
+                          low_memory=False, progress=None, scan_workers=1, scan_stats=None):
+    """
+    Finds groups of byte-identical files using a staged pipeline:
+    size -> partial hash (head and tail) -> optional sample hash -> full hash.
+    Each stage only sees files that still collide after the previous one, so
+    unique files are rarely read past their first few KB and no file is read
+    in full more than once. Paths that share an inode with a file already seen
+    are hardlinks of it and are skipped entirely, so a library that was already
+    deduplicated with link_duplicates costs little more than the walk.
 
-    with open(file_path_1, "rb") as file1, open(file_path_2, "rb") as file2:
-        while True:
-            data1 = file1.read(BLOCK_SIZE)
-            data2 = file2.read(BLOCK_SIZE)
+    The directory walk runs on its own thread and streams files through a bounded
+    queue. As soon as a second file of some size turns up, partial hashes for that
+    size are started on the hashing pools, so walking and hashing overlap.
 
-            if not data1 and not data2:
-                break
+    Args:
+        directory (str): Root directory to search.
+        index (HashIndex): Optional persistent digest cache. Unchanged files reuse
+            their stored digests instead of being read again.
+        sample_large (bool): Also fingerprint files above SAMPLE_THRESHOLD with
+            evenly spaced blocks before falling back to a full hash.
+        algorithm (str): Digest to use, one of hashing.DIGESTS.
+        block_size (int): Read size for full hashes.
+        partial_block_size (int): Bytes read from each end of a file in the partial stage.
+        device_limits (dict): Concurrent reads allowed per st_dev, see
+            hashing.device_limits_from_paths.
+        default_concurrency (int): Concurrent reads for devices not in `device_limits`.
+        verify (str): How candidates that survive the partial stages are confirmed.
+            "hash" full-hashes them (and caches the digests in the index);
+            "bytes" compares each group block by block with split_by_content,
+            which stops reading a file at its first differing block and cannot
+            be fooled by a hash collision.
+        low_memory (bool): Store scanned files in a CandidateTable instead of
+            per-file Python objects, for scans of tens of millions of files.
+            Files are then grouped by sorting sizes after the walk, so hashing
+            starts when the walk is done instead of overlapping with it.
+        progress (progress.ScanProgress): Optional counters for files walked and
+            work done per stage.
+        scan_workers (int): Directories listed in parallel by the walker thread.
+        scan_stats (dict): Optional; filled with the scan-time stat of every path in
+            the returned groups, for link_duplicates to detect files changed since.
 
-            hash1.update(data1)
-            hash2.update(data2)
+    Returns:
+        list: Groups of identical file paths. The first path of each group is
+        the occurrence that is kept.
+    """
+    new_digest(algorithm)  # Fail fast on an unknown algorithm
+    if verify not in ("hash", "bytes"):
+        raise ValueError(f"Unknown verify mode '{verify}'. Choose 'hash' or 'bytes'.")
+    if index is not None:
+        index.set_profile(digest_profile(algorithm, partial_block_size))
 
-    return hash1.digest() == hash2.digest()
+    def partial_digest(path, size):
+        return hash_partial(path, size, partial_block_size, algorithm)
 
+    def sample_digest(path, size):
+        return hash_samples(path, size, SAMPLE_COUNT, partial_block_size, algorithm)
 
-def find_identical_videos(directory, processed_files):
-    file_sizes = {}
+    def full_digest(path, size):
+        return hash_full(path, block_size, algorithm)
+
+    def confirm(scheduler, candidates):
+        """Runs the stages after the partial hash and returns groups of identical paths."""
+        def size_of(group):
+            return group[0][1].st_size
+
+        if scan_stats is not None:
+            scan_stats.update(entry for group in candidates for entry in group)
+
+        # Groups whose partial hash already covered the whole file are confirmed, unless
+        # every group must be compared byte for byte
+        confirmed = []
+        if verify == "hash":
+            confirmed = [group for group in candidates if size_of(group) <= 2 * partial_block_size]
+            candidates = [group for group in candidates if size_of(group) > 2 * partial_block_size]
+
+        if sample_large:
+            large = [group for group in candidates if size_of(group) >= SAMPLE_THRESHOLD]
+            candidates = ([group for group in candidates if size_of(group) < SAMPLE_THRESHOLD]
+                          + scheduler.split(large, "sample", sample_digest))
+
+        comparisons = []
+        if verify == "bytes":
+            # Compare each group in lockstep on the pool of its device; very large groups
+            # are compared in chunks to bound the open files
+            lockstep, candidates = candidates, []
+            for group in lockstep:
+                compare = split_by_content
+                if progress is not None:
+                    # Counted at full size; lockstep reads stop early once files diverge
+                    compare = progress.track("bytes", size_of(group), compare, files=len(group))
+                comparisons.append(scheduler.pool_for(group[0][1].st_dev).submit(
+                    compare, [path for path, _ in group], LOCKSTEP_BLOCK_SIZE))
+
+        confirmed += scheduler.split(candidates, "full", full_digest)
+        identical = [[path for path, _ in group] for group in confirmed]
+        for comparison in comparisons:
+            identical.extend(comparison.result())
+        return identical
+
+    file_queue = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+    walker = threading.Thread(target=walk_into_queue, args=(directory, file_queue, scan_workers), daemon=True)
     duplicates = []
 
-    for root, _, files in os.walk(directory):
-        for filename in files:
-            full_path = os.path.join(root, filename)
+    with HashScheduler(index, device_limits, default_concurrency, progress) as scheduler:
+        walker.start()
+
+        if low_memory:
+            # Imported here because it pulls in NumPy when installed
+            from candidates import CandidateTable
+            table = CandidateTable()
+            while (entry := file_queue.get()) is not None:
+                table.append(*entry)
+                if progress is not None:
+                    progress.walked(entry[1])
+            walker.join()
+            if progress is not None:
+                progress.finish_walk()
+            seen_paths = table.paths()
+
+            # Only files whose size collides become full entries, a batch at a time
+            batch = []
+            for rows in itertools.chain(table.size_groups(), [None]):
+                if rows is not None:
+                    batch.append([table.entry(row) for row in rows])
+                if batch and (rows is None or sum(map(len, batch)) >= LOW_MEMORY_BATCH):
+                    duplicates.extend(confirm(scheduler, scheduler.split(batch, "partial", partial_digest)))
+                    batch = []
+        else:
+            buckets = {}
+            pending = {}
+            seen_paths = []
+            seen_inodes = set()
 
-            # Skip processing files within the "duplicates" folder
-            if not full_path.startswith(os.path.join(directory, "duplicates")):
-                if os.path.isfile(full_path) and full_path not in processed_files:
-                    file_size = os.path.getsize(full_path)
+            def start_partial(entry):
+                pending[entry[0]] = scheduler.submit(
+                    entry, "partial", lambda path: partial_digest(path, entry[1].st_size))
 
-                    # Add the file to the processed_files set
-                    processed_files.add(full_path)
+            # Bucket files by size as they arrive and start partial hashes for every collision
+            while (entry := file_queue.get()) is not None:
+                seen_paths.append(entry[0])
+                if progress is not None:
+                    progress.walked(entry[1])
 
-                    if file_size in file_sizes:
-                        file_path_1 = file_sizes[file_size]
-                        file_path_2 = full_path
+                # Hardlinks of a file that was already seen share its data; there is
+                # nothing to hash and nothing to reclaim
+                inode = (entry[1].st_dev, entry[1].st_ino)
+                if inode in seen_inodes:
+                    continue
+                seen_inodes.add(inode)
 
-                        if compare_file_contents(file_path_1, file_path_2):
-                            duplicates.append((file_path_1, file_path_2))
-                    else:
-                        file_sizes[file_size] = full_path
+                bucket = buckets.setdefault(entry[1].st_size, [])
+                bucket.append(entry)
+                if len(bucket) == 2:
+                    start_partial(bucket[0])
+                if len(bucket) >= 2:
+                    start_partial(entry)
+            walker.join()
+            if progress is not None:
+                progress.finish_walk()
+
+            duplicates = confirm(scheduler, [
+                sub_group for bucket in buckets.values() if len(bucket) > 1
+                for sub_group in scheduler.collect([(entry, pending.pop(entry[0])) for entry in bucket], "partial")
+            ])
+
+    if index is not None:
+        index.prune(directory, seen_paths)
 
     return duplicates
 
@@ -55,56 +335,241 @@ def move_to_duplicates_folder(duplicates_list, duplicates_folder):
     if not os.path.exists(duplicates_folder):
         os.makedirs(duplicates_folder)
 
-    for i, (file_path_1, file_path_2) in enumerate(duplicates_list, start=1):
-        file_name_2 = os.path.basename(file_path_2)
-        new_name_2 = f"{i}_{file_name_2}"
+    for i, group in enumerate(duplicates_list, start=1):
+        # Move only duplicates, not the first occurrence
+        for j, file_path in enumerate(group[1:], start=1):
+            new_path = os.path.join(duplicates_folder, f"{i}_{j}_{os.path.basename(file_path)}")
+
+            try:
+                shutil.move(file_path, new_path)
+            except FileNotFoundError:
+                print(f"Warning: Unable to move {file_path}")
 
-        new_path_2 = os.path.join(duplicates_folder, new_name_2)
 
-        try:
-            if file_path_1 != file_path_2:  # Move only duplicates, not the first occurrence
-                shutil.move(file_path_2, new_path_2)
-        except FileNotFoundError:
-            print(f"Warning: Unable to move {file_path_2}")
+def reflink_file(source_path, target_path):
+    """
+    Creates `target_path` as a copy-on-write clone of `source_path` using the Linux
+    FICLONE ioctl (Btrfs, XFS, bcachefs, ...). No data is copied.
+    """
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform")
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
 
 
-def save_processed_files(processed_files, processed_file_path):
-    with open(processed_file_path, "w") as file:
-        json.dump(list(processed_files), file)
+def replace_with_link(original_path, duplicate_path, mode="hardlink"):
+    """
+    Atomically replaces `duplicate_path` with a hardlink or reflink of `original_path`.
+    The link is created under a temporary name next to the duplicate and then renamed
+    over it, so a crash leaves either the old copy or the link in place, never neither.
+
+    Args:
+        original_path (str): File to keep.
+        duplicate_path (str): Identical file to replace.
+        mode (str): "hardlink" or "reflink".
+    """
+    directory, name = os.path.split(duplicate_path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.dedupe")
+    try:
+        if mode == "hardlink":
+            os.link(original_path, temp_path)
+        else:
+            reflink_file(original_path, temp_path)
+            shutil.copystat(duplicate_path, temp_path)
+        os.replace(temp_path, duplicate_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+
+
+def link_duplicates(duplicates_list, mode="hardlink", scan_stats=None):
+    """
+    Replaces duplicates in place with hardlinks or reflinks of the first occurrence.
+    Links cannot span filesystems, so each group keeps one original per device and
+    duplicates are linked to the original on their own device.
+
+    A file whose size, modification time or inode differs from its stat at scan
+    time was changed since it was compared and is skipped. Without `scan_stats`
+    the duplicate is compared with the original byte by byte again instead.
+
+    Args:
+        duplicates_list (list): Groups of identical file paths, as returned by
+            find_identical_videos.
+        mode (str): "hardlink" or "reflink".
+        scan_stats (dict): Path to stat at scan time, see find_identical_videos.
+
+    Returns:
+        int: Number of bytes reclaimed. Files that were already links to the
+        original, or that have other hard links, free nothing and are not counted.
+    """
+    def changed(path, stat_result):
+        scanned = scan_stats.get(path)
+        return scanned is None or (scanned.st_size, scanned.st_mtime_ns, scanned.st_ino) != \
+            (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+
+    reclaimed = 0
+    for group in duplicates_list:
+        originals = {}
+        for file_path in group:
+            try:
+                stat_result = os.stat(file_path)
+                original_path = originals.setdefault(stat_result.st_dev, file_path)
+                if original_path == file_path:
+                    continue
+                original_stat = os.stat(original_path)
+                if original_stat.st_ino == stat_result.st_ino:
+                    # Already a hardlink of the original
+                    continue
+                if scan_stats is not None:
+                    unchanged = not changed(file_path, stat_result) and not changed(original_path, original_stat)
+                else:
+                    unchanged = compare_file_contents(original_path, file_path)
+                if not unchanged:
+                    print(f"Warning: {file_path} changed since it was scanned, skipping")
+                    continue
+                replace_with_link(original_path, file_path, mode)
+                if stat_result.st_nlink == 1:
+                    reclaimed += stat_result.st_size
+            except OSError as e:
+                print(f"Warning: Unable to {mode} {file_path}: {e}")
+    return reclaimed
 
-def load_processed_files(processed_file_path):
-    if os.path.exists(processed_file_path):
-        with open(processed_file_path, "r") as file:
-            return set(json.load(file))
-    return set()
 
 def select_folder():
+    # tkinter is only needed for the folder picker; headless runs pass a directory
+    import tkinter as tk
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()
     folder_selected = filedialog.askdirectory(title="Select a folder")
     return folder_selected
 
+def parse_device_limit(value):
+    """Parses a PATH=N command-line value into a (path, concurrency) tuple."""
+    path, _, limit = value.rpartition("=")
+    if not path or not limit.isdigit() or int(limit) < 1:
+        raise argparse.ArgumentTypeError(f"Expected PATH=N, got '{value}'")
+    return path, int(limit)
+
+
 # Example usage:
 if __name__ == "__main__":
-    directory_to_search = select_folder()
+    parser = argparse.ArgumentParser(description="Find identical files and move the copies to a duplicates folder.")
+    parser.add_argument("directory", nargs="?", help="Directory to search. Opens a folder picker if omitted.")
+    parser.add_argument("--digest", choices=sorted(DIGESTS), default=DEFAULT_ALGORITHM,
+                        help=f"Hash algorithm (default: {DEFAULT_ALGORITHM}).")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE,
+                        help=f"Read size in bytes for full hashes (default: {BLOCK_SIZE}).")
+    parser.add_argument("--partial-block-size", type=int, default=PARTIAL_BLOCK_SIZE,
+                        help=f"Bytes hashed from each end of a file (default: {PARTIAL_BLOCK_SIZE}).")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_DEVICE_CONCURRENCY,
+                        help=f"Concurrent reads per device (default: {DEFAULT_DEVICE_CONCURRENCY}).")
+    parser.add_argument("--device-limit", type=parse_device_limit, action="append", default=[], metavar="PATH=N",
+                        help="Concurrent reads for the device holding PATH, e.g. /mnt/hdd=1. Repeatable.")
+    parser.add_argument("--action", choices=["move", "hardlink", "reflink"], default="move",
+                        help="Move duplicates to a duplicates folder, or replace them in place with "
+                             "hardlinks or copy-on-write reflinks of the first occurrence.")
+    parser.add_argument("--verify", choices=["hash", "bytes"], default="hash",
+                        help="Confirm candidates by full hash (cached in the index) or by lockstep byte comparison "
+                             "of every group, which no hash collision can fool.")
+    parser.add_argument("--similar-images", action="store_true",
+                        help="Find visually similar photos (resized, re-saved, re-compressed) instead of "
+                             "identical files. Requires numpy and Pillow.")
+    parser.add_argument("--similar-videos", action="store_true",
+                        help="Find re-encoded, trimmed or rotated copies of videos from sampled keyframes. "
+                             "Requires numpy and ffmpeg.")
+    parser.add_argument("--image-hash", choices=["dhash", "phash"], default="phash",
+                        help="Perceptual hash used by --similar-images (default: phash).")
+    parser.add_argument("--max-distance", type=int, default=6,
+                        help="Bits out of 64 that may differ between similar photos (default: 6).")
+    parser.add_argument("--export-manifest", metavar="MANIFEST",
+                        help="Hash every file and write a size-sorted manifest of the tree instead of "
+                             "looking for duplicates.")
+    parser.add_argument("--manifest", metavar="MANIFEST",
+                        help="Find files that already exist in a manifest of another tree, without "
+                             "reading that tree.")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="Keep scanned files in compact arrays for scans of tens of millions of files.")
+    parser.add_argument("--sample-large", action="store_true",
+                        help="Fingerprint very large files with sparse samples before full hashing.")
+    parser.add_argument("--scan-workers", type=int, default=1,
+                        help="Directories listed in parallel; more helps on network shares (default: 1).")
+    parser.add_argument("--progress", choices=["auto", "text", "json", "none"], default="auto",
+                        help="Progress on stderr: a status line, JSON lines, or nothing "
+                             "(default: a status line when stderr is a terminal).")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="Write final throughput statistics, including the CPU/IO split per stage, to a JSON file.")
+    args = parser.parse_args()
+    if (args.similar_images or args.similar_videos) and args.action != "move":
+        parser.error("--similar-images and --similar-videos find files that are not identical; "
+                     "only --action move is allowed")
+    if args.manifest and args.action != "move":
+        parser.error("--manifest matches files on another drive; only --action move is allowed")
+
+    directory_to_search = args.directory or select_folder()
     if not directory_to_search:
         print("No folder selected. Exiting.")
         exit()
+    # The index and manifests store absolute paths so they do not depend on the working directory
+    directory_to_search = os.path.abspath(directory_to_search)
+    device_limits = device_limits_from_paths(dict(args.device_limit))
 
-    processed_file_path = "processed_files.json"
-    processed_files = load_processed_files(processed_file_path)
+    # Digests of previously scanned files are reused while their size and mtime are unchanged
+    with HashIndex("hash_index.db") as index:
+        entries = iter_files(directory_to_search, args.scan_workers)
+        if args.export_manifest:
+            from manifest import export_manifest
+            count = export_manifest(entries, directory_to_search, args.export_manifest,
+                                    index, args.digest, args.block_size, args.partial_block_size,
+                                    device_limits, args.concurrency)
+            print(f"Wrote {count} files to {args.export_manifest}.")
+            exit()
+        elif args.manifest:
+            from manifest import match_manifest
+            duplicates_list = match_manifest(entries, args.manifest, index,
+                                             args.block_size, device_limits, args.concurrency)
+        elif args.similar_images:
+            from perceptual import find_similar_images
+            duplicates_list = find_similar_images(entries, index, args.image_hash, args.max_distance,
+                                                  directory=directory_to_search)
+        elif args.similar_videos:
+            from video_fingerprint import find_similar_videos
+            duplicates_list = find_similar_videos(entries, index, directory=directory_to_search)
+        else:
+            from progress import ScanProgress
+            progress_mode = {"auto": "text" if sys.stderr.isatty() else None, "none": None}.get(
+                args.progress, args.progress)
+            progress = ScanProgress(progress_mode, partial_block_size=args.partial_block_size)
 
-    # Find and move the duplicates (excluding first occurrences)
-    duplicates_list = find_identical_videos(directory_to_search, processed_files)
+            # Find and move the duplicates (excluding first occurrences)
+            scan_stats = {}
+            with progress:
+                duplicates_list = find_identical_videos(
+                    directory_to_search, index,
+                    sample_large=args.sample_large,
+                    algorithm=args.digest,
+                    block_size=args.block_size,
+                    partial_block_size=args.partial_block_size,
+                    device_limits=device_limits,
+                    default_concurrency=args.concurrency,
+                    verify=args.verify,
+                    low_memory=args.low_memory,
+                    progress=progress,
+                    scan_workers=args.scan_workers,
+                    scan_stats=scan_stats,
+                )
+            if args.stats:
+                progress.write_stats(args.stats)
 
-    if duplicates_list:
+    if duplicates_list and args.action != "move":
+        reclaimed = link_duplicates(duplicates_list, args.action, scan_stats)
+        print(f"{len(duplicates_list)} sets of identical video files were replaced with {args.action}s, "
+              f"reclaiming {reclaimed / 1024 ** 2:.1f} MB.")
+    elif duplicates_list:
         duplicates_folder = os.path.join(directory_to_search, "duplicates")
         move_to_duplicates_folder(duplicates_list, duplicates_folder)
 
-        # Update the set of processed files
-        processed_files.update(set(file_path for _, file_path in duplicates_list))
-        save_processed_files(processed_files, processed_file_path)
-
         print(f"{len(duplicates_list)} sets of identical video files were moved to the duplicates folder.")
     else:
         print("No identical video files found in the directory and its subdirectories.")
\ No newline at end of file
@@ -0,0 +1,279 @@
+import os
+import sqlite3
+
+"""
+Persistent digest cache for findDuplicateFiles.py.
+
+Every file the duplicate finder hashes is recorded in a SQLite database together
+with its device, inode, size and modification time. On the next run a file whose
+size and mtime_ns are unchanged reuses its stored partial/sample/full digests, so
+re-scanning an unchanged tree only costs the directory walk. New or modified files
+are hashed as usual and their digests written back.
+
+Digests are only comparable when they were produced the same way, so the index
+remembers a profile string (digest algorithm and partial block size). Opening it
+with a different profile discards the stored digests but keeps the file rows.
+
+Files that were renamed or moved on the same filesystem are found again through
+their (device, inode) pair, so a reorganised library does not need re-hashing.
+"""
+
+DIGEST_KINDS = ("partial", "sample", "full")
+COMMIT_INTERVAL = 1000  # Number of writes between commits, so a crash loses little work
+
+
+class HashIndex:
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path     TEXT PRIMARY KEY,
+                device   INTEGER NOT NULL,
+                inode    INTEGER NOT NULL,
+                size     INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                partial  BLOB,
+                sample   BLOB,
+                full     BLOB
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS files_inode ON files (device, inode)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size, path)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                path      TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                size      INTEGER NOT NULL,
+                mtime_ns  INTEGER NOT NULL,
+                hash      BLOB NOT NULL,
+                width     INTEGER NOT NULL,
+                height    INTEGER NOT NULL,
+                PRIMARY KEY (path, algorithm)
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS video_fingerprints (
+                path     TEXT PRIMARY KEY,
+                size     INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                interval REAL NOT NULL,
+                hashes   BLOB NOT NULL
+            )
+            """
+        )
+        self.pending_writes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def set_profile(self, profile):
+        """
+        Declares how digests are computed, discarding stored digests made differently.
+
+        Args:
+            profile (str): Description of the digest settings, e.g. "blake2b:4096".
+        """
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'profile'").fetchone()
+        if row is not None and row[0] == profile:
+            return
+        if row is not None:
+            print(f"Hash settings changed ({row[0]} -> {profile}); cached digests will be recomputed.")
+        self.connection.execute("UPDATE files SET partial = NULL, sample = NULL, full = NULL")
+        self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('profile', ?)", (profile,))
+        self.commit()
+
+    def lookup(self, path, stat_result):
+        """
+        Returns the cached digests of a file if its size and mtime are unchanged.
+
+        Args:
+            path (str): Path to the file.
+            stat_result (os.stat_result): Current stat of the file.
+
+        Returns:
+            dict: Mapping of digest kind to digest for every digest on record.
+        """
+        columns = ", ".join(DIGEST_KINDS)
+        row = self.connection.execute(
+            f"SELECT size, mtime_ns, {columns} FROM files WHERE path = ?", (path,)
+        ).fetchone()
+
+        if row is None:
+            # The file may have been renamed or moved within the same filesystem
+            moved = self.connection.execute(
+                f"SELECT path, size, mtime_ns, {columns} FROM files WHERE device = ? AND inode = ?",
+                (stat_result.st_dev, stat_result.st_ino),
+            ).fetchone()
+            if moved is None or (moved[1], moved[2]) != (stat_result.st_size, stat_result.st_mtime_ns):
+                return {}
+            if os.path.lexists(moved[0]):
+                # Another hard link to the same file: both paths keep a row
+                self.connection.execute(
+                    f"""
+                    INSERT INTO files (path, device, inode, size, mtime_ns, {columns})
+                    SELECT ?, device, inode, size, mtime_ns, {columns} FROM files WHERE path = ?
+                    """,
+                    (path, moved[0]),
+                )
+            else:
+                # Renamed: the row follows the file, so prune() does not drop it
+                self.connection.execute("UPDATE files SET path = ? WHERE path = ?", (path, moved[0]))
+            self.pending_writes += 1
+            row = moved[1:]
+        elif (row[0], row[1]) != (stat_result.st_size, stat_result.st_mtime_ns):
+            # Modified since it was last hashed; its digests are stale
+            self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            return {}
+
+        return {kind: digest for kind, digest in zip(DIGEST_KINDS, row[2:]) if digest is not None}
+
+    def store(self, path, stat_result, kind, digest):
+        """
+        Records one digest of a file, creating its row if needed.
+
+        Args:
+            path (str): Path to the file.
+            stat_result (os.stat_result): Stat of the file the digest was computed from.
+            kind (str): One of DIGEST_KINDS.
+            digest (bytes): The digest to store.
+        """
+        if kind not in DIGEST_KINDS:
+            raise ValueError(f"Unknown digest kind: {kind}")
+
+        # The other digests of the row only stay if they were computed from the same size and mtime
+        unchanged = "files.size = excluded.size AND files.mtime_ns = excluded.mtime_ns"
+        others = "".join(f",\n                {other} = CASE WHEN {unchanged} THEN files.{other} END"
+                         for other in DIGEST_KINDS if other != kind)
+        self.connection.execute(
+            f"""
+            INSERT INTO files (path, device, inode, size, mtime_ns, {kind})
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (path) DO UPDATE SET
+                device = excluded.device,
+                inode = excluded.inode,
+                size = excluded.size,
+                mtime_ns = excluded.mtime_ns,
+                {kind} = excluded.{kind}{others}
+            """,
+            (path, stat_result.st_dev, stat_result.st_ino,
+             stat_result.st_size, stat_result.st_mtime_ns, digest),
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_INTERVAL:
+            self.commit()
+
+    def lookup_image_hash(self, path, stat_result, algorithm):
+        """
+        Returns the cached perceptual hash of an image if its size and mtime are unchanged.
+
+        Returns:
+            tuple: (hash, width, height), or None on a miss.
+        """
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, hash, width, height FROM image_hashes WHERE path = ? AND algorithm = ?",
+            (path, algorithm),
+        ).fetchone()
+        if row is None or (row[0], row[1]) != (stat_result.st_size, stat_result.st_mtime_ns):
+            return None
+        return int.from_bytes(row[2], "big"), row[3], row[4]
+
+    def store_image_hash(self, path, stat_result, algorithm, value, width, height):
+        """
+        Records the 64-bit perceptual hash and dimensions of an image.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO image_hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, algorithm, stat_result.st_size, stat_result.st_mtime_ns,
+             value.to_bytes(8, "big"), width, height),
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_INTERVAL:
+            self.commit()
+
+    def lookup_video_fingerprint(self, path, stat_result):
+        """
+        Returns the cached fingerprint of a video if its size and mtime are unchanged.
+
+        Returns:
+            tuple: (duration, interval, packed frame hashes), or None on a miss.
+        """
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, duration, interval, hashes FROM video_fingerprints WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or (row[0], row[1]) != (stat_result.st_size, stat_result.st_mtime_ns):
+            return None
+        return row[2], row[3], row[4]
+
+    def store_video_fingerprint(self, path, stat_result, duration, interval, hashes):
+        """
+        Records the fingerprint of a video: its duration, sampling interval and
+        packed big-endian 64-bit frame hashes.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO video_fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+            (path, stat_result.st_size, stat_result.st_mtime_ns, duration, interval, hashes),
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_INTERVAL:
+            self.commit()
+
+    def prune(self, directory, seen_paths):
+        """
+        Removes entries below `directory` for files that no longer exist.
+
+        Args:
+            directory (str): Root directory that was scanned.
+            seen_paths (iterable): Every path found by the scan. They are collected in a
+                temporary SQLite table rather than a Python set to keep memory flat.
+        """
+        prefix = os.path.join(directory, "")
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)")
+        self.connection.execute("DELETE FROM seen")
+        self.connection.executemany("INSERT OR IGNORE INTO seen VALUES (?)", ((path,) for path in seen_paths))
+        for table in ("files", "image_hashes", "video_fingerprints"):
+            self.connection.execute(
+                f"""
+                DELETE FROM {table}
+                WHERE substr(path, 1, ?) = ? AND path NOT IN (SELECT path FROM seen)
+                """,
+                (len(prefix), prefix),
+            )
+        self.connection.execute("DELETE FROM seen")
+        self.commit()
+
+    def iter_sorted(self, directory):
+        """
+        Yields (size, mtime_ns, partial, full, path) for every fully hashed file below
+        `directory`, ordered by size and then path. SQLite sorts on disk, so memory
+        use does not grow with the number of files.
+        """
+        prefix = os.path.join(directory, "")
+        yield from self.connection.execute(
+            """
+            SELECT size, mtime_ns, partial, full, path FROM files
+            WHERE substr(path, 1, ?) = ? AND partial IS NOT NULL AND full IS NOT NULL
+            ORDER BY size, path
+            """,
+            (len(prefix), prefix),
+        )
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        self.commit()
+        self.connection.close()
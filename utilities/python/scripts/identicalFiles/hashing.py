@@ -0,0 +1,240 @@
+import os
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+"""
+Digest functions and the parallel hashing scheduler used by findDuplicateFiles.py.
+
+Digests are pluggable: "sha256" and "blake2b" are always available, and "xxh3" /
+"xxh64" are registered when the optional `xxhash` package is installed.
+
+Hashing runs on one thread pool per storage device. hashlib and xxhash release the
+GIL while hashing large buffers, so threads are enough to keep several disks busy,
+and the per-device pool size caps how many reads hit the same disk at once: use 1-2
+for spinning disks so they are not thrashed by seeks, and 8+ for SSDs and NVMe.
+"""
+
+DIGESTS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+
+try:
+    import xxhash
+    DIGESTS["xxh3"] = xxhash.xxh3_128
+    DIGESTS["xxh64"] = xxhash.xxh64
+except ImportError:
+    pass
+
+DEFAULT_ALGORITHM = "xxh3" if "xxh3" in DIGESTS else "blake2b"
+BLOCK_SIZE = 1024 * 1024              # Read size used when hashing whole files
+PARTIAL_BLOCK_SIZE = 4096             # Bytes hashed from each end of a file in the partial stage
+SAMPLE_COUNT = 16                     # Number of evenly spaced blocks read by the sample stage
+DEFAULT_DEVICE_CONCURRENCY = 4        # Concurrent reads per device unless overridden
+
+
+def new_digest(algorithm):
+    """Returns a fresh hash object for `algorithm`."""
+    try:
+        return DIGESTS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Unknown digest '{algorithm}'. Choose one of: {', '.join(DIGESTS)}") from None
+
+
+def digest_profile(algorithm, partial_block_size):
+    """Describes the settings that determine digest values, e.g. "blake2b:4096:16"."""
+    return f"{algorithm}:{partial_block_size}:{SAMPLE_COUNT}"
+
+
+def parse_profile(profile):
+    """Returns the (algorithm, partial_block_size) of a profile made by digest_profile."""
+    algorithm, partial_block_size, _ = profile.split(":")
+    return algorithm, int(partial_block_size)
+
+
+def hash_partial(file_path, file_size, block_size=PARTIAL_BLOCK_SIZE, algorithm=DEFAULT_ALGORITHM):
+    """
+    Hashes the first and last `block_size` bytes of a file.
+
+    Args:
+        file_path (str): Path to the file.
+        file_size (int): Size of the file in bytes.
+        block_size (int): Number of bytes to read from each end.
+        algorithm (str): Name of the digest in DIGESTS.
+
+    Returns:
+        bytes: Digest of the head and tail of the file.
+    """
+    digest = new_digest(algorithm)
+    with open(file_path, "rb") as file:
+        digest.update(file.read(block_size))
+        if file_size > 2 * block_size:
+            file.seek(file_size - block_size)
+            digest.update(file.read(block_size))
+        elif file_size > block_size:
+            digest.update(file.read())
+    return digest.digest()
+
+
+def hash_samples(file_path, file_size, samples=SAMPLE_COUNT, block_size=PARTIAL_BLOCK_SIZE,
+                 algorithm=DEFAULT_ALGORITHM):
+    """
+    Hashes `samples` evenly spaced blocks of a file, a cheap fingerprint for huge videos
+    whose head and tail (container headers, trailing index) are often identical.
+
+    Args:
+        file_path (str): Path to the file.
+        file_size (int): Size of the file in bytes.
+        samples (int): Number of blocks to read.
+        block_size (int): Size of each block.
+        algorithm (str): Name of the digest in DIGESTS.
+
+    Returns:
+        bytes: Digest of the sampled blocks.
+    """
+    digest = new_digest(algorithm)
+    stride = max(file_size // samples, block_size)
+    with open(file_path, "rb") as file:
+        for offset in range(0, file_size, stride):
+            file.seek(offset)
+            digest.update(file.read(block_size))
+    return digest.digest()
+
+
+def hash_full(file_path, block_size=BLOCK_SIZE, algorithm=DEFAULT_ALGORITHM):
+    """
+    Hashes the complete contents of a file.
+
+    Args:
+        file_path (str): Path to the file.
+        block_size (int): Read size in bytes.
+        algorithm (str): Name of the digest in DIGESTS.
+
+    Returns:
+        bytes: Digest of the file.
+    """
+    digest = new_digest(algorithm)
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(file_path, "rb", buffering=0) as file:
+        while True:
+            count = file.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.digest()
+
+
+def device_limits_from_paths(path_limits):
+    """
+    Converts a {mount path: concurrency} mapping into a {st_dev: concurrency} mapping.
+    """
+    return {os.stat(path).st_dev: limit for path, limit in (path_limits or {}).items()}
+
+
+class HashScheduler:
+    """
+    Runs digest functions on per-device thread pools and caches results in an
+    optional HashIndex. Index reads and writes only happen on the calling thread,
+    because a sqlite3 connection must not be shared between threads.
+
+    An optional progress.ScanProgress is told about every digest that is queued,
+    computed or answered from the index.
+    """
+
+    def __init__(self, index=None, device_limits=None, default_limit=DEFAULT_DEVICE_CONCURRENCY, progress=None):
+        self.index = index
+        self.progress = progress
+        self.device_limits = device_limits or {}
+        self.default_limit = default_limit
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def pool_for(self, device):
+        with self.lock:
+            if device not in self.pools:
+                self.pools[device] = ThreadPoolExecutor(
+                    max_workers=self.device_limits.get(device, self.default_limit),
+                    thread_name_prefix=f"hash-dev{device}",
+                )
+            return self.pools[device]
+
+    def submit(self, entry, kind, digest_func):
+        """
+        Starts computing one digest of a (path, os.stat_result) entry.
+
+        Returns:
+            tuple: (Future, bool) where the bool is True if the digest came from the index.
+        """
+        path, stat_result = entry
+        if self.index is not None:
+            cached = self.index.lookup(path, stat_result).get(kind)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                if self.progress is not None:
+                    self.progress.cached(kind)
+                return future, True
+        if self.progress is not None:
+            digest_func = self.progress.track(kind, stat_result.st_size, digest_func)
+        return self.pool_for(stat_result.st_dev).submit(digest_func, path), False
+
+    def resolve(self, entry, kind, pending):
+        """
+        Waits for a digest started by `submit` and records it in the index.
+
+        Returns:
+            bytes: The digest, or None if the file could not be read.
+        """
+        future, cached = pending
+        try:
+            digest = future.result()
+        except OSError as e:
+            print(f"Warning: Unable to read {entry[0]}: {e}")
+            return None
+        if self.index is not None and not cached:
+            self.index.store(entry[0], entry[1], kind, digest)
+        return digest
+
+    def split(self, groups, kind, digest_func):
+        """
+        Hashes every entry of every group in parallel and splits each group into
+        sub-groups that share the same digest.
+
+        Args:
+            groups (list): Lists of (path, os.stat_result) entries.
+            kind (str): Digest kind, used as the index column.
+            digest_func (callable): Called as digest_func(path, size) on a worker thread.
+
+        Returns:
+            list: Sub-groups with at least two members, in the order they were first seen.
+        """
+        submitted = [
+            [(entry, self.submit(entry, kind, lambda path, size=entry[1].st_size: digest_func(path, size)))
+             for entry in group]
+            for group in groups
+        ]
+        return [sub_group for group in submitted for sub_group in self.collect(group, kind)]
+
+    def collect(self, pending_group, kind):
+        """
+        Resolves a list of (entry, pending) pairs and groups the entries by digest.
+        """
+        by_digest = {}
+        for entry, pending in pending_group:
+            digest = self.resolve(entry, kind, pending)
+            if digest is not None:
+                by_digest.setdefault(digest, []).append(entry)
+        return [group for group in by_digest.values() if len(group) > 1]
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+        self.pools.clear()
@@ -0,0 +1,267 @@
+import gzip
+import itertools
+import json
+import sys
+from collections import namedtuple
+from hashing import (BLOCK_SIZE, DEFAULT_ALGORITHM, DEFAULT_DEVICE_CONCURRENCY, PARTIAL_BLOCK_SIZE,
+                     HashScheduler, digest_profile, hash_full, hash_partial, parse_profile)
+
+"""
+Hash manifests for duplicate detection across drives.
+
+A manifest is a gzip-compressed text file describing one scanned tree. The first
+line is a header that records the digest settings. Every following line holds one
+file, with tab-separated fields:
+
+    size    mtime_ns    partial digest (hex)    full digest (hex)    path (JSON string)
+
+Lines are sorted by size and then path. Because of that, two manifests, or a
+manifest and a live tree, can be matched with a streaming merge join that only
+holds one size at a time in memory. A manifest is never re-read from disk once
+written; the drive it describes can stay offline.
+
+Usage:
+    python findDuplicateFiles.py /mnt/backup --export-manifest backup.tsv.gz
+    python findDuplicateFiles.py /photos --manifest backup.tsv.gz   # move files already on the backup
+    python manifest.py backup.tsv.gz laptop.tsv.gz                 # list files present in both
+"""
+
+ManifestEntry = namedtuple("ManifestEntry", "size mtime_ns partial full path")
+
+MANIFEST_HEADER = "#duckWorks-manifest"
+MANIFEST_VERSION = 1
+HASH_CHUNK = 1024  # Files hashed per batch while exporting, to bound pending futures
+
+
+class ManifestReader:
+    """
+    Streams the entries of a manifest in file order.
+
+    Attributes:
+        profile (str): Digest settings the manifest was written with, see hashing.digest_profile.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.file = gzip.open(manifest_path, "rt", encoding="utf-8", newline="\n")
+        header = self.file.readline().rstrip("\n").split("\t")
+        fields = dict(field.split("=", 1) for field in header[1:])
+        if header[0] != MANIFEST_HEADER or int(fields.get("version", 0)) != MANIFEST_VERSION:
+            self.file.close()
+            raise ValueError(f"{manifest_path} is not a version {MANIFEST_VERSION} manifest")
+        self.profile = fields["profile"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        previous = (-1, "")
+        for line in self.file:
+            size, mtime_ns, partial, full, path = line.rstrip("\n").split("\t", 4)
+            entry = ManifestEntry(int(size), int(mtime_ns), bytes.fromhex(partial), bytes.fromhex(full),
+                                  json.loads(path))
+            if (entry.size, entry.path) < previous:
+                raise ValueError(f"{self.manifest_path} is not sorted by size near {entry.path}")
+            previous = (entry.size, entry.path)
+            yield entry
+
+    def close(self):
+        self.file.close()
+
+
+def write_manifest(manifest_path, rows, profile):
+    """
+    Writes a manifest.
+
+    Args:
+        manifest_path (str): Output path; gzip-compressed.
+        rows (iterable): (size, mtime_ns, partial, full, path) tuples sorted by size, then path.
+        profile (str): Digest settings used for the digests.
+
+    Returns:
+        int: Number of entries written.
+    """
+    count = 0
+    with gzip.open(manifest_path, "wt", encoding="utf-8", newline="\n") as file:
+        file.write(f"{MANIFEST_HEADER}\tversion={MANIFEST_VERSION}\tprofile={profile}\n")
+        for size, mtime_ns, partial, full, path in rows:
+            file.write(f"{size}\t{mtime_ns}\t{partial.hex()}\t{full.hex()}\t{json.dumps(path)}\n")
+            count += 1
+    return count
+
+
+def size_runs(entries):
+    """Yields (size, list of entries) for each run of equal sizes in a size-sorted stream."""
+    for size, run in itertools.groupby(entries, key=lambda entry: entry.size):
+        yield size, list(run)
+
+
+def merge_join(entries_a, entries_b):
+    """
+    Merge-joins two size-sorted entry streams.
+
+    Yields:
+        tuple: (run_a, run_b) lists of entries for every size present in both streams.
+    """
+    runs_a, runs_b = size_runs(entries_a), size_runs(entries_b)
+    run_a, run_b = next(runs_a, None), next(runs_b, None)
+    while run_a is not None and run_b is not None:
+        if run_a[0] < run_b[0]:
+            run_a = next(runs_a, None)
+        elif run_b[0] < run_a[0]:
+            run_b = next(runs_b, None)
+        else:
+            yield run_a[1], run_b[1]
+            run_a, run_b = next(runs_a, None), next(runs_b, None)
+
+
+def compare_manifests(manifest_path_a, manifest_path_b):
+    """
+    Finds files present in both manifests without touching either tree.
+
+    Yields:
+        tuple: (entry_a, entry_b) for every pair of identical files.
+    """
+    with ManifestReader(manifest_path_a) as reader_a, ManifestReader(manifest_path_b) as reader_b:
+        if reader_a.profile != reader_b.profile:
+            raise ValueError(f"Manifests were made with different digest settings "
+                             f"({reader_a.profile} vs {reader_b.profile})")
+        for run_a, run_b in merge_join(reader_a, reader_b):
+            by_digest = {}
+            for entry in run_a:
+                by_digest.setdefault((entry.partial, entry.full), []).append(entry)
+            for entry_b in run_b:
+                for entry_a in by_digest.get((entry_b.partial, entry_b.full), []):
+                    yield entry_a, entry_b
+
+
+def export_manifest(entries, directory, manifest_path, index, algorithm=DEFAULT_ALGORITHM,
+                    block_size=BLOCK_SIZE, partial_block_size=PARTIAL_BLOCK_SIZE,
+                    device_limits=None, default_concurrency=DEFAULT_DEVICE_CONCURRENCY):
+    """
+    Hashes every file of a tree and writes its manifest. Digests go through the
+    index, so files hashed by earlier scans or exports are not read again, and the
+    sorted output is streamed from the index rather than sorted in memory.
+
+    Args:
+        entries (iterable): (path, os.stat_result) entries of the tree.
+        directory (str): Root of the tree; the index is pruned and queried below it.
+        manifest_path (str): Output path.
+        index (HashIndex): Digest cache, required.
+
+    Returns:
+        int: Number of files in the manifest.
+    """
+    profile = digest_profile(algorithm, partial_block_size)
+    index.set_profile(profile)
+    seen_paths = set()
+
+    with HashScheduler(index, device_limits, default_concurrency) as scheduler:
+        entries = iter(entries)
+        while chunk := list(itertools.islice(entries, HASH_CHUNK)):
+            pending = []
+            for entry in chunk:
+                seen_paths.add(entry[0])
+                size = entry[1].st_size
+                pending.append((
+                    entry,
+                    scheduler.submit(entry, "partial",
+                                     lambda path, size=size: hash_partial(path, size, partial_block_size, algorithm)),
+                    scheduler.submit(entry, "full", lambda path: hash_full(path, block_size, algorithm)),
+                ))
+            for entry, partial, full in pending:
+                scheduler.resolve(entry, "partial", partial)
+                scheduler.resolve(entry, "full", full)
+
+    index.prune(directory, seen_paths)
+    return write_manifest(manifest_path, index.iter_sorted(directory), profile)
+
+
+def match_manifest(entries, manifest_path, index=None, block_size=BLOCK_SIZE, device_limits=None,
+                   default_concurrency=DEFAULT_DEVICE_CONCURRENCY):
+    """
+    Finds files of a live tree that already exist in a manifest. The manifest is
+    streamed once, and only tree files whose size appears in it are hashed: first
+    their head and tail, then in full if the partial digest matches. Hashing uses
+    the digest settings recorded in the manifest.
+
+    Args:
+        entries (iterable): (path, os.stat_result) entries of the tree.
+        manifest_path (str): Manifest of the other tree.
+        index (HashIndex): Optional digest cache for the live tree.
+
+    The manifest may come from the scanned tree itself or from one that overlaps
+    it. A file is never matched with its own manifest entry, and a file that is
+    kept as the original of a group is never moved as a duplicate of another one.
+
+    Returns:
+        list: Groups whose first path comes from the manifest and whose other paths
+        are the identical files in the tree.
+    """
+    buckets = {}
+    for entry in entries:
+        buckets.setdefault(entry[1].st_size, []).append(entry)
+
+    # Only the manifest entries whose size occurs in the tree are kept in memory
+    wanted = {}
+    with ManifestReader(manifest_path) as reader:
+        profile = reader.profile
+        for size, run in size_runs(reader):
+            if size in buckets:
+                digests = wanted.setdefault(size, {})
+                for entry in run:
+                    digests.setdefault((entry.partial, entry.full), []).append(entry.path)
+
+    algorithm, partial_block_size = parse_profile(profile)
+    if index is not None:
+        index.set_profile(profile)
+
+    def partial_digest(path, size):
+        return hash_partial(path, size, partial_block_size, algorithm)
+
+    def full_digest(path, size):
+        return hash_full(path, block_size, algorithm)
+
+    groups = {}
+    duplicates = set()
+    with HashScheduler(index, device_limits, default_concurrency) as scheduler:
+        candidates = [buckets[size] for size in wanted]
+        partials = {}
+        for group in candidates:
+            for entry in group:
+                partials[entry[0]] = scheduler.submit(entry, "partial",
+                                                      lambda path, size=entry[1].st_size: partial_digest(path, size))
+
+        survivors = []
+        for group in candidates:
+            known = {partial for partial, _ in wanted[group[0][1].st_size]}
+            for entry in group:
+                partials[entry[0]] = scheduler.resolve(entry, "partial", partials[entry[0]])
+                if partials[entry[0]] in known:
+                    survivors.append(entry)
+
+        fulls = [(entry, scheduler.submit(entry, "full", lambda path, size=entry[1].st_size: full_digest(path, size)))
+                 for entry in survivors]
+        for entry, pending in fulls:
+            full = scheduler.resolve(entry, "full", pending)
+            if entry[0] in groups:
+                # Already kept as the original of another file
+                continue
+            original_path = next((path for path in wanted[entry[1].st_size].get((partials[entry[0]], full), [])
+                                  if path != entry[0] and path not in duplicates), None)
+            if original_path is not None:
+                groups.setdefault(original_path, [original_path]).append(entry[0])
+                duplicates.add(entry[0])
+
+    return list(groups.values())
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python manifest.py <manifest_a> <manifest_b>")
+    else:
+        for entry_a, entry_b in compare_manifests(sys.argv[1], sys.argv[2]):
+            print(f"{entry_a.path}\t{entry_b.path}")
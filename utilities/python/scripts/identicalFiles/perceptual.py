@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from bktree import BKTree, leader_groups
+
+"""
+Perceptual near-duplicate detection for photos.
+
+Re-saved, resized or re-compressed copies of a photo never match byte for byte,
+but they look the same. This module reduces every image to a 64-bit perceptual
+hash and groups images whose hashes differ in at most a few bits.
+
+- Images are decoded with Pillow's JPEG draft mode, which lets libjpeg decode at
+  1/2, 1/4 or 1/8 scale, so a 24 MP photo costs a fraction of a full decode.
+- Thumbnails are decoded on a thread pool (Pillow releases the GIL while decoding)
+  and hashed in batches with NumPy.
+- "dhash" compares neighbouring pixels of a 9x8 thumbnail. "phash" keeps the signs
+  of the lowest 8x8 DCT coefficients of a 32x32 thumbnail relative to their median;
+  it is more robust to brightness and contrast changes.
+- Hashes are inserted into a BK-tree, a metric tree over Hamming distance, so
+  finding all neighbours within k bits visits a small part of the tree instead of
+  comparing every pair of images.
+- Groups are built around the image that is kept, and every other member is within
+  k bits of it; similarity is not chained from image to image.
+- Hashes are stored in the HashIndex, so later runs only decode new or changed images.
+
+Requires numpy and Pillow.
+"""
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+HASH_ALGORITHMS = ("dhash", "phash")
+DEFAULT_MAX_DISTANCE = 6  # Bits out of 64 that may differ between near-duplicates
+BATCH_SIZE = 256          # Thumbnails hashed per NumPy batch
+DRAFT_SIZE = (128, 128)   # Smallest size JPEG draft decoding may scale down to
+PHASH_SIZE = 32
+
+
+def dct_matrix(n):
+    """Returns the orthonormal DCT-II matrix of size n x n."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+DCT_32 = dct_matrix(PHASH_SIZE)
+
+
+def thumbnail_size(algorithm):
+    return (9, 8) if algorithm == "dhash" else (PHASH_SIZE, PHASH_SIZE)
+
+
+def load_thumbnail(file_path, size):
+    """
+    Decodes an image into a small greyscale array.
+
+    Args:
+        file_path (str): Path to the image.
+        size (tuple): (width, height) of the thumbnail.
+
+    Returns:
+        tuple: (numpy.ndarray of shape (height, width), (original width, original height))
+    """
+    with Image.open(file_path) as image:
+        dimensions = image.size
+        image.draft("L", DRAFT_SIZE)
+        thumbnail = image.convert("L").resize(size, Image.LANCZOS)
+        return np.asarray(thumbnail, dtype=np.float32), dimensions
+
+
+def pack_bits(bits):
+    """Packs an (N, 64) boolean array into a list of N Python ints."""
+    packed = np.packbits(bits.reshape(len(bits), 64), axis=1)
+    return [int(value) for value in packed.view(">u8").ravel()]
+
+
+def dhash_batch(pixels):
+    """Difference hashes of an (N, 8, 9) array of thumbnails."""
+    return pack_bits(pixels[:, :, 1:] > pixels[:, :, :-1])
+
+
+def phash_batch(pixels):
+    """DCT hashes of an (N, 32, 32) array of thumbnails."""
+    coefficients = DCT_32 @ pixels @ DCT_32.T
+    low = coefficients[:, :8, :8].reshape(len(pixels), 64)
+    # Skip the DC term, which only encodes average brightness
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return pack_bits(low > median)
+
+
+def hash_images(file_paths, algorithm="phash", workers=None):
+    """
+    Computes perceptual hashes for a list of images.
+
+    Args:
+        file_paths (list): Paths to the images.
+        algorithm (str): "dhash" or "phash".
+        workers (int): Decoder threads. Defaults to the number of CPUs.
+
+    Returns:
+        dict: Mapping of path to (hash, width, height). Unreadable images are left out.
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unknown image hash '{algorithm}'. Choose one of: {', '.join(HASH_ALGORITHMS)}")
+    hash_batch = dhash_batch if algorithm == "dhash" else phash_batch
+    size = thumbnail_size(algorithm)
+
+    def load(file_path):
+        try:
+            return file_path, load_thumbnail(file_path, size)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            print(f"Warning: Unable to decode {file_path}: {e}")
+            return file_path, None
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for start in range(0, len(file_paths), BATCH_SIZE):
+            loaded = [(path, thumbnail) for path, thumbnail
+                      in executor.map(load, file_paths[start:start + BATCH_SIZE]) if thumbnail is not None]
+            if not loaded:
+                continue
+            pixels = np.stack([pixels for _, (pixels, _) in loaded])
+            for (path, (_, (width, height))), value in zip(loaded, hash_batch(pixels)):
+                results[path] = (value, width, height)
+    return results
+
+
+def find_similar_images(entries, index=None, algorithm="phash", max_distance=DEFAULT_MAX_DISTANCE,
+                        workers=None, directory=None):
+    """
+    Groups visually similar images.
+
+    Args:
+        entries (iterable): (path, os.stat_result) entries; non-images are ignored.
+        index (HashIndex): Optional cache of perceptual hashes.
+        algorithm (str): "dhash" or "phash".
+        max_distance (int): Maximum number of differing hash bits between each image
+            of a group and the kept one.
+        workers (int): Decoder threads.
+        directory (str): Root the entries were scanned from. Index entries below it
+            for files that were not seen are removed.
+
+    Returns:
+        list: Groups of similar image paths. The first path of each group is the
+        one to keep: the largest resolution, then the largest file.
+    """
+    images = {}
+    seen_inodes = set()
+    seen_paths = []
+    for path, stat_result in entries:
+        seen_paths.append(path)
+        inode = (stat_result.st_dev, stat_result.st_ino)
+        if path.lower().endswith(IMAGE_EXTENSIONS) and inode not in seen_inodes:
+            seen_inodes.add(inode)
+            images[path] = stat_result
+
+    hashes = {}
+    if index is not None:
+        for path, stat_result in images.items():
+            cached = index.lookup_image_hash(path, stat_result, algorithm)
+            if cached is not None:
+                hashes[path] = cached
+
+    computed = hash_images([path for path in images if path not in hashes], algorithm, workers)
+    if index is not None:
+        for path, (value, width, height) in computed.items():
+            index.store_image_hash(path, images[path], algorithm, value, width, height)
+        index.commit()
+        if directory is not None:
+            index.prune(directory, seen_paths)
+    hashes.update(computed)
+
+    def keep_score(path):
+        _, width, height = hashes[path]
+        return width * height, images[path].st_size
+
+    tree = BKTree()
+    for path, (value, _, _) in hashes.items():
+        tree.add(value, path)
+
+    def neighbours(path):
+        return [item for _, item in tree.search(hashes[path][0], max_distance)]
+
+    # The best image of each group leads it, and every member is within max_distance of it
+    return leader_groups(sorted(hashes, key=keep_score, reverse=True), neighbours)
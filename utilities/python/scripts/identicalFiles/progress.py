@@ -0,0 +1,213 @@
+import sys
+import json
+import time
+import threading
+from hashing import PARTIAL_BLOCK_SIZE, SAMPLE_COUNT
+
+"""
+Progress reporting and throughput statistics for long duplicate scans.
+
+A ScanProgress is shared by the walker loop and the hashing pools. It counts the
+files walked and, for every stage (partial, sample, full, bytes), the files queued,
+finished and answered from the hash index, the bytes read and the time spent in the
+digest functions. A reporter thread prints a status line every few seconds, either
+as text or as one JSON object per line.
+
+Each hashing task measures both wall time and thread CPU time. A stage whose
+workers spend most of their wall time on the CPU is CPU-bound (a faster digest
+helps, more concurrency only helps up to the core count). A stage with a low
+CPU/wall ratio is waiting on the disk, and the per-device concurrency
+(--concurrency, --device-limit) is the knob to turn.
+
+Usage:
+    python findDuplicateFiles.py /photos --progress text
+    python findDuplicateFiles.py /photos --progress json 2> progress.jsonl
+    python findDuplicateFiles.py /photos --stats stats.json
+"""
+
+STAGES = ("partial", "sample", "full", "bytes")
+REPORT_INTERVAL = 2.0  # Seconds between status lines
+CPU_BOUND_RATIO = 0.7  # CPU/wall ratio above which a stage is reported as CPU-bound
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class StageStats:
+    def __init__(self):
+        self.queued = 0
+        self.done = 0
+        self.cached = 0
+        self.bytes_queued = 0
+        self.bytes_done = 0
+        self.busy_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def as_dict(self):
+        stats = dict(vars(self))
+        stats["busy_seconds"] = round(self.busy_seconds, 3)
+        stats["cpu_seconds"] = round(self.cpu_seconds, 3)
+        if self.busy_seconds:
+            stats["cpu_ratio"] = round(self.cpu_seconds / self.busy_seconds, 3)
+            stats["bound"] = "cpu" if stats["cpu_ratio"] >= CPU_BOUND_RATIO else "io"
+        return stats
+
+
+class ScanProgress:
+    """
+    Thread-safe counters for one scan, with an optional reporter thread.
+
+    Args:
+        mode (str): "text" for a status line, "json" for JSON lines, or None for no
+            periodic output (the counters are still kept for the final report).
+        interval (float): Seconds between reports.
+        stream: File the reports are written to. Defaults to stderr.
+        partial_block_size (int): Bytes read from each end of a file in the partial
+            stage, used to count the bytes each stage reads.
+    """
+
+    def __init__(self, mode=None, interval=REPORT_INTERVAL, stream=None, partial_block_size=PARTIAL_BLOCK_SIZE):
+        if mode not in (None, "text", "json"):
+            raise ValueError(f"Unknown progress mode '{mode}'. Choose 'text' or 'json'.")
+        self.mode = mode
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.partial_block_size = partial_block_size
+        self.lock = threading.Lock()
+        self.stages = {stage: StageStats() for stage in STAGES}
+        self.files_walked = 0
+        self.bytes_walked = 0
+        self.walk_done = False
+        self.start_time = None
+        self.end_time = None
+        self.last_sample = None
+        self.stop_event = threading.Event()
+        self.reporter = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.last_sample = (self.start_time, 0)
+        if self.mode is not None:
+            self.reporter = threading.Thread(target=self.report_loop, name="scan-progress", daemon=True)
+            self.reporter.start()
+
+    def stop(self):
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+        self.stop_event.set()
+        if self.reporter is not None:
+            self.reporter.join()
+            self.reporter = None
+            self.report(final=True)
+
+    def walked(self, stat_result):
+        with self.lock:
+            self.files_walked += 1
+            self.bytes_walked += stat_result.st_size
+
+    def finish_walk(self):
+        with self.lock:
+            self.walk_done = True
+
+    def read_size(self, stage, size):
+        """Returns the number of bytes `stage` reads from a file of `size` bytes."""
+        if stage == "partial":
+            return min(size, 2 * self.partial_block_size)
+        if stage == "sample":
+            return min(size, SAMPLE_COUNT * self.partial_block_size)
+        return size
+
+    def cached(self, stage):
+        with self.lock:
+            self.stages[stage].cached += 1
+
+    def track(self, stage, size, func, files=1):
+        """
+        Registers a task of `stage` that reads a `size` byte file (or `files` files of
+        `size` bytes for the "bytes" stage) and returns `func` wrapped so its time
+        and CPU use are recorded when it runs.
+        """
+        read_bytes = self.read_size(stage, size) * files
+        with self.lock:
+            stats = self.stages[stage]
+            stats.queued += files
+            stats.bytes_queued += read_bytes
+
+        def tracked(*args):
+            start, cpu_start = time.perf_counter(), time.thread_time()
+            try:
+                return func(*args)
+            finally:
+                busy, cpu = time.perf_counter() - start, time.thread_time() - cpu_start
+                with self.lock:
+                    stats.done += files
+                    stats.bytes_done += read_bytes
+                    stats.busy_seconds += busy
+                    stats.cpu_seconds += cpu
+        return tracked
+
+    def snapshot(self):
+        """Returns the current counters, throughput and ETA as a dict."""
+        now = self.end_time or time.perf_counter()
+        with self.lock:
+            stages = {stage: stats.as_dict() for stage, stats in self.stages.items() if stats.queued or stats.cached}
+            files_walked, bytes_walked, walk_done = self.files_walked, self.bytes_walked, self.walk_done
+
+        bytes_done = sum(stats["bytes_done"] for stats in stages.values())
+        bytes_left = sum(stats["bytes_queued"] - stats["bytes_done"] for stats in stages.values())
+        elapsed = now - self.start_time
+        last_time, last_bytes = self.last_sample
+        current_rate = (bytes_done - last_bytes) / (now - last_time) if now > last_time else 0.0
+        if self.end_time is None:
+            self.last_sample = (now, bytes_done)
+        average_rate = bytes_done / elapsed if elapsed else 0.0
+
+        # Later stages are only known once earlier ones finish, so the ETA covers queued work only
+        rate = current_rate or average_rate
+        eta = bytes_left / rate if walk_done and rate else None
+        return {
+            "elapsed": round(elapsed, 3),
+            "files_walked": files_walked,
+            "bytes_walked": bytes_walked,
+            "walk_done": walk_done,
+            "bytes_hashed": bytes_done,
+            "current_mb_per_second": round(current_rate / 1024 ** 2, 2),
+            "average_mb_per_second": round(average_rate / 1024 ** 2, 2),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "stages": stages,
+        }
+
+    def report(self, final=False):
+        snapshot = self.snapshot()
+        if self.mode == "json":
+            snapshot["final"] = final
+            self.stream.write(json.dumps(snapshot) + "\n")
+        else:
+            stages = "  ".join(f"{stage} {stats['done']:,}/{stats['queued']:,}"
+                               + (f" (+{stats['cached']:,} cached)" if stats["cached"] else "")
+                               for stage, stats in snapshot["stages"].items())
+            eta = ("done" if final else format_duration(snapshot["eta_seconds"])
+                   if snapshot["eta_seconds"] is not None else "--")
+            line = (f"walked {snapshot['files_walked']:,} files ({snapshot['bytes_walked'] / 1024 ** 3:.1f} GB)"
+                    f"  {stages}  {snapshot['current_mb_per_second']:.1f} MB/s  ETA {eta}")
+            end = "\n" if final or not self.stream.isatty() else ""
+            self.stream.write(f"\r{line}\033[K{end}" if self.stream.isatty() else line + end)
+        self.stream.flush()
+
+    def report_loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.report()
+
+    def write_stats(self, stats_path):
+        """Writes the final counters and per-stage CPU/IO split to a JSON file."""
+        with open(stats_path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
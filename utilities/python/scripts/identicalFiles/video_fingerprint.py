@@ -0,0 +1,240 @@
+import os
+import sys
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from bktree import BKTree, leader_groups
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from media_probe import ProbeError, probe
+
+"""
+Near-duplicate detection for videos.
+
+Re-encoded, trimmed or rotated copies of a clip (for example the `_compressed_` and
+`_rotated_` outputs of rotateVideo.py) share no bytes with the original. Instead,
+each video is reduced to a fingerprint: a sequence of 64-bit average hashes of
+8x8 greyscale frames sampled at a fixed time interval.
+
+- Frames come from a single ffmpeg call per file that decodes keyframes only
+  (`-skip_frame nokey`), scales them to 8x8 grey and writes raw bytes to a pipe.
+  No temporary files are written.
+- The sampling interval is the smallest power of two (in seconds) that keeps a
+  video under MAX_FRAMES samples. Because intervals are powers of two, two
+  fingerprints can always be compared on a common time grid.
+- Two videos match when, at the best time offset, most overlapping samples are
+  within FRAME_DISTANCE bits of each other. Searching over offsets finds trimmed
+  copies, and comparing against the four 90 degree rotations of each frame finds
+  rotated copies.
+- Candidate pairs are found through a BK-tree of all frame hashes, so only videos
+  that share some frames are aligned in full.
+- Fingerprints are extracted in parallel and stored in the HashIndex, so each
+  video is decoded only once.
+
+Requires numpy and ffmpeg/ffprobe on the PATH.
+"""
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".mkv", ".mts", ".m2ts", ".avi", ".wmv", ".webm", ".3gp")
+MAX_FRAMES = 64          # Upper bound on samples per video
+FRAME_DISTANCE = 6       # Bits out of 64 that may differ between matching frames
+MIN_OVERLAP = 4          # Samples two videos must overlap by to be compared, or all samples of a shorter one
+MATCH_RATIO = 0.8        # Fraction of overlapping samples that must match
+MIN_SHARED_FRAMES = 2    # Distinct frames two videos must share to become a candidate pair, so clips
+                         # need at least this many informative samples (seconds) to match anything
+
+
+def probe_duration(file_path):
+    """Returns the duration of a video in seconds, or None if it cannot be read. See media_probe."""
+    try:
+        return probe(file_path).duration
+    except (OSError, ProbeError, ValueError):
+        return None
+
+
+def sample_interval(duration):
+    """Returns the power-of-two sampling interval in seconds for a video of `duration` seconds."""
+    interval = 1
+    while duration / interval > MAX_FRAMES:
+        interval *= 2
+    return interval
+
+
+def extract_frames(file_path, interval):
+    """
+    Decodes 8x8 greyscale frames every `interval` seconds through one ffmpeg pipe.
+
+    Returns:
+        numpy.ndarray: Array of shape (frames, 8, 8) with dtype uint8.
+    """
+    command = [
+        "ffmpeg", "-v", "error", "-skip_frame", "nokey", "-i", file_path,
+        "-an", "-sn", "-dn",
+        "-vf", f"fps=1/{interval},scale=8:8:flags=area,format=gray",
+        "-frames:v", str(MAX_FRAMES),
+        "-f", "rawvideo", "-",
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    data = np.frombuffer(result.stdout, dtype=np.uint8)
+    return data[:len(data) // 64 * 64].reshape(-1, 8, 8)
+
+
+def average_hashes(frames):
+    """Returns the (frames, 64) boolean average-hash bits of an array of 8x8 frames."""
+    flat = frames.reshape(len(frames), 64).astype(np.float32)
+    return flat > flat.mean(axis=1, keepdims=True)
+
+
+def fingerprint_video(file_path):
+    """
+    Computes the fingerprint of one video.
+
+    Returns:
+        tuple: (duration, interval, numpy.ndarray of uint64 frame hashes), or None
+        if the file could not be decoded.
+    """
+    duration = probe_duration(file_path)
+    if not duration:
+        print(f"Warning: Unable to read the duration of {file_path}")
+        return None
+    interval = sample_interval(duration)
+    try:
+        frames = extract_frames(file_path, interval)
+    except subprocess.CalledProcessError as e:
+        print(f"Warning: Unable to decode {file_path}: {e.stderr.decode(errors='replace').strip()}")
+        return None
+    hashes = np.packbits(average_hashes(frames), axis=1).view(">u8").ravel().astype(np.uint64)
+    return duration, interval, hashes
+
+
+def hash_bits(hashes):
+    """Unpacks uint64 hashes into a (frames, 8, 8) boolean array."""
+    return np.unpackbits(hashes.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1).astype(bool).reshape(-1, 8, 8)
+
+
+def is_informative(value):
+    """Uniform frames (black, white, fades) hash to almost all zero or one bits and match anything."""
+    return 4 <= int(value).bit_count() <= 60
+
+
+def align_score(first, second):
+    """
+    Returns the best fraction of matching frames over all time offsets and rotations.
+
+    Args:
+        first (tuple): (interval, hashes) of one video.
+        second (tuple): (interval, hashes) of the other.
+    """
+    (interval_1, hashes_1), (interval_2, hashes_2) = first, second
+    # Bring both sequences onto the coarser of the two time grids
+    if interval_1 < interval_2:
+        hashes_1 = hashes_1[::int(interval_2 // interval_1)]
+    elif interval_2 < interval_1:
+        hashes_2 = hashes_2[::int(interval_1 // interval_2)]
+
+    bits_1 = hash_bits(hashes_1).reshape(len(hashes_1), 64)
+    informative = np.array([is_informative(value) for value in hashes_1], dtype=bool)
+    # A clip shorter than MIN_OVERLAP samples is compared over all of its samples;
+    # rotating a hash does not change its bit count, so the counts hold for every rotation
+    min_overlap = max(MIN_SHARED_FRAMES, min(MIN_OVERLAP, int(informative.sum()),
+                                             sum(is_informative(value) for value in hashes_2)))
+    best = 0.0
+    for rotation in range(4):
+        bits_2 = np.rot90(hash_bits(hashes_2), rotation, axes=(1, 2)).reshape(len(hashes_2), 64)
+        matches = (bits_1[:, None, :] != bits_2[None, :, :]).sum(axis=2) <= FRAME_DISTANCE
+        matches &= informative[:, None]
+        for offset in range(-len(hashes_1) + 1, len(hashes_2)):
+            diagonal = np.diagonal(matches, offset=offset)
+            usable = np.diagonal(np.broadcast_to(informative[:, None], matches.shape), offset=offset)
+            if usable.sum() >= min_overlap:
+                best = max(best, diagonal.sum() / usable.sum())
+    return best
+
+
+def rotated_hashes(hashes):
+    """Returns the uint64 hashes of every frame in all four 90 degree rotations."""
+    bits = hash_bits(hashes)
+    return [np.packbits(np.rot90(bits, rotation, axes=(1, 2)).reshape(len(hashes), 64), axis=1)
+            .view(">u8").ravel().astype(np.uint64) for rotation in range(4)]
+
+
+def find_similar_videos(entries, index=None, workers=None, directory=None):
+    """
+    Groups videos that show the same footage.
+
+    Args:
+        entries (iterable): (path, os.stat_result) entries; non-videos are ignored.
+        index (HashIndex): Optional cache of fingerprints.
+        workers (int): Number of ffmpeg processes run at once. Defaults to the number of CPUs.
+        directory (str): Root the entries were scanned from. Index entries below it
+            for files that were not seen are removed.
+
+    Returns:
+        list: Groups of similar video paths. The first path of each group is the one
+        to keep: the longest video, then the largest file. Every other path matches it.
+    """
+    videos = {}
+    seen_inodes = set()
+    seen_paths = []
+    for path, stat_result in entries:
+        seen_paths.append(path)
+        inode = (stat_result.st_dev, stat_result.st_ino)
+        if path.lower().endswith(VIDEO_EXTENSIONS) and inode not in seen_inodes:
+            seen_inodes.add(inode)
+            videos[path] = stat_result
+
+    fingerprints = {}
+    if index is not None:
+        for path, stat_result in videos.items():
+            cached = index.lookup_video_fingerprint(path, stat_result)
+            if cached is not None:
+                duration, interval, data = cached
+                fingerprints[path] = duration, interval, np.frombuffer(data, dtype=">u8").astype(np.uint64)
+
+    missing = [path for path in videos if path not in fingerprints]
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        for path, fingerprint in zip(missing, executor.map(fingerprint_video, missing)):
+            if fingerprint is None:
+                continue
+            fingerprints[path] = fingerprint
+            if index is not None:
+                duration, interval, hashes = fingerprint
+                index.store_video_fingerprint(path, videos[path], duration, interval,
+                                              hashes.astype(">u8").tobytes())
+    if index is not None:
+        index.commit()
+        if directory is not None:
+            index.prune(directory, seen_paths)
+
+    # Candidate pairs share at least MIN_SHARED_FRAMES frames in some rotation
+    tree = BKTree()
+    for path, (_, _, hashes) in fingerprints.items():
+        for value in set(int(value) for value in hashes if is_informative(value)):
+            tree.add(value, path)
+
+    # Each pair is counted from its first path only, in the rotation that shares the
+    # most distinct frames; rotating one side covers every relative rotation
+    shared = {}
+    for path, (_, _, hashes) in fingerprints.items():
+        for rotation in rotated_hashes(hashes):
+            counts = {}
+            for value in set(int(value) for value in rotation if is_informative(value)):
+                for neighbour in {item for _, item in tree.search(value, FRAME_DISTANCE)}:
+                    if neighbour > path:
+                        counts[neighbour] = counts.get(neighbour, 0) + 1
+            for neighbour, count in counts.items():
+                shared[path, neighbour] = max(shared.get((path, neighbour), 0), count)
+
+    matches = {}
+    for (first, second), count in shared.items():
+        if count < MIN_SHARED_FRAMES:
+            continue
+        _, interval_1, hashes_1 = fingerprints[first]
+        _, interval_2, hashes_2 = fingerprints[second]
+        if align_score((interval_1, hashes_1), (interval_2, hashes_2)) >= MATCH_RATIO:
+            matches.setdefault(first, set()).add(second)
+            matches.setdefault(second, set()).add(first)
+
+    def keep_score(path):
+        return fingerprints[path][0], videos[path].st_size
+
+    # The video kept leads each group, and every member matches it directly
+    return leader_groups(sorted(matches, key=keep_score, reverse=True), lambda path: matches[path])
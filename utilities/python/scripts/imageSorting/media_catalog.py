@@ -0,0 +1,231 @@
+import os
+import sys
+import sqlite3
+import hashlib
+import argparse
+from datetime import datetime
+
+"""
+Persistent catalog of capture dates for media_organizer.py.
+
+Every file whose capture date MediaOrganizer works out is recorded in a SQLite
+database together with its size, modification time, media type and where the
+date came from ("exif", "quicktime", "avchd", "ffprobe", "hachoir", "mediainfo"
+or "filename"). Files without a date are recorded too, so they are not parsed again
+either. On the next run a file whose size and mtime_ns are unchanged reuses its
+stored date, and an already-catalogued library is renamed and organized without
+opening a single file.
+
+Each row also stores a partial digest of the file (its size plus the first and
+last 64 KB). A file that was renamed or moved outside the organizer is found
+again by that digest and its extension, so copying a library to a new drive
+keeps its catalog. Empty files are never matched this way.
+
+Dates are stored as ISO 8601 text, which sorts chronologically, so date-range
+queries use an index:
+
+    python media_catalog.py media_catalog.db --from 2021-06-01 --to 2021-09-01 --type video
+"""
+
+PARTIAL_BYTES = 64 * 1024  # Bytes read from each end of a file for its partial digest
+COMMIT_INTERVAL = 1000     # Number of writes between commits, so a crash loses little work
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".heic", ".tif", ".tiff")
+VIDEO_EXTENSIONS = (".mts", ".m2ts", ".mkv", ".mp4", ".mov", ".avi")
+
+
+def media_type(path):
+    """Returns "photo", "video" or "other" from a file's extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PHOTO_EXTENSIONS:
+        return "photo"
+    if extension in VIDEO_EXTENSIONS:
+        return "video"
+    return "other"
+
+
+def partial_digest(path, size):
+    """Digest of a file's size and its first and last PARTIAL_BYTES bytes."""
+    digest = hashlib.blake2b(size.to_bytes(8, "little"), digest_size=16)
+    with open(path, "rb") as file:
+        digest.update(file.read(PARTIAL_BYTES))
+        if size > PARTIAL_BYTES:
+            file.seek(max(PARTIAL_BYTES, size - PARTIAL_BYTES))
+            digest.update(file.read(PARTIAL_BYTES))
+    return digest.digest()
+
+
+class MediaCatalog:
+    """
+    Args:
+        catalog_path (str): SQLite database file.
+        track_moves (bool): Store partial digests and use them to recognise files
+            that were renamed or moved. Costs reading 128 KB of each new file.
+    """
+
+    def __init__(self, catalog_path, track_moves=True):
+        self.catalog_path = catalog_path
+        self.track_moves = track_moves
+        self.connection = sqlite3.connect(catalog_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS media (
+                path       TEXT PRIMARY KEY,
+                size       INTEGER NOT NULL,
+                mtime_ns   INTEGER NOT NULL,
+                partial    BLOB,
+                captured   TEXT,
+                source     TEXT,
+                media_type TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS media_captured ON media (captured)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS media_partial ON media (size, partial)")
+        self.pending_writes = 0
+        # Partial digests computed by lookup() misses, reused by the store() that usually follows
+        self.missed_partials = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def lookup(self, path, stat_result):
+        """
+        Returns the catalogued capture date of a file if it is unchanged.
+
+        Args:
+            path (str): Path to the file.
+            stat_result (os.stat_result): Current stat of the file.
+
+        Returns:
+            tuple: (datetime or None, source or None) on a hit, or None on a miss.
+            A hit with no date means the file was parsed before and has none.
+        """
+        path = os.path.abspath(path)
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, captured, source FROM media WHERE path = ?", (path,)
+        ).fetchone()
+        if row is not None and (row[0], row[1]) == (stat_result.st_size, stat_result.st_mtime_ns):
+            return self.decode(row[2]), row[3]
+
+        if not self.track_moves or not stat_result.st_size:
+            return None
+        # The file may have been renamed, moved or copied since it was catalogued
+        try:
+            partial = partial_digest(path, stat_result.st_size)
+        except OSError:
+            return None
+        extension = os.path.splitext(path)[1].lower()
+        rows = self.connection.execute(
+            "SELECT path, captured, source FROM media WHERE size = ? AND partial = ?",
+            (stat_result.st_size, partial),
+        )
+        row = next((row for row in rows if os.path.splitext(row[0])[1].lower() == extension), None)
+        if row is None:
+            self.missed_partials[path, stat_result.st_size, stat_result.st_mtime_ns] = partial
+            return None
+        if not os.path.exists(row[0]):
+            self.connection.execute("DELETE FROM media WHERE path = ?", (row[0],))
+        self.write(path, stat_result, partial, row[1], row[2])
+        return self.decode(row[1]), row[2]
+
+    def store(self, path, stat_result, captured, source):
+        """
+        Records the capture date of a file.
+
+        Args:
+            path (str): Path to the file.
+            stat_result (os.stat_result): Stat of the file the date was read from.
+            captured (datetime): Capture date, or None if the file has none.
+            source (str): Where the date came from, e.g. "exif" or "filename".
+        """
+        path = os.path.abspath(path)
+        partial = self.missed_partials.pop((path, stat_result.st_size, stat_result.st_mtime_ns), None)
+        if self.track_moves and partial is None:
+            try:
+                partial = partial_digest(path, stat_result.st_size)
+            except OSError:
+                pass
+        self.write(path, stat_result, partial, captured.isoformat(sep=" ") if captured else None, source)
+
+    def write(self, path, stat_result, partial, captured, source):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, stat_result.st_size, stat_result.st_mtime_ns, partial, captured, source, media_type(path)),
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_INTERVAL:
+            self.commit()
+
+    def rename(self, old_path, new_path):
+        """Follows a file that was renamed or moved by the organizer."""
+        self.connection.execute(
+            "UPDATE OR REPLACE media SET path = ? WHERE path = ?",
+            (os.path.abspath(new_path), os.path.abspath(old_path)),
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_INTERVAL:
+            self.commit()
+
+    def query(self, start=None, end=None, media_type=None, directory=None):
+        """
+        Yields (path, captured datetime, source, media type) for every dated file with
+        start <= captured < end, in capture order.
+
+        Args:
+            start (datetime): Earliest capture date, inclusive. Default: no limit.
+            end (datetime): Latest capture date, exclusive. Default: no limit.
+            media_type (str): "photo", "video" or "other". Default: all.
+            directory (str): Only files below this directory. Default: all.
+        """
+        conditions, parameters = ["captured IS NOT NULL"], []
+        if start is not None:
+            conditions.append("captured >= ?")
+            parameters.append(start.isoformat(sep=" "))
+        if end is not None:
+            conditions.append("captured < ?")
+            parameters.append(end.isoformat(sep=" "))
+        if media_type is not None:
+            conditions.append("media_type = ?")
+            parameters.append(media_type)
+        if directory is not None:
+            prefix = os.path.join(os.path.abspath(directory), "")
+            conditions.append("substr(path, 1, ?) = ?")
+            parameters.extend((len(prefix), prefix))
+        for path, captured, source, kind in self.connection.execute(
+                f"SELECT path, captured, source, media_type FROM media WHERE {' AND '.join(conditions)} "
+                f"ORDER BY captured, path", parameters):
+            yield path, self.decode(captured), source, kind
+
+    @staticmethod
+    def decode(captured):
+        return datetime.fromisoformat(captured) if captured else None
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+        self.missed_partials.clear()
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List catalogued media captured within a date range.")
+    parser.add_argument("catalog", help="Catalog database written by media_organizer.py.")
+    parser.add_argument("--from", dest="start", type=datetime.fromisoformat, help="Earliest date, e.g. 2021-06-01.")
+    parser.add_argument("--to", dest="end", type=datetime.fromisoformat, help="Date to stop before.")
+    parser.add_argument("--type", choices=["photo", "video", "other"], help="Only list this media type.")
+    parser.add_argument("--directory", help="Only list files below this directory.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.catalog):
+        sys.exit(f"{args.catalog} does not exist")
+    with MediaCatalog(args.catalog) as catalog:
+        for path, captured, source, kind in catalog.query(args.start, args.end, args.type, args.directory):
+            print(f"{captured:%Y-%m-%d %H:%M:%S}\t{kind}\t{source}\t{path}")
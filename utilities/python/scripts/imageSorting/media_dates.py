@@ -0,0 +1,232 @@
+import io
+import struct
+import contextlib
+from datetime import datetime, timedelta
+
+"""
+Minimal capture-date readers for media_organizer.py.
+
+Pillow, hachoir and MediaInfo are general-purpose parsers: to find one timestamp
+they decode whole EXIF blocks, build a tree of every container field, or (for
+MediaInfo) scan large parts of the file. These readers only look at the bytes
+that hold the date:
+
+- JPEG: walks the markers at the start of the file to the APP1/Exif segment and
+  follows IFD0 -> Exif IFD -> DateTimeOriginal (0x9003). Typically 4-64 KB read.
+- MP4/MOV/M4V/3GP: walks the atom tree by seeking from header to header, so
+  `mdat` and the sample tables are never read, down to `moov/mvhd` (or the first
+  `moov/trak/mdia/mdhd`) and its creation time. A few hundred bytes are read.
+- AVCHD (.mts/.m2ts): looks for the "MDPM" camera metadata that Sony/Panasonic
+  camcorders embed in the H.264 SEI of the first frames, and decodes its BCD
+  date and time. The stream is read in small chunks until the marker turns up,
+  which is usually within the first few hundred KB, and never past MTS_SCAN_BYTES.
+
+Each reader returns a naive datetime or None when the file has no date where it
+looks; media_organizer then falls back to the libraries. QuickTime times are
+UTC, which is what hachoir reports for the same field.
+
+The readers take a path or the first bytes of a file (header_date's `data`), so
+media_import.py can date a file from the buffer it is copying without reading it
+again. A QuickTime file whose moov atom is not within those bytes has no date
+there; the caller then reads the header from the file.
+"""
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+QUICKTIME_EXTENSIONS = (".mp4", ".mov", ".m4v", ".3gp")
+AVCHD_EXTENSIONS = (".mts", ".m2ts")
+MTS_SCAN_BYTES = 4 * 1024 * 1024  # Bytes of an AVCHD stream searched for MDPM metadata
+MTS_CHUNK_SIZE = 64 * 1024        # Read size while searching
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+EXIF_DATE_TIME_ORIGINAL = 0x9003
+EXIF_IFD_POINTER = 0x8769
+
+
+def parse_exif_date(value):
+    return datetime.strptime(value.split(b"\0", 1)[0].decode("ascii").strip(), "%Y:%m:%d %H:%M:%S")
+
+
+def read_ifd(tiff, offset, endian):
+    """Returns {tag: (type, count, value or offset bytes)} for one TIFF IFD."""
+    count, = struct.unpack_from(endian + "H", tiff, offset)
+    entries = {}
+    for position in range(offset + 2, offset + 2 + 12 * count, 12):
+        tag, kind, items = struct.unpack_from(endian + "HHI", tiff, position)
+        entries[tag] = (kind, items, tiff[position + 8:position + 12])
+    return entries
+
+
+@contextlib.contextmanager
+def opened(source):
+    """Yields a binary file for a path, or the file-like object itself."""
+    if hasattr(source, "read"):
+        yield source
+        return
+    # Unbuffered, so only the headers that are looked at are read
+    with open(source, "rb", buffering=0) as file:
+        yield file
+
+
+def jpeg_date(source):
+    """Returns the EXIF DateTimeOriginal of a JPEG (path or binary file), or None."""
+    with opened(source) as file:
+        if file.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            marker = file.read(4)
+            if len(marker) < 4 or marker[0] != 0xFF:
+                return None
+            kind, length = marker[1], struct.unpack(">H", marker[2:])[0]
+            if kind in (0xDA, 0xD9):
+                # Start of scan or end of image: there is no metadata after this
+                return None
+            if kind != 0xE1:
+                file.seek(length - 2, 1)
+                continue
+            segment = file.read(length - 2)
+            if segment[:6] == b"Exif\0\0":
+                break
+
+    tiff = segment[6:]
+    endian = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if endian is None:
+        return None
+    try:
+        ifd0 = read_ifd(tiff, struct.unpack_from(endian + "I", tiff, 4)[0], endian)
+        if EXIF_IFD_POINTER not in ifd0:
+            return None
+        exif_offset, = struct.unpack(endian + "I", ifd0[EXIF_IFD_POINTER][2])
+        kind, count, value = read_ifd(tiff, exif_offset, endian).get(EXIF_DATE_TIME_ORIGINAL, (None, 0, b""))
+        if kind != 2 or count < 19:
+            return None
+        # ASCII values longer than four bytes are stored at an offset
+        value_offset, = struct.unpack(endian + "I", value)
+        return parse_exif_date(tiff[value_offset:value_offset + count])
+    except (struct.error, ValueError):
+        return None
+
+
+def atoms(file, start, end):
+    """Yields (type, payload offset, payload size) for the atoms between `start` and `end` of a file."""
+    position = start
+    while position + 8 <= end:
+        file.seek(position)
+        header = file.read(16)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if size == 1 and len(header) == 16:
+            size, = struct.unpack_from(">Q", header, 8)
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return
+        yield kind, position + header_size, size - header_size
+        position += size
+
+
+def find_atom(file, start, end, kind):
+    """Returns (payload offset, payload size) of the first `kind` atom between `start` and `end`, or None."""
+    for atom_kind, offset, size in atoms(file, start, end):
+        if atom_kind == kind:
+            return offset, size
+    return None
+
+
+def quicktime_time(file, offset):
+    """Reads the creation time of the mvhd or mdhd atom whose payload starts at `offset`."""
+    file.seek(offset)
+    payload = file.read(12)
+    seconds, = struct.unpack_from(">Q" if payload[0] == 1 else ">I", payload, 4)
+    return QUICKTIME_EPOCH + timedelta(seconds=seconds) if seconds else None
+
+
+def quicktime_date(source):
+    """Returns the creation time from moov/mvhd (or moov/trak/mdia/mdhd) of an MP4/MOV, or None."""
+    with opened(source) as file:
+        file.seek(0, 2)
+        moov = find_atom(file, 0, file.tell(), b"moov")
+        if moov is None:
+            return None
+        moov_start, moov_end = moov[0], moov[0] + moov[1]
+        try:
+            mvhd = find_atom(file, moov_start, moov_end, b"mvhd")
+            if mvhd is not None and (date := quicktime_time(file, mvhd[0])):
+                return date
+            for kind, offset, size in atoms(file, moov_start, moov_end):
+                if kind != b"trak":
+                    continue
+                mdia = find_atom(file, offset, offset + size, b"mdia")
+                mdhd = mdia and find_atom(file, mdia[0], mdia[0] + mdia[1], b"mdhd")
+                if mdhd and (date := quicktime_time(file, mdhd[0])):
+                    return date
+        except (struct.error, IndexError, OverflowError):
+            pass
+    return None
+
+
+def bcd(value):
+    return (value >> 4) * 10 + (value & 0x0F)
+
+
+def avchd_date(source):
+    """Returns the recording time from the MDPM metadata of an AVCHD stream, or None."""
+    data = b""
+    with opened(source) as file:
+        while (start := data.find(b"MDPM")) < 0 or len(data) - start < 512:
+            chunk = file.read(MTS_CHUNK_SIZE)
+            if not chunk or len(data) >= MTS_SCAN_BYTES:
+                break
+            data += chunk
+    start = data.find(b"MDPM")
+    if start < 0:
+        return None
+    # Undo H.264 emulation prevention in the few bytes that follow the marker
+    block = data[start + 4:start + 4 + 512].replace(b"\x00\x00\x03", b"\x00\x00")
+    tags = {}
+    for position in range(1, 1 + 5 * block[0], 5):
+        if position + 5 > len(block):
+            break
+        tags[block[position]] = block[position + 1:position + 5]
+    if 0x18 not in tags or 0x19 not in tags:
+        return None
+    _, year_high, year_low, month = tags[0x18]
+    day, hour, minute, second = tags[0x19]
+    try:
+        return datetime(bcd(year_high) * 100 + bcd(year_low), bcd(month), bcd(day),
+                        bcd(hour), bcd(minute), bcd(second))
+    except ValueError:
+        return None
+
+
+def header_date(file_path, data=None):
+    """
+    Reads the capture date with the minimal reader for the file's extension.
+
+    Args:
+        file_path (str or Path): The file; its extension picks the reader.
+        data (bytes or file): The first bytes of the file, or an open binary file, to read
+            the date from instead of `file_path`.
+
+    Returns:
+        tuple: (datetime, source) or (None, None) if there is no reader for the
+        extension or the date is not where the reader looks.
+    """
+    extension = str(file_path).lower()
+    for extensions, reader, source in READERS:
+        if extension.endswith(extensions):
+            if data is not None and not hasattr(data, "read"):
+                data = io.BytesIO(data)
+            date = reader(file_path if data is None else data)
+            if date is not None:
+                return date, source
+            break
+    return None, None
+
+
+READERS = (
+    (JPEG_EXTENSIONS, jpeg_date, "exif"),
+    (QUICKTIME_EXTENSIONS, quicktime_date, "quicktime"),
+    (AVCHD_EXTENSIONS, avchd_date, "avchd"),
+)
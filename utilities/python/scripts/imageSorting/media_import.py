@@ -0,0 +1,284 @@
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+import contextlib
+from datetime import datetime
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from scanner import scan_files
+from media_catalog import MediaCatalog
+from media_dates import MTS_SCAN_BYTES, header_date
+from media_organizer import MEDIA_EXTENSIONS, MediaOrganizer, read_media_created_date
+
+"""
+Imports photos and videos from a memory card or camera into a library organized
+as YYYY/YYYY_MM, in one pass over each file.
+
+Copying a card into a folder and then running rename_files and
+organize_files_by_month reads every file, writes it, reads its header again and
+moves it twice. Here each new source file is read once, in COPY_CHUNK_SIZE blocks:
+
+- every block is fed to a BLAKE2b digest and written to a hidden temporary file
+  in the library;
+- the capture date is read from the first blocks, which are still in memory
+  (see media_dates.header_date). QuickTime files that keep their moov atom at the
+  end are dated from the copy's header, which is a few hundred bytes;
+- the copy is flushed to disk, its page cache dropped where the OS allows it, and
+  read back: its digest must match the digest of the source;
+- it is then renamed to YYYY/YYYY_MM/YYYY-MM-DD_name.ext, which is a rename within
+  the library and costs no I/O. Names follow media_organizer.py: names that start
+  with a date keep it, and yymmdd_name.ext becomes YYYY-MM-DD_name.ext, so an
+  import builds the same library as a copy followed by `media_organizer.py sort`.
+
+Files that are already in the library are skipped without writing anything: when
+the library holds files of the same size, the source is hashed first and compared
+with them (each library file is hashed once). A card of new pictures costs one
+stat per library file. Several files are copied at once (--copies), which keeps
+card readers and USB disks busy between the short waits of each file.
+
+Usage:
+    python media_import.py /media/SD_CARD /photos/library --copies 4
+"""
+
+COPY_CHUNK_SIZE = 1024 * 1024  # Bytes read and written at a time
+DEFAULT_COPIES = 2             # Files copied at the same time
+
+
+def file_digest(path):
+    digest = hashlib.blake2b()
+    with open(path, "rb") as file:
+        while chunk := file.read(COPY_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def drop_cache(file):
+    """Flushes a written file to disk and, where supported, evicts it from the page cache."""
+    file.flush()
+    os.fsync(file.fileno())
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+class LibraryIndex:
+    """
+    Digests of library files, worked out only for files whose size matches a file
+    being imported. Thread-safe; each library file is hashed at most once, and a
+    thread that needs a digest another thread is computing waits for it.
+    """
+
+    def __init__(self, library):
+        self.sizes = {}
+        for entry in scan_files(library, extensions=MEDIA_EXTENSIONS):
+            self.sizes.setdefault(entry.stat.st_size, []).append(entry.path)
+        # Path to a Future of its digest (None if the file could not be read)
+        self.digests = {}
+        self.lock = threading.Lock()
+
+    def digest(self, path):
+        with self.lock:
+            future = self.digests.get(path)
+            owner = future is None
+            if owner:
+                future = self.digests[path] = Future()
+        if owner:
+            try:
+                future.set_result(file_digest(path))
+            except OSError:
+                future.set_result(None)
+        return future.result()
+
+    def find(self, size, digest):
+        """Returns the path of a library file with this size and digest, or None."""
+        with self.lock:
+            paths = list(self.sizes.get(size, ()))
+        return next((path for path in paths if self.digest(path) == digest), None)
+
+    def has_size(self, size):
+        with self.lock:
+            return size in self.sizes
+
+    def add(self, path, size, digest):
+        future = Future()
+        future.set_result(digest)
+        with self.lock:
+            self.sizes.setdefault(size, []).append(path)
+            self.digests[path] = future
+
+
+class Importer:
+    """
+    Args:
+        library (str or Path): Root of the YYYY/YYYY_MM library.
+        catalog (media_catalog.MediaCatalog): Optional catalog to record the capture dates in.
+    """
+
+    def __init__(self, library, catalog=None):
+        self.library = Path(library)
+        self.catalog = catalog
+        self.index = LibraryIndex(self.library)
+        # Naming rules shared with media_organizer.py
+        self.organizer = MediaOrganizer(self.library)
+        # Serializes choosing target names
+        self.lock = threading.Lock()
+
+    def copy(self, source, temporary):
+        """
+        Copies `source` to `temporary`, hashing it on the way.
+
+        Returns:
+            tuple: (digest, first bytes of the file for dating it)
+        """
+        digest = hashlib.blake2b()
+        head = bytearray()
+        with open(source, "rb") as reader, open(temporary, "wb") as writer:
+            while chunk := reader.read(COPY_CHUNK_SIZE):
+                digest.update(chunk)
+                if len(head) < MTS_SCAN_BYTES:
+                    head += chunk[:MTS_SCAN_BYTES - len(head)]
+                writer.write(chunk)
+            drop_cache(writer)
+        return digest.digest(), bytes(head)
+
+    def capture_date(self, source, temporary, head):
+        """Returns (datetime, source) for the file, trying the bytes in memory first."""
+        date, found_in = header_date(source, head)
+        if date is None:
+            # The date is further into the file than the bytes kept, e.g. an MP4 with its moov atom at the end
+            with open(temporary, "rb", buffering=0) as file:
+                date, found_in = header_date(source, file)
+        if date is None:
+            try:
+                date, found_in = read_media_created_date(Path(source))
+            except Exception:
+                date, found_in = None, None
+        return date, found_in
+
+    def library_name(self, source):
+        """
+        Returns (name, date, date source) from the file name alone, as media_organizer.py
+        names it, or None if the capture date has to be read from the file.
+        """
+        name = Path(source).name
+        match = self.organizer.correct_pattern.match(name)
+        if match:
+            try:
+                return name, datetime(int(match.group(1)), int(match.group(2)), int(match.group(3))), "filename"
+            except ValueError:
+                return name, None, None
+        renamed = self.organizer.filename_rename(name)
+        if renamed:
+            new_name, filename_date = renamed
+            return new_name, filename_date, "filename" if filename_date else None
+        return None
+
+    def target(self, name):
+        """Picks a free path in the library for a file named `name`, in its YYYY/YYYY_MM folder if dated."""
+        directory = self.organizer.month_directory(self.library, name)
+        stem, extension = Path(name).stem, Path(name).suffix
+        target = directory / name
+        number = 1
+        while target.exists():
+            target = directory / f"{stem}_{number}{extension}"
+            number += 1
+        return target
+
+    def import_file(self, entry):
+        """
+        Imports one source file.
+
+        Returns:
+            tuple: (status, detail, record) where status is "imported", "skipped" or "failed",
+            and record is (library path, capture date, date source) for imported files.
+        """
+        size = entry.stat.st_size
+        temporary = self.library / f".{entry.name}.{threading.get_ident()}.part"
+        try:
+            if self.index.has_size(size):
+                # Probably a file imported before: hash it before writing anything
+                existing = self.index.find(size, file_digest(entry.path))
+                if existing is not None:
+                    return "skipped", f"already in the library as {os.path.relpath(existing, self.library)}", None
+
+            digest, head = self.copy(entry.path, temporary)
+            if file_digest(temporary) != digest:
+                return "failed", "the copy does not match the source", None
+            named = self.library_name(entry.path)
+            if named is not None:
+                name, date, found_in = named
+            else:
+                date, found_in = self.capture_date(entry.path, temporary, head)
+                name = MediaOrganizer.dated_name(Path(entry.path), date) or entry.name
+
+            with self.lock:
+                # Another copy of the same file imported by a parallel worker in this run;
+                # digests of added files are known, so this reads nothing
+                existing = self.index.find(size, digest)
+                if existing is not None:
+                    return "skipped", f"already in the library as {os.path.relpath(existing, self.library)}", None
+                target = self.target(name)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temporary, target)
+                self.index.add(str(target), size, digest)
+            return "imported", os.path.relpath(target, self.library), (target, date, found_in)
+        except OSError as e:
+            return "failed", str(e), None
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                temporary.unlink()
+
+    def run(self, source_directory, copies=DEFAULT_COPIES):
+        """
+        Imports every photo and video below `source_directory`, `copies` files at a time.
+
+        Returns:
+            dict: Number of files per status, and bytes copied.
+        """
+        entries = sorted(scan_files(source_directory, extensions=MEDIA_EXTENSIONS), key=lambda entry: entry.path)
+        self.library.mkdir(parents=True, exist_ok=True)
+        summary = {"imported": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, copies), thread_name_prefix="import") as executor:
+            for entry, (status, detail, record) in zip(entries, executor.map(self.import_file, entries)):
+                summary[status] += 1
+                if status == "imported":
+                    summary["bytes"] += entry.stat.st_size
+                    print(f"Imported {entry.name} to {detail}")
+                    # The catalog's SQLite connection belongs to this thread
+                    if self.catalog is not None:
+                        target, date, found_in = record
+                        self.catalog.store(target, target.stat(), date, found_in)
+                elif status == "skipped":
+                    print(f"Skipped {entry.name}: {detail}")
+                else:
+                    print(f"Failed to import {entry.name}: {detail}")
+        if self.catalog is not None:
+            self.catalog.commit()
+        elapsed = time.perf_counter() - start
+        print(f"Imported {summary['imported']}, skipped {summary['skipped']}, failed {summary['failed']}: "
+              f"{summary['bytes'] / 1e6:.1f} MB in {elapsed:.1f} s "
+              f"({summary['bytes'] / 1e6 / max(elapsed, 1e-9):.1f} MB/s)")
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy photos and videos into a YYYY/YYYY_MM library, verified.")
+    parser.add_argument("source", help="Memory card or folder to import from.")
+    parser.add_argument("library", help="Library to import into.")
+    parser.add_argument("--copies", type=int, default=DEFAULT_COPIES,
+                        help=f"Files copied at the same time (default: {DEFAULT_COPIES}).")
+    parser.add_argument("--catalog", default="media_catalog.db",
+                        help="Catalog to record capture dates in (default: media_catalog.db).")
+    parser.add_argument("--no-catalog", action="store_true", help="Do not record capture dates.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source):
+        parser.error(f"{args.source} is not a directory")
+    with contextlib.ExitStack() as stack:
+        catalog = None if args.no_catalog else stack.enter_context(MediaCatalog(args.catalog))
+        summary = Importer(args.library, catalog).run(args.source, args.copies)
+    sys.exit(1 if summary["failed"] else 0)
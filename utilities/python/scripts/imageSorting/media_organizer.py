@@ -1,16 +1,17 @@
 import os
-import shutil
+import sys
+import argparse
+import contextlib
 from pathlib import Path
-import tkinter as tk
-from tkinter import filedialog
 import re
 from datetime import datetime
-from PIL import Image
-from PIL.ExifTags import TAGS
-from hachoir.parser import createParser
-from hachoir.metadata import extractMetadata
-from pymediainfo import MediaInfo
-import time
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from scanner import scan_files
+from media_catalog import MediaCatalog
+from media_dates import header_date
+from media_probe import ProbeError, probe
+from media_plan import JOURNAL_NAME, Plan, apply_plan, undo_folders, undo_journal
+from media_watch import SETTLE_SECONDS, watch
 
 """
 Script to organize photos and video files by year and month into subfolders.
@@ -23,18 +24,124 @@ Features:
 4. Organize the files into subfolders based on the year and month extracted from the filenames.
 5. Undo the organization by moving the files back to the main directory and removing the created subfolders.
 
+Renaming and organizing share one engine (media_plan.py): the source directory is
+scanned once, the full rename/move plan is worked out and checked for collisions,
+and then applied with os.rename. Every step is journaled, and undo replays the
+journal in reverse. Directories organized before the journal existed are undone
+the old way, by moving the files in YYYY/YYYY_MM folders back.
+
 Usage:
 - Create an instance of MediaOrganizer and call the methods as needed.
+- Or run it headless, e.g. from cron:
+    python media_organizer.py rename /photos/inbox
+    python media_organizer.py organize /photos/inbox
+    python media_organizer.py sort /photos/inbox      # rename and organize in one pass
+    python media_organizer.py undo /photos/inbox
+    python media_organizer.py watch /photos/inbox     # sort new arrivals as they come in
+
+Capture dates are read by the header-only readers in media_dates.py first.
+tkinter, Pillow, hachoir and pymediainfo are imported only by the code paths that
+use them, so they are not loaded unless a file needs the fallback.
 """
 
+METADATA_CHUNK_SIZE = 16  # Files sent to a metadata worker process at a time
+MEDIA_EXTENSIONS = (".jpg", ".jpeg", ".mts", ".mkv", ".mp4", ".mov")
+
+def read_media_created_date(file_path):
+    """
+    Reads the capture date of a photo or video from its metadata.
+
+    Returns:
+        tuple: (datetime, source) where source names the reader or library the date
+        came from, or (None, None) if the file has no date.
+
+    Raises:
+        Exception: Whatever the metadata libraries raise for unreadable files.
+    """
+    # The minimal readers in media_dates only read the few bytes holding the date;
+    # the libraries below are the fallback for files they do not understand
+    media_created_date, source = header_date(file_path)
+    if media_created_date is not None:
+        return media_created_date, source
+
+    if file_path.suffix.lower() in [".jpg", ".jpeg"]:
+        from PIL import Image
+        from PIL.ExifTags import TAGS
+        with Image.open(file_path) as image:
+            exif_data = image._getexif()
+            if exif_data is not None:
+                for tag, value in exif_data.items():
+                    decoded = TAGS.get(tag, tag)
+                    if decoded == "DateTimeOriginal":
+                        return datetime.strptime(value, '%Y:%m:%d %H:%M:%S'), "exif"
+    else:
+        # ffprobe's creation_time, from the shared probe cache, before the pure-Python parsers
+        try:
+            media_created_date = probe(file_path).creation_time
+            if media_created_date is not None:
+                return media_created_date, "ffprobe"
+        except (OSError, ProbeError, ValueError):
+            pass
+        from hachoir.parser import createParser
+        from hachoir.metadata import extractMetadata
+        from pymediainfo import MediaInfo
+        parser = createParser(str(file_path))
+        if parser:
+            try:
+                metadata = extractMetadata(parser)
+                if metadata:
+                    for data in metadata.exportPlaintext():
+                        if "Creation date" in data:
+                            date_str = data.split(": ")[-1].strip()
+                            return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S'), "hachoir"
+            finally:
+                parser.close()
+        media_info = MediaInfo.parse(file_path)
+        for track in media_info.tracks:
+            if track.track_type == "General" and track.recorded_date:
+                return datetime.strptime(track.recorded_date, '%Y-%m-%d %H:%M:%S'), "mediainfo"
+    return None, None
+
+
+def created_date_or_error(file_path):
+    """Pool task: returns (capture date or None, source or None, error message or None) for one file."""
+    try:
+        return (*read_media_created_date(file_path), None)
+    except Exception as e:
+        return None, None, str(e)
+
+
+def map_created_dates(file_paths, workers=None):
+    """
+    Reads the capture dates of many files, in order.
+
+    hachoir is pure Python and holds the GIL, so the files are spread over a process
+    pool rather than threads. With `workers` set to 1 they are read in this process.
+
+    Returns:
+        list: (capture date or None, source or None, error message or None) for each file.
+    """
+    workers = workers or os.cpu_count()
+    if workers == 1 or len(file_paths) < 2:
+        return [created_date_or_error(file_path) for file_path in file_paths]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=min(workers, len(file_paths))) as executor:
+        return list(executor.map(created_date_or_error, file_paths,
+                                 chunksize=max(1, min(METADATA_CHUNK_SIZE, len(file_paths) // workers))))
+
+
 class MediaOrganizer:
-    def __init__(self):
+    def __init__(self, source_directory=None, catalog=None):
         self.pattern = re.compile(r"(\d{2})(\d{2})(\d{2})_(.+)\.(jpg|jpeg|mts|mkv|mp4|mov)", re.IGNORECASE)
         self.correct_pattern = re.compile(r"(\d{4})-(\d{2})-(\d{2})_(.+)\.(jpg|jpeg|mts|mkv|mp4|mov)", re.IGNORECASE)
-        self.source_directory = None
+        self.source_directory = Path(source_directory) if source_directory else None
+        # Optional media_catalog.MediaCatalog of capture dates from earlier runs
+        self.catalog = catalog
 
     def select_directory(self):
         # Open a file dialog to select the directory
+        import tkinter as tk
+        from tkinter import filedialog
         root = tk.Tk()
         root.withdraw()  # Hide the root window
         selected_directory = filedialog.askdirectory(title="Select Directory Containing Files")
@@ -47,111 +154,220 @@ class MediaOrganizer:
 
     def get_media_created_date(self, file_path):
         try:
-            if file_path.suffix.lower() in [".jpg", ".jpeg"]:
-                with Image.open(file_path) as image:
-                    exif_data = image._getexif()
-                    if exif_data is not None:
-                        for tag, value in exif_data.items():
-                            decoded = TAGS.get(tag, tag)
-                            if decoded == "DateTimeOriginal":
-                                return datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
-            else:
-                parser = createParser(str(file_path))
-                if parser:
-                    try:
-                        metadata = extractMetadata(parser)
-                        if metadata:
-                            for data in metadata.exportPlaintext():
-                                if "Creation date" in data:
-                                    date_str = data.split(": ")[-1].strip()
-                                    return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                    finally:
-                        parser.close()
-                media_info = MediaInfo.parse(file_path)
-                for track in media_info.tracks:
-                    if track.track_type == "General" and track.recorded_date:
-                        return datetime.strptime(track.recorded_date, '%Y-%m-%d %H:%M:%S')
+            return read_media_created_date(file_path)[0]
         except Exception as e:
             print(f"Error extracting date from {file_path.name}: {e}")
         return None
 
-    def rename_files(self):
+    def scan(self):
+        """Returns the FileEntry of every file in the source directory, sorted by name."""
+        return sorted((entry for entry in scan_files(self.source_directory, recursive=False,
+                                                     with_stat=self.catalog is not None)
+                       if entry.name != JOURNAL_NAME),
+                      key=lambda entry: entry.name)
+
+    def plan_renames(self, workers=None, entries=None):
+        """
+        Works out the new name of every file in the source directory without renaming anything.
+        Capture dates come from the catalog when the file is unchanged, and are otherwise
+        read in parallel; see rename_files.
+
+        Args:
+            workers (int): Processes reading capture dates.
+            entries (list): Result of scan(), if the caller has already scanned the directory.
+
+        Returns:
+            list: (file path, new name or None, error message or None) tuples, sorted by file name.
+        """
+        if entries is None:
+            entries = self.scan()
+        plan = []
+        lookups = []
+        for entry in entries:
+            file = Path(entry.path)
+            # Skip files that already have the correct structure
+            if self.correct_pattern.match(file.name):
+                continue
+
+            renamed = self.filename_rename(file.name)
+            if renamed:
+                new_name, filename_date = renamed
+                plan.append((file, new_name, None))
+                # Six digits that are not a date, e.g. 240231_x.jpg, are renamed but not catalogued
+                if (filename_date is not None and self.catalog is not None
+                        and self.catalog.lookup(entry.path, entry.stat) is None):
+                    self.catalog.store(entry.path, entry.stat, filename_date, "filename")
+                continue
+
+            cached = self.catalog.lookup(entry.path, entry.stat) if self.catalog is not None else None
+            if cached is not None:
+                plan.append((file, self.dated_name(file, cached[0]), None))
+            else:
+                lookups.append((len(plan), entry))
+                plan.append((file, None, None))
+
+        results = map_created_dates([Path(entry.path) for _, entry in lookups], workers)
+        for (position, entry), (media_created_date, source, error) in zip(lookups, results):
+            file = plan[position][0]
+            plan[position] = (file, self.dated_name(file, media_created_date), error)
+            # Files that failed to parse are not catalogued, so they are retried next time
+            if self.catalog is not None and error is None:
+                self.catalog.store(entry.path, entry.stat, media_created_date, source)
+        if self.catalog is not None:
+            self.catalog.commit()
+        return plan
+
+    def filename_rename(self, name):
+        """
+        Returns (new name, date) for a file named yymmdd_rest.ext, where date is None
+        if the six digits are not a real date, or None if the name is not like that.
+        """
+        match = self.pattern.match(name)
+        if not match:
+            return None
+        year = f"20{match.group(1)}"
+        month = match.group(2)
+        day = match.group(3)
+        rest = match.group(4)
+        extension = match.group(5).lower()
+        try:
+            filename_date = datetime(int(year), int(month), int(day))
+        except ValueError:
+            filename_date = None
+        return f"{year}-{month}-{day}_{rest}.{extension}", filename_date
+
+    def month_directory(self, root, name):
+        """The YYYY/YYYY_MM folder below `root` for a file named `name`, or `root` if the name has no date."""
+        match = self.correct_pattern.match(name)
+        if match and Path(name).suffix.lower() in MEDIA_EXTENSIONS:
+            return root / match.group(1) / f"{match.group(1)}_{match.group(2)}"
+        return root
+
+    @staticmethod
+    def dated_name(file, media_created_date):
+        if media_created_date is None:
+            return None
+        return media_created_date.strftime(f"%Y-%m-%d_{file.stem}.{file.suffix.lower()[1:]}")
+
+    def plan(self, rename=True, organize=True, workers=None, entries=None):
+        """
+        Works out every rename and move from one scan of the source directory.
+
+        Args:
+            rename (bool): Put the capture date at the start of file names.
+            organize (bool): Move dated photos and videos into YYYY/YYYY_MM folders.
+                Files whose name does not start with a date stay where they are.
+            workers (int): Processes reading capture dates; see rename_files.
+            entries (list): Only plan these scanner.FileEntry instead of scanning the directory.
+
+        Returns:
+            media_plan.Plan: Operations without collisions, and the directories they need.
+        """
+        if entries is None:
+            entries = self.scan()
+        renames = {}
+        if rename:
+            renames = {file: (new_name, error) for file, new_name, error in self.plan_renames(workers, entries)}
+
+        plan = Plan()
+        for entry in entries:
+            file = Path(entry.path)
+            new_name, error = renames.get(file, (None, None))
+            if error:
+                plan.errors.append((file, error))
+            name = new_name or file.name
+            directory = self.month_directory(self.source_directory, name) if organize else self.source_directory
+            plan.add(file, directory / name)
+        return plan.resolve()
+
+    def apply(self, plan, dry_run=False):
+        """Applies a plan made by plan(), printing what was done. Renames are listed one by one."""
+        for file, error in plan.errors:
+            print(f"Error extracting date from {file.name}: {error}")
+        for file, target, reason in plan.collisions:
+            print(f"Skipped {file.name}: {target.relative_to(self.source_directory)} {reason}")
+        if dry_run:
+            for directory in plan.directories:
+                print(f"Would create {directory.relative_to(self.source_directory)}")
+            for file, target in plan.operations:
+                print(f"Would move {file.name} to {target.relative_to(self.source_directory)}")
+            return
+
+        applied, failures = apply_plan(plan, self.source_directory, self.catalog)
+        for file, target in applied:
+            if file.name != target.name:
+                print(f"Renamed {file.name} to {target.name}")
+        for file, error in failures:
+            print(f"Failed to move {file.name}: {error}")
+        moved = sum(file.parent != target.parent for file, target in applied)
+        if moved:
+            print(f"Moved {moved} files, creating {len(plan.directories)} folders.")
+
+    def rename_files(self, workers=None, dry_run=False):
+        """
+        Renames files to start with their capture date.
+
+        Capture dates are read from file metadata on `workers` processes (default: one
+        per CPU; 1 reads them in this process). The renames are then applied in one
+        batch in file name order, so the result and the output do not depend on the
+        number of workers.
+        """
         if not self.source_directory:
             print("No directory selected.")
             return
-        
-        for file in self.source_directory.iterdir():
-            if file.is_file():
-                new_name = None
-
-                # Skip files that already have the correct structure
-                if self.correct_pattern.match(file.name):
-                    continue
-
-                match = self.pattern.match(file.name)
-                if match:
-                    year = f"20{match.group(1)}"
-                    month = match.group(2)
-                    day = match.group(3)
-                    rest = match.group(4)
-                    extension = match.group(5).lower()
-                    new_name = f"{year}-{month}-{day}_{rest}.{extension}"
-                else:
-                    media_created_date = self.get_media_created_date(file)
-                    if media_created_date:
-                        new_name = media_created_date.strftime(f"%Y-%m-%d_{file.stem}.{file.suffix.lower()[1:]}")
-
-                if new_name:
-                    new_file_path = self.source_directory / new_name
-
-                    # Retry mechanism for renaming files
-                    for attempt in range(5):
-                        try:
-                            file.rename(new_file_path)
-                            print(f"Renamed {file.name} to {new_name}")
-                            break
-                        except PermissionError:
-                            print(f"PermissionError: Retrying renaming {file.name} to {new_name} (Attempt {attempt + 1}/5)")
-                            time.sleep(1)
-                    else:
-                        print(f"Failed to rename {file.name} after 5 attempts.")
-
-    def organize_files_by_month(self):
+        self.apply(self.plan(rename=True, organize=False, workers=workers), dry_run)
+
+    def organize_files_by_month(self, dry_run=False):
         if not self.source_directory:
             print("No directory selected.")
             return
+        self.apply(self.plan(rename=False, organize=True), dry_run)
 
-        for file in self.source_directory.iterdir():
-            if file.is_file() and file.suffix.lower() in [".jpg", ".jpeg", ".mts", ".mkv", ".mp4", ".mov"]:
-                # Extract the year and month from the filename
-                year = file.stem[:4]
-                year_month = file.stem[:7].replace("-", "_")
-                # Create the year directory
-                year_directory = self.source_directory / year
-                year_directory.mkdir(exist_ok=True)
-                # Create the month directory within the year directory
-                month_directory = year_directory / year_month
-                month_directory.mkdir(exist_ok=True)
-                # Move the file to the month directory
-                shutil.move(str(file), str(month_directory / file.name))
+    def rename_and_organize_files(self, workers=None, dry_run=False):
+        """rename_files and organize_files_by_month in one pass: each file is moved once, to its final path."""
+        if not self.source_directory:
+            print("No directory selected.")
+            return
+        self.apply(self.plan(rename=True, organize=True, workers=workers), dry_run)
+
+    def watch(self, workers=1, settle=SETTLE_SECONDS):
+        """
+        Renames and organizes new photos and videos as they arrive in the source
+        directory, until interrupted. Only the new files are read; see media_watch.py.
+        """
+        if not self.source_directory:
+            print("No directory selected.")
+            return
+
+        def organize_arrivals(entries):
+            if self.catalog is None:
+                entries = [entry._replace(stat=None) for entry in entries]
+            self.apply(self.plan(rename=True, organize=True, workers=workers, entries=entries))
+
+        print(f"Watching {self.source_directory} for new files. Press Ctrl+C to stop.")
+        watch(self.source_directory, organize_arrivals, MEDIA_EXTENSIONS, settle)
 
     def undo_organize_files(self):
+        """
+        Reverts the renames and moves recorded in the journal, newest first, and removes
+        the folders the organizer created once they are empty. Folders and files that are
+        not in the journal are left alone.
+
+        Without a journal (directories organized by older versions), the files in
+        YYYY/YYYY_MM folders are moved back instead. Renames cannot be undone then.
+        """
         if not self.source_directory:
             print("No directory selected.")
             return
-        
-        for year_dir in self.source_directory.iterdir():
-            if year_dir.is_dir():
-                for month_dir in year_dir.iterdir():
-                    if month_dir.is_dir():
-                        for file in month_dir.iterdir():
-                            if file.is_file():
-                                # Move the file back to the main directory
-                                shutil.move(str(file), str(self.source_directory / file.name))
-                        # Remove the empty month directory
-                        month_dir.rmdir()
-                # Remove the empty year directory
-                year_dir.rmdir()
+
+        if (self.source_directory / JOURNAL_NAME).exists():
+            restored, skipped = undo_journal(self.source_directory, self.catalog)
+        else:
+            print("No journal found: moving the files in YYYY/YYYY_MM folders back.")
+            restored, skipped = undo_folders(self.source_directory, self.catalog)
+        for path, reason in skipped:
+            print(f"Skipped {path}: {reason}")
+        print(f"Restored {restored} files.")
 
     def select_directory_and_rename_files(self):
         self.select_directory()
@@ -163,3 +379,41 @@ class MediaOrganizer:
 # organizer.organize_files_by_month()  # To organize files
 # organizer.undo_organize_files()  # To undo the organization
 # organizer.rename_files()  # To rename files
+# organizer.rename_and_organize_files()  # To rename and organize in one pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rename and organize photos and videos by date.")
+    parser.add_argument("action", choices=["rename", "organize", "sort", "watch", "undo"],
+                        help="rename: put the date at the start of file names; organize: move files into "
+                             "YYYY/YYYY_MM folders; sort: both in one pass; watch: sort new files as they "
+                             "arrive; undo: revert the journaled renames and moves (without a journal, "
+                             "move files in YYYY/YYYY_MM folders back).")
+    parser.add_argument("directory", help="Directory containing the files.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes reading capture dates for rename (default: one per CPU).")
+    parser.add_argument("--catalog", default="media_catalog.db",
+                        help="Catalog of capture dates reused across runs (default: media_catalog.db).")
+    parser.add_argument("--no-catalog", action="store_true", help="Read every capture date from the files.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without changing anything.")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help=f"watch: seconds a new file must stay unchanged (default: {SETTLE_SECONDS}).")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+    with contextlib.ExitStack() as stack:
+        catalog = None if args.no_catalog else stack.enter_context(MediaCatalog(args.catalog))
+        organizer = MediaOrganizer(args.directory, catalog)
+        if args.action == "rename":
+            organizer.rename_files(args.workers, args.dry_run)
+        elif args.action == "organize":
+            organizer.organize_files_by_month(args.dry_run)
+        elif args.action == "sort":
+            organizer.rename_and_organize_files(args.workers, args.dry_run)
+        elif args.action == "watch":
+            try:
+                organizer.watch(args.workers or 1, args.settle)
+            except KeyboardInterrupt:
+                print("Stopped watching.")
+        else:
+            organizer.undo_organize_files()
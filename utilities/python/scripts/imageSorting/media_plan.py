@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import contextlib
+from pathlib import Path
+from collections import namedtuple
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from scanner import scan_files, subdirectories
+
+"""
+Plan/apply engine for media_organizer.py.
+
+MediaOrganizer works out every rename and move from one scan of the source
+directory, as a Plan. Nothing is touched until the whole plan is known, so
+collisions (two files that would end up with the same name, or a target that
+already exists) are reported up front and those files are left where they are.
+
+Applying a plan creates each target directory once and moves every file with a
+hard link and an unlink (a plain rename where hard links are not supported),
+which only updates metadata on the same file system and fails instead of
+replacing a file that appeared at the target since the plan was made. Only when
+the target is on another file system (a mount point below the library) does it
+fall back to shutil.move, which copies.
+
+Every directory created and every file moved is appended to a journal in the
+source directory, one JSON object per line, and flushed as it happens. Undo
+replays the journal in reverse: files go back to where they came from and the
+directories the organizer created are removed if they are empty. Nothing that
+is not in the journal is touched, so unrelated sub-directories are left alone.
+"""
+
+JOURNAL_NAME = ".media_organizer_journal.jsonl"
+RENAME_ATTEMPTS = 5  # Tries per file when another program holds it open (Windows)
+
+Operation = namedtuple("Operation", "source target")
+
+
+class Plan:
+    """
+    The renames and moves of one run, from one scan.
+
+    Attributes:
+        operations (list): Operation(source, target) Path pairs, in file name order.
+        directories (list): Target directories that do not exist yet, parents first.
+        collisions (list): (source, target, reason) for files that are left in place.
+        errors (list): (source, error message) for files whose date could not be read.
+    """
+
+    def __init__(self):
+        self.operations = []
+        self.directories = []
+        self.collisions = []
+        self.errors = []
+
+    def add(self, source, target):
+        if source != target:
+            self.operations.append(Operation(source, target))
+
+    def resolve(self):
+        """Drops colliding operations and lists the directories the rest need."""
+        claimed = {}
+        for operation in self.operations:
+            claimed.setdefault(os.path.normcase(operation.target), []).append(operation)
+
+        operations = []
+        for operation in self.operations:
+            same_target = claimed[os.path.normcase(operation.target)]
+            if len(same_target) > 1:
+                others = ", ".join(other.source.name for other in same_target if other is not operation)
+                self.collisions.append((operation.source, operation.target, f"same target as {others}"))
+            elif operation.target.exists():
+                self.collisions.append((operation.source, operation.target, "target already exists"))
+            else:
+                operations.append(operation)
+        self.operations = operations
+
+        directories = set()
+        for operation in self.operations:
+            directory = operation.target.parent
+            while not directory.exists() and directory not in directories:
+                directories.add(directory)
+                directory = directory.parent
+        self.directories = sorted(directories, key=lambda path: (len(path.parts), path))
+        return self
+
+
+def rename_no_replace(source, target):
+    """
+    Renames a file, raising FileExistsError if `target` exists. os.rename would
+    silently replace a file that appeared at `target` after the plan was made.
+    """
+    if os.name == "nt":
+        # Windows refuses to rename onto an existing file
+        os.rename(source, target)
+        return
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            raise
+        # No hard links on this file system (FAT, exFAT, some network shares)
+        if os.path.lexists(target):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(target))
+        os.rename(source, target)
+        return
+    os.unlink(source)
+
+
+def move_file(source, target):
+    """
+    Moves a file, with a rename when both paths are on the same file system. An
+    existing target is never replaced: FileExistsError is raised instead.
+
+    Retries for a few seconds on PermissionError, which Windows raises while a
+    viewer or an antivirus scanner has the file open.
+    """
+    for attempt in range(RENAME_ATTEMPTS):
+        try:
+            rename_no_replace(source, target)
+            return
+        except PermissionError:
+            if attempt == RENAME_ATTEMPTS - 1:
+                raise
+            print(f"PermissionError: Retrying moving {source.name} (Attempt {attempt + 1}/{RENAME_ATTEMPTS})")
+            time.sleep(1)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            if os.path.lexists(target):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(target))
+            shutil.move(str(source), str(target))
+            return
+
+
+class Journal:
+    """Append-only record of the directories created and files moved in a source directory."""
+
+    def __init__(self, root):
+        self.root = root
+        self.path = root / JOURNAL_NAME
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "a", encoding="utf-8")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+
+    def record(self, action, **paths):
+        # Paths are stored relative to the root, so the library can be moved with its journal
+        entry = {"action": action, **{key: os.path.relpath(path, self.root) for key, path in paths.items()}}
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+
+    def entries(self):
+        """Returns the journal entries, oldest first, with absolute paths."""
+        if not self.path.exists():
+            return []
+        entries = []
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash
+                    continue
+                entries.append({key: value if key == "action" else self.root / value for key, value in entry.items()})
+        return entries
+
+
+def apply_plan(plan, root, catalog=None):
+    """
+    Creates the plan's directories and moves its files, journaling each step.
+
+    Returns:
+        tuple: (list of the Operations applied, list of (source, error message) for moves that failed)
+    """
+    applied, failures = [], []
+    with Journal(root) as journal:
+        for directory in plan.directories:
+            directory.mkdir(exist_ok=True)
+            journal.record("mkdir", path=directory)
+        for source, target in plan.operations:
+            try:
+                move_file(source, target)
+            except OSError as e:
+                failures.append((source, str(e)))
+                continue
+            journal.record("move", source=source, target=target)
+            applied.append(Operation(source, target))
+            if catalog is not None:
+                catalog.rename(source, target)
+    if catalog is not None:
+        catalog.commit()
+    return applied, failures
+
+
+def undo_journal(root, catalog=None):
+    """
+    Reverts every move and directory in the journal of `root`, newest first.
+
+    Moves whose file is gone, or whose original path has been taken since, are
+    reported and kept in the journal so they can be retried.
+
+    Returns:
+        tuple: (files moved back, list of (path, reason) for entries that were skipped)
+    """
+    journal = Journal(root)
+    entries = journal.entries()
+    kept, skipped = [], []
+    restored = 0
+    for entry in reversed(entries):
+        if entry["action"] == "mkdir":
+            try:
+                os.rmdir(entry["path"])
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Not empty: something else was put there, so the folder stays
+                skipped.append((entry["path"], "directory not empty"))
+            continue
+        source, target = entry["source"], entry["target"]
+        if not target.exists():
+            skipped.append((target, "file is gone"))
+            kept.append(entry)
+            continue
+        if source.exists():
+            skipped.append((target, f"{source.name} already exists"))
+            kept.append(entry)
+            continue
+        try:
+            source.parent.mkdir(parents=True, exist_ok=True)
+            move_file(target, source)
+        except OSError as e:
+            skipped.append((target, str(e)))
+            kept.append(entry)
+            continue
+        restored += 1
+        if catalog is not None:
+            catalog.rename(target, source)
+    if catalog is not None:
+        catalog.commit()
+
+    if kept:
+        with open(journal.path, "w", encoding="utf-8") as file:
+            for entry in reversed(kept):
+                file.write(json.dumps({key: value if key == "action" else os.path.relpath(value, root)
+                                       for key, value in entry.items()}) + "\n")
+    elif journal.path.exists():
+        journal.path.unlink()
+    return restored, skipped
+
+
+def undo_folders(root, catalog=None):
+    """
+    Undo for directories organized before there was a journal: moves the files in
+    every YYYY/YYYY_MM folder of `root` back to `root` and removes the folders once
+    they are empty. Files whose name is taken in `root` stay where they are, as do
+    folders that are not named like the organizer's.
+
+    Returns:
+        tuple: (files moved back, list of (path, reason) for files that were skipped)
+    """
+    skipped = []
+    restored = 0
+    for year_dir in subdirectories(root):
+        if not (len(year_dir.name) == 4 and year_dir.name.isdigit()):
+            continue
+        for month_dir in subdirectories(year_dir.path):
+            if not (month_dir.name.startswith(f"{year_dir.name}_") and month_dir.name[5:].isdigit()):
+                continue
+            for entry in scan_files(month_dir.path, recursive=False, with_stat=False):
+                source, target = Path(entry.path), root / entry.name
+                if target.exists():
+                    skipped.append((source, f"{target.name} already exists"))
+                    continue
+                try:
+                    move_file(source, target)
+                except OSError as e:
+                    skipped.append((source, str(e)))
+                    continue
+                restored += 1
+                if catalog is not None:
+                    catalog.rename(source, target)
+            with contextlib.suppress(OSError):
+                os.rmdir(month_dir.path)
+        with contextlib.suppress(OSError):
+            os.rmdir(year_dir.path)
+    if catalog is not None:
+        catalog.commit()
+    return restored, skipped
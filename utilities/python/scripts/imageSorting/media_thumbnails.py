@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import subprocess
+from pathlib import Path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from scanner import scan_files
+from media_catalog import partial_digest
+
+"""
+Thumbnail cache for libraries organized by media_organizer.py.
+
+Browsing YYYY/YYYY_MM folders on a network share is slow when every client
+decodes full-size photos. This script makes small JPEG previews once, on the
+machine that holds the library:
+
+- Photos are decoded with Pillow's JPEG draft mode, which lets libjpeg scale the
+  image by 1/2, 1/4 or 1/8 while decoding, so a 24 MP photo is decoded at about
+  the thumbnail size instead of in full.
+- Videos get one frame grabbed by ffmpeg, a second into the clip, seeking before
+  opening the input so only one GOP is decoded.
+- Files are processed on a process pool; decoding is CPU-bound.
+
+Thumbnails are keyed by content (media_catalog.partial_digest of the file), not by
+path, so renaming or organizing a library keeps its previews. They are sharded
+as ab/cd/abcd....jpg so no directory grows beyond a few thousand entries. A small
+SQLite index maps path, size and mtime to the key, so an unchanged library is
+checked with one stat per file and nothing is read.
+
+A thumbnail's modification time is its last use. With --max-size, the least
+recently used thumbnails are deleted until the cache fits.
+
+Usage:
+    python media_thumbnails.py /photos/library --max-size 2000
+"""
+
+THUMBNAIL_SIZE = 320  # Longest side of a thumbnail, in pixels
+JPEG_QUALITY = 80
+CHUNK_SIZE = 32       # Files sent to a worker process at a time
+VIDEO_SEEK = 1.0      # Seconds into a video to take the frame from
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+VIDEO_EXTENSIONS = (".mts", ".m2ts", ".mkv", ".mp4", ".mov")
+
+
+def image_thumbnail(source, destination, size):
+    from PIL import Image, ImageOps
+    with Image.open(source) as image:
+        # JPEG only: decode at the smallest DCT scale that is still at least `size`
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        image.convert("RGB").save(destination, "JPEG", quality=JPEG_QUALITY)
+
+
+def video_thumbnail(source, destination, size):
+    scale = f"scale='min({size},iw)':'min({size},ih)':force_original_aspect_ratio=decrease"
+    for seek in (VIDEO_SEEK, 0):
+        # -ss before -i seeks in the container, so only the frames from the nearest keyframe are decoded
+        subprocess.run(["ffmpeg", "-v", "error", "-y", "-ss", str(seek), "-i", str(source), "-frames:v", "1",
+                        "-vf", scale, "-q:v", "4", "-f", "image2", str(destination)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=False)
+        if os.path.exists(destination) and os.path.getsize(destination):
+            return
+    raise RuntimeError("ffmpeg did not produce a frame")
+
+
+def make_thumbnail(task):
+    """Pool task: writes the thumbnail of (source, destination, size). Returns an error message or None."""
+    source, destination, size = task
+    temporary = f"{destination}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if source.lower().endswith(VIDEO_EXTENSIONS):
+            video_thumbnail(source, temporary, size)
+        else:
+            image_thumbnail(source, temporary, size)
+        os.replace(temporary, destination)
+        return None
+    except Exception as e:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        return str(e) or type(e).__name__
+
+
+class ThumbnailCache:
+    """
+    Args:
+        cache_directory (str or Path): Where thumbnails and their index are kept.
+        size (int): Longest side of the thumbnails. Each size has its own keys.
+    """
+
+    def __init__(self, cache_directory, size=THUMBNAIL_SIZE):
+        self.cache_directory = Path(cache_directory)
+        self.cache_directory.mkdir(parents=True, exist_ok=True)
+        self.size = size
+        self.connection = sqlite3.connect(self.cache_directory / "index.db")
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, key TEXT)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def key(self, path, stat_result):
+        """Content key of a file, from the index when the file is unchanged."""
+        path = os.path.abspath(path)
+        row = self.connection.execute("SELECT size, mtime_ns, key FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and (row[0], row[1]) == (stat_result.st_size, stat_result.st_mtime_ns):
+            return row[2]
+        key = f"{partial_digest(path, stat_result.st_size).hex()}_{self.size}"
+        self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                                (path, stat_result.st_size, stat_result.st_mtime_ns, key))
+        return key
+
+    def path(self, key):
+        return self.cache_directory / key[:2] / key[2:4] / f"{key}.jpg"
+
+    def get(self, path):
+        """
+        Returns the thumbnail of a file, making it if needed, or None if it cannot be made.
+        Marks the thumbnail as used.
+        """
+        thumbnail = self.path(self.key(path, os.stat(path)))
+        self.connection.commit()
+        if thumbnail.exists():
+            os.utime(thumbnail)
+            return thumbnail
+        return thumbnail if make_thumbnail((os.fspath(path), os.fspath(thumbnail), self.size)) is None else None
+
+    def update(self, library, workers=None):
+        """
+        Makes the missing thumbnails of every photo and video below `library`.
+
+        Returns:
+            tuple: (thumbnails made, thumbnails already cached, list of (path, error message))
+        """
+        extensions = IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+        if shutil.which("ffmpeg") is None:
+            print("ffmpeg not found: videos are skipped.")
+            extensions = IMAGE_EXTENSIONS
+        tasks, cached, seen = [], 0, set()
+        for entry in scan_files(library, exclude=[self.cache_directory], extensions=extensions):
+            try:
+                thumbnail = self.path(self.key(entry.path, entry.stat))
+            except OSError:
+                continue
+            if thumbnail in seen:
+                # Another copy of the same file
+                continue
+            seen.add(thumbnail)
+            if thumbnail.exists():
+                cached += 1
+            else:
+                tasks.append((entry.path, os.fspath(thumbnail), self.size))
+        self.connection.commit()
+
+        workers = workers or os.cpu_count()
+        if workers == 1 or len(tasks) < 2:
+            results = [make_thumbnail(task) for task in tasks]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+                results = list(executor.map(make_thumbnail, tasks,
+                                            chunksize=max(1, min(CHUNK_SIZE, len(tasks) // workers))))
+        errors = [(task[0], error) for task, error in zip(tasks, results) if error]
+        return len(tasks) - len(errors), cached, errors
+
+    def evict(self, max_bytes):
+        """
+        Deletes the least recently used thumbnails until the cache holds at most `max_bytes`.
+
+        Returns:
+            tuple: (thumbnails deleted, bytes freed)
+        """
+        thumbnails = sorted(scan_files(self.cache_directory, extensions=(".jpg",)), key=lambda entry: entry.stat.st_mtime)
+        total = sum(entry.stat.st_size for entry in thumbnails)
+        deleted, freed = 0, 0
+        for entry in thumbnails:
+            if total - freed <= max_bytes:
+                break
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            deleted += 1
+            freed += entry.stat.st_size
+        return deleted, freed
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make a cache of thumbnails for a photo and video library.")
+    parser.add_argument("library", help="Library to make thumbnails for.")
+    parser.add_argument("--cache", help="Cache directory (default: LIBRARY/.thumbnails).")
+    parser.add_argument("--size", type=int, default=THUMBNAIL_SIZE,
+                        help=f"Longest side of the thumbnails in pixels (default: {THUMBNAIL_SIZE}).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument("--max-size", type=float, default=None,
+                        help="Cache size limit in MB; least recently used thumbnails are deleted first.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.library):
+        parser.error(f"{args.library} is not a directory")
+    start = time.perf_counter()
+    with ThumbnailCache(args.cache or os.path.join(args.library, ".thumbnails"), args.size) as cache:
+        made, cached, errors = cache.update(args.library, args.workers)
+        for path, error in errors:
+            print(f"Failed to make a thumbnail of {path}: {error}")
+        print(f"Made {made} thumbnails, {cached} already cached, in {time.perf_counter() - start:.1f} s.")
+        if args.max_size is not None:
+            deleted, freed = cache.evict(int(args.max_size * 1024 * 1024))
+            if deleted:
+                print(f"Deleted {deleted} least recently used thumbnails ({freed / 1e6:.1f} MB).")
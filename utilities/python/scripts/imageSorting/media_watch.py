@@ -0,0 +1,184 @@
+import os
+import sys
+import stat
+import time
+import struct
+import select
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from scanner import FileEntry
+
+"""
+Watches a directory for new photos and videos, for MediaOrganizer.watch.
+
+On Linux the directory is watched with inotify (through ctypes, no extra package),
+so the process sleeps in the kernel until a file is closed after writing or moved
+into the directory, and uses no CPU while nothing arrives. Elsewhere, or if
+inotify is not available, the directory is listed every POLL_INTERVAL seconds and
+compared with the previous listing.
+
+Phones and sync tools write large videos over many seconds, so a file is only
+handed on once its size and modification time have not changed for SETTLE_SECONDS.
+Files that are still being written simply wait longer.
+"""
+
+POLL_INTERVAL = 2.0   # Seconds between listings when inotify is not available
+SETTLE_SECONDS = 3.0  # A file must be unchanged this long before it is processed
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Reports the names of files closed after writing, or moved into a directory."""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch failed for {directory}")
+        self.directory = directory
+
+    def wait(self, timeout):
+        """
+        Blocks until something happens or `timeout` seconds pass (None: forever).
+
+        Returns:
+            set: Names of the files that changed, or None if the kernel dropped
+            events and the whole directory has to be looked at again.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        names = set()
+        position = 0
+        while position < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            if mask & IN_Q_OVERFLOW:
+                return None
+            name = data[position:position + length].rstrip(b"\0")
+            position += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Reports the names of files that are new or changed since the previous listing."""
+
+    def __init__(self, directory, interval=POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.listing = self.list()
+
+    def list(self):
+        listing = {}
+        try:
+            with os.scandir(self.directory) as iterator:
+                for entry in iterator:
+                    try:
+                        if entry.is_file():
+                            stat_result = entry.stat()
+                            listing[entry.name] = (stat_result.st_size, stat_result.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return listing
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        listing = self.list()
+        names = {name for name, signature in listing.items() if self.listing.get(name) != signature}
+        self.listing = listing
+        return names
+
+    def close(self):
+        pass
+
+
+def open_watcher(directory, poll_interval=POLL_INTERVAL):
+    """Returns an InotifyWatcher where the platform has inotify, and a PollingWatcher otherwise."""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"inotify is not available ({e}), polling every {poll_interval} seconds instead.")
+    return PollingWatcher(directory, poll_interval)
+
+
+def watch(directory, on_ready, extensions=None, settle=SETTLE_SECONDS, poll_interval=POLL_INTERVAL):
+    """
+    Calls `on_ready` with the new files of `directory` once they are completely written.
+    Files that are already there when watching starts are left alone. Runs until interrupted.
+
+    Args:
+        directory (str or Path): Directory to watch. Sub-directories are not watched.
+        on_ready (callable): Called with a list of scanner.FileEntry, sorted by name.
+        extensions (tuple): Lower-case extensions of the files to report. Default: all.
+        settle (float): Seconds a file's size and modification time must stay the same.
+        poll_interval (float): Seconds between listings when inotify is not available.
+    """
+    directory = os.fspath(directory)
+    watcher = open_watcher(directory, poll_interval)
+    # name -> (size, mtime_ns, monotonic time the file last changed)
+    pending = {}
+    try:
+        while True:
+            # Sleep until the next pending file could have settled, or until an event
+            timeout = None
+            if pending:
+                timeout = max(0.0, min(changed for _, _, changed in pending.values()) + settle - time.monotonic())
+            names = watcher.wait(timeout)
+            if names is None:
+                names = set(os.listdir(directory))
+            now = time.monotonic()
+            for name in names:
+                if extensions and not name.lower().endswith(extensions):
+                    continue
+                try:
+                    stat_result = os.stat(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pending.pop(name, None)
+                    continue
+                if not stat.S_ISREG(stat_result.st_mode):
+                    continue
+                signature = (stat_result.st_size, stat_result.st_mtime_ns)
+                if pending.get(name, (None, None))[:2] != signature:
+                    pending[name] = (*signature, now)
+
+            ready = []
+            for name, (size, mtime_ns, changed) in list(pending.items()):
+                if now - changed < settle:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat_result = os.stat(path)
+                except FileNotFoundError:
+                    del pending[name]
+                    continue
+                if (stat_result.st_size, stat_result.st_mtime_ns) != (size, mtime_ns):
+                    # Written to without an event reaching us, e.g. over a network share
+                    pending[name] = (stat_result.st_size, stat_result.st_mtime_ns, now)
+                    continue
+                del pending[name]
+                ready.append(FileEntry(path, stat_result))
+            if ready:
+                on_ready(sorted(ready, key=lambda entry: entry.name))
+    finally:
+        watcher.close()
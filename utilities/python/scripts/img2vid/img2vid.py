@@ -8,7 +8,7 @@ def natural_sort_key(filename):
     """Sorts filenames naturally (e.g., test_1.png, test_2.png, test_10.png)."""
     return [int(text) if text.isdigit() else text.lower() for text in re.split(r'(\d+)', filename)]
 
-def create_video_from_images(image_folder, frame_rate):
+def create_video_from_images(image_folder, frame_rate, quiet=False):
     """
     Creates a video from a sequence of images in a given folder.
     Explicitly sorts filenames and uses a text file for FFmpeg input.
@@ -16,13 +16,17 @@ def create_video_from_images(image_folder, frame_rate):
     Args:
         image_folder (str): Path to the folder containing images.
         frame_rate (int): Frame rate of the output video.
+        quiet (bool): Only let FFmpeg print errors, never prompt, and overwrite existing output.
+
+    Returns:
+        str: Path of the video, or None if it could not be made.
 
     Example:
         python3 img2vid.py "C:/Users/marke/OneDrive/Videos/Captures/test_images" 30
     """
     if not os.path.exists(image_folder):
         print(f"Error: Folder '{image_folder}' not found.")
-        return
+        return None
 
     # Get the folder name to use as the video filename
     video_name = os.path.basename(image_folder)
@@ -37,7 +41,7 @@ def create_video_from_images(image_folder, frame_rate):
 
     if not images:
         print("Error: No valid images found.")
-        return
+        return None
 
     # Create an input text file for FFmpeg
     input_txt_path = os.path.join(image_folder, "input.txt")
@@ -47,18 +51,22 @@ def create_video_from_images(image_folder, frame_rate):
 
     # FFmpeg Configuration
     ffmpeg_bin = "ffmpeg"  # Change to full path if needed (e.g., "C:/ffmpeg/bin/ffmpeg.exe")
+    quiet_options = ["-hide_banner", "-y", "-nostdin", "-nostats", "-loglevel", "error"] if quiet else []
     input_options = ["-r", str(frame_rate), "-f", "concat", "-safe", "0", "-i", input_txt_path]
     encoding_options = ["-c:v", "libx264", "-preset", "slow", "-crf", "23", "-pix_fmt", "yuv420p"]
     output_options = ["-r", str(frame_rate), video_output]
 
     # Combine all parts into the final command
-    ffmpeg_cmd = [ffmpeg_bin] + input_options + encoding_options + output_options
+    ffmpeg_cmd = [ffmpeg_bin] + quiet_options + input_options + encoding_options + output_options
 
     # Run FFmpeg command
     print(f"Creating video '{video_output}' from images in '{image_folder}' at {frame_rate} FPS...")
-    subprocess.run(ffmpeg_cmd)
+    if subprocess.run(ffmpeg_cmd).returncode != 0:
+        print(f"Error: FFmpeg could not create '{video_output}'.")
+        return None
 
     print(f"Video saved as: {video_output}")
+    return video_output
 
 # Handle command-line arguments
 if __name__ == "__main__":
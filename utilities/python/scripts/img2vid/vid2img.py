@@ -2,19 +2,23 @@ import os
 import subprocess
 import sys
 
-def extract_all_frames(video_path):
+def extract_all_frames(video_path, quiet=False):
     """
     Extracts every frame from a video and saves them in a subfolder next to the video file.
 
     Args:
         video_path (str): Path to the video file.
+        quiet (bool): Only let FFmpeg print errors, never prompt, and overwrite existing output.
+
+    Returns:
+        str: Path of the frame folder, or None if the frames could not be extracted.
 
     Example:
         python3 vid2img.py 2.mp4
     """
     if not os.path.exists(video_path):
         print(f"Error: File '{video_path}' not found.")
-        return
+        return None
 
     # Get the directory and filename of the video
     video_dir = os.path.dirname(os.path.abspath(video_path))  # Absolute path
@@ -25,17 +29,24 @@ def extract_all_frames(video_path):
     os.makedirs(frame_folder, exist_ok=True)
 
     # Define FFmpeg command to extract every frame
+    if quiet:
+        log_options = ["-hide_banner", "-y", "-nostdin", "-nostats", "-loglevel", "error"]  # Errors only, never prompt, overwrite
+    else:
+        log_options = ["-hide_banner", "-loglevel", "info"]  # Show processing details
     ffmpeg_cmd = [
-        "ffmpeg", "-i", video_path,  # Input video
+        "ffmpeg", *log_options,
+        "-i", video_path,  # Input video
         os.path.join(frame_folder, f"{video_name}_%06d.png"),  # Output format: example_000001.png
-        "-hide_banner", "-loglevel", "info"  # Show processing details
     ]
 
     # Run FFmpeg command
     print(f"Extracting frames from '{video_path}' to '{frame_folder}'...")
-    subprocess.run(ffmpeg_cmd)
+    if subprocess.run(ffmpeg_cmd).returncode != 0:
+        print(f"Error: FFmpeg could not extract the frames of '{video_path}'.")
+        return None
 
     print(f"Extraction complete. Frames saved in: {frame_folder}")
+    return frame_folder
 
 # Handle command-line arguments
 if __name__ == "__main__":
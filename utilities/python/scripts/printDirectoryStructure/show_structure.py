@@ -1,7 +1,10 @@
 import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from scanner import walk
 
 def show_structure(start_path='.'):
-    for root, dirs, files in os.walk(start_path):
+    for root, dirs, files in walk(start_path):
         # Get relative path from start_path
         relative_root = os.path.relpath(root, start_path)
         indent_level = relative_root.count(os.sep)
@@ -9,7 +12,7 @@ def show_structure(start_path='.'):
         print(f"{indent}{os.path.basename(root)}/")
         sub_indent = '    ' * (indent_level + 1)
         for f in files:
-            print(f"{sub_indent}{f}")
+            print(f"{sub_indent}{f.name}")
 
 if __name__ == "__main__":
     # By default, . means "current directory"
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "rotateFunctions"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "img2vid"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+import rotateVideo
+import rotateVideo_filters
+import img2vid
+import vid2img
+from media_probe import ProbeError, probe
+
+"""
+Runs many FFmpeg jobs at once: rotations and compressions (rotateVideo.py), rotations
+with duplicate frames removed (rotateVideo_filters.py), image sequences to video
+(img2vid.py) and videos to frames (vid2img.py).
+
+Each of those scripts handles one file per run, so a shell loop over a folder runs
+one FFmpeg at a time. A software encode leaves cores idle between GOPs and a
+hardware encode leaves the CPU almost idle, so running several at once finishes a
+batch much sooner. Jobs are queued on one thread pool per kind of encoder, each
+with its own limit, the same way identicalFiles/hashing.py keeps one pool per disk:
+
+- cpu:    libx265 ("sw"), img2vid's libx264 and PNG frame extraction. A rotate job
+          with "segments" runs that many encoders itself, so lower --cpu-jobs
+- nvidia: hevc_nvenc sessions (consumer cards allow only a few at a time)
+- intel:  hevc_qsv sessions
+- copy:   rotations that only rewrite the display matrix (rotateVideo's "copy"
+          encoder), which are bound by disk speed. Copy jobs that turn out to need a
+          libx265 re-encode are run on the cpu pool instead
+
+Finished jobs are recorded in a state file as they complete. Running the same batch
+again after an interruption skips every job whose output is still there.
+
+Usage:
+    python batchVideo.py rotate *.mp4 --direction right --encoder sw --cpu-jobs 3
+    python batchVideo.py --jobs batch.jsonl --nvidia-jobs 2
+
+A job file has one JSON object per line, for example:
+    {"task": "rotate", "input": "a.mp4", "direction": "left", "encoder": "nvidia", "crf": 28}
+    {"task": "filters", "input": "b.mp4", "direction": "none", "encoder": "sw", "crf": 24}
+    {"task": "img2vid", "input": "frames/", "fps": 30}
+    {"task": "vid2img", "input": "c.mp4"}
+"""
+
+TASKS = ("rotate", "filters", "img2vid", "vid2img")
+ENCODERS = ("nvidia", "intel", "sw", "copy")
+DEFAULT_LIMITS = {"cpu": 2, "nvidia": 2, "intel": 2, "copy": 4}
+STATE_FILE = "batch_state.json"
+
+
+def resource(job):
+    """The encoder slot a job needs: "cpu", "nvidia", "intel" or "copy"."""
+    encoder = job.get("encoder", "nvidia")
+    if job["task"] == "rotate" and encoder == "copy":
+        # Jobs that are known to need a libx265 re-encode count against the cpu limit
+        if job.get("decimate") or not job["input"].lower().endswith(rotateVideo.DISPLAY_MATRIX_EXTENSIONS):
+            return "cpu"
+        return "copy"
+    if job["task"] in ("rotate", "filters") and encoder in ("nvidia", "intel"):
+        return encoder
+    return "cpu"
+
+
+def job_key(job):
+    return json.dumps(job, sort_keys=True)
+
+
+def run_job(job, fallback=True):
+    """
+    Runs one job with FFmpeg's output cut down to errors. Returns the output path, or None.
+    With fallback=False, a "copy" rotation that needs re-encoding returns None instead.
+    """
+    task = job["task"]
+    if task == "rotate":
+        return rotateVideo.process_video(job["input"], job.get("direction", "none"), job.get("encoder", "nvidia"),
+                                         job.get("crf", 28), job.get("decimate", False), quiet=True,
+                                         segments=job.get("segments", 1), fallback=fallback)
+    if task == "filters":
+        return rotateVideo_filters.process_video(job["input"], job.get("direction", "none"),
+                                                 job.get("encoder", "nvidia"), job.get("crf", 28),
+                                                 job.get("decimate", True), quiet=True)
+    if task == "img2vid":
+        return img2vid.create_video_from_images(job["input"], job.get("fps", 30), quiet=True)
+    return vid2img.extract_all_frames(job["input"], quiet=True)
+
+
+def input_size(path):
+    """Bytes of a job's input: the file, or every file in an image folder."""
+    if os.path.isdir(path):
+        with os.scandir(path) as iterator:
+            return sum(entry.stat().st_size for entry in iterator if entry.is_file())
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def input_duration(path):
+    """Seconds of video in a job's input, or None for image folders and unreadable files."""
+    if os.path.isdir(path):
+        return None
+    try:
+        return probe(path).duration
+    except (OSError, ProbeError, ValueError):
+        return None
+
+
+class BatchRunner:
+    """
+    Args:
+        limits (dict): Jobs run at once per resource ("cpu", "nvidia", "intel", "copy").
+        state_path (str): JSON file recording the finished jobs, for resuming.
+    """
+
+    def __init__(self, limits=None, state_path=STATE_FILE):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.state_path = state_path
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as file:
+                self.state = json.load(file)
+        self.lock = threading.Lock()
+        self.pools = {}
+
+    def save_state(self):
+        temporary = f"{self.state_path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(self.state, file, indent=1)
+        os.replace(temporary, self.state_path)
+
+    def done(self, job):
+        """True if the job finished in an earlier run and its output is still there."""
+        finished = self.state.get(job_key(job))
+        return finished is not None and os.path.exists(finished["output"])
+
+    def execute(self, job):
+        start = time.perf_counter()
+        try:
+            if resource(job) == "copy":
+                output = run_job(job, fallback=False)
+                if output is None and job.get("direction", "none") != "none":
+                    # The stream copy failed: re-encode on the cpu pool, within its limit
+                    output = self.pools["cpu"].submit(run_job, {**job, "encoder": "sw"}).result()
+            else:
+                output = run_job(job)
+        except Exception as e:
+            print(f"Error: {job['task']} {job['input']}: {e}")
+            output = None
+        result = {"output": output, "seconds": time.perf_counter() - start, "bytes": input_size(job["input"]),
+                  "duration": input_duration(job["input"])}
+        if output is not None:
+            with self.lock:
+                self.state[job_key(job)] = result
+                self.save_state()
+        return result
+
+    def run(self, jobs):
+        """
+        Runs the jobs that are not done yet, each on the pool of its resource.
+
+        Returns:
+            list: (job, result dict or None if skipped) in job order.
+        """
+        self.pools = pools = {name: ThreadPoolExecutor(max_workers=max(1, limit), thread_name_prefix=f"ffmpeg-{name}")
+                              for name, limit in self.limits.items()}
+        futures = []
+        start = time.perf_counter()
+        try:
+            for job in jobs:
+                if self.done(job):
+                    futures.append((job, None))
+                else:
+                    futures.append((job, pools[resource(job)].submit(self.execute, job)))
+            results = [(job, future and future.result()) for job, future in futures]
+        finally:
+            # On Ctrl+C the running FFmpeg processes get the interrupt too; queued jobs must not start after them
+            for pool in pools.values():
+                pool.shutdown(wait=True, cancel_futures=True)
+        print_summary(results, time.perf_counter() - start)
+        return results
+
+
+def print_summary(results, elapsed):
+    print("\nBatch summary:")
+    failed = 0
+    total_seconds = 0.0
+    for job, result in results:
+        name = os.path.basename(os.path.normpath(job["input"]))
+        if result is None:
+            print(f"  skipped  {job['task']:8} {name} (done in an earlier run)")
+        elif result["output"] is None:
+            failed += 1
+            print(f"  failed   {job['task']:8} {name} after {result['seconds']:.1f} s")
+        else:
+            total_seconds += result["seconds"]
+            speed = f"{result['bytes'] / 1e6 / max(result['seconds'], 1e-9):.1f} MB/s"
+            if result.get("duration"):
+                speed += f", {result['duration'] / max(result['seconds'], 1e-9):.1f}x realtime"
+            print(f"  done     {job['task']:8} {name}: {result['seconds']:.1f} s, {speed} -> {result['output']}")
+    print(f"{len(results)} jobs, {failed} failed, in {elapsed:.1f} s "
+          f"({total_seconds:.1f} s of job time, {total_seconds / max(elapsed, 1e-9):.1f}x parallel).")
+
+
+def load_jobs(path):
+    jobs = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                jobs.append(json.loads(line))
+    return jobs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many FFmpeg jobs at once with per-encoder limits.")
+    parser.add_argument("task", nargs="?", choices=TASKS, help="Task for every input given on the command line.")
+    parser.add_argument("inputs", nargs="*", help="Videos, or image folders for img2vid.")
+    parser.add_argument("--jobs", help="File with one JSON job per line, instead of task and inputs.")
+    parser.add_argument("--direction", default="none", choices=["right", "left", "180", "none"])
+    parser.add_argument("--encoder", default="nvidia", choices=ENCODERS)
+    parser.add_argument("--crf", type=int, default=28, help="Quality value (default: 28).")
+    parser.add_argument("--decimate", action="store_true", help="Drop duplicate frames (rotate task).")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="Encode each sw rotate job in this many parts at once (default: 1).")
+    parser.add_argument("--fps", type=int, default=30, help="Frame rate for img2vid (default: 30).")
+    for name, limit in DEFAULT_LIMITS.items():
+        parser.add_argument(f"--{name}-jobs", type=int, default=limit,
+                            help=f"{name} jobs run at once (default: {limit}).")
+    parser.add_argument("--state", default=STATE_FILE, help=f"Resume state file (default: {STATE_FILE}).")
+    args = parser.parse_args()
+
+    if args.jobs:
+        jobs = load_jobs(args.jobs)
+    elif args.task and args.inputs:
+        jobs = []
+        for path in args.inputs:
+            job = {"task": args.task, "input": os.path.abspath(path)}
+            if args.task in ("rotate", "filters"):
+                job.update(direction=args.direction, encoder=args.encoder, crf=args.crf)
+                if args.task == "rotate":
+                    job["decimate"] = args.decimate
+                    if args.segments > 1:
+                        job["segments"] = args.segments
+            elif args.task == "img2vid":
+                job["fps"] = args.fps
+            jobs.append(job)
+    else:
+        parser.error("give a task and inputs, or --jobs")
+    for job in jobs:
+        if job.get("task") not in TASKS or "input" not in job:
+            parser.error(f"invalid job: {job}")
+        if job["task"] == "filters" and job.get("encoder", "nvidia") not in ("nvidia", "intel", "sw"):
+            # Removing frames always re-encodes; only rotate has a "copy" encoder
+            parser.error(f"invalid encoder for a filters job: {job}")
+
+    runner = BatchRunner({name: getattr(args, f"{name}_jobs") for name in DEFAULT_LIMITS}, args.state)
+    results = runner.run(jobs)
+    sys.exit(1 if any(result is not None and result["output"] is None for _, result in results) else 0)
@@ -1,12 +1,184 @@
 import subprocess
+import shutil
+import tempfile
+import time
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "common"))
+from media_probe import ProbeError, probe
 
-def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=False):
+# Options for unattended runs (see batchVideo.py): overwrite leftovers of an interrupted run,
+# never prompt, errors only
+QUIET_OPTIONS = ["-hide_banner", "-y", "-nostdin", "-nostats", "-loglevel", "error"]
+
+# Containers whose muxer stores a display matrix, so a rotation can be changed without re-encoding
+DISPLAY_MATRIX_EXTENSIONS = (".mp4", ".mov", ".m4v", ".3gp")
+# Degrees counter-clockwise (the display matrix convention) for each direction
+ROTATION_DEGREES = {"right": -90, "left": 90, "180": 180}
+
+def rotate_stream_copy(input_file, direction, output_file, quiet=False):
+    """
+    Rotates a video by rewriting only its display matrix: every stream is copied, so
+    this takes as long as copying the file and the picture is untouched. Players
+    and editors that honour the display matrix (all phone, browser and desktop
+    players) show the video rotated.
+
+    Returns:
+        str: Why the rotation could not be done this way, or None if it was.
+    """
+    if os.path.splitext(output_file)[1].lower() not in DISPLAY_MATRIX_EXTENSIONS:
+        return f"{os.path.splitext(output_file)[1]} files cannot carry a rotation flag"
+    try:
+        current = probe(input_file).rotation
+    except (OSError, ProbeError, ValueError) as e:
+        return f"could not probe the input ({e})"
+    # Turn the picture further from where it is displayed now
+    rotation = (current + ROTATION_DEGREES[direction] + 180) % 360 - 180
+    base = ["ffmpeg"] + (QUIET_OPTIONS if quiet else [])
+    output_options = ["-map", "0", "-c", "copy", "-map_metadata", "0", output_file]
+    attempts = [
+        # FFmpeg 6 and later
+        base + ["-display_rotation:v:0", str(rotation), "-i", input_file] + output_options,
+        # Older FFmpeg writes the display matrix from a clockwise rotate tag
+        base + ["-i", input_file, "-metadata:s:v:0", f"rotate={-rotation % 360}"] + output_options,
+    ]
+    for command in attempts:
+        if subprocess.run(command).returncode == 0:
+            print(f"Video rotated without re-encoding. Saved as: {output_file}")
+            print(f"FFMPEG Command used: {command} ")
+            return None
+    return "ffmpeg could not write the rotation"
+
+def split_points(keyframes, duration, segments):
+    """
+    Picks up to `segments` - 1 keyframe times that cut a video into parts of about
+    equal length. Returns them in order, without duplicates or a cut at the start.
+    """
+    points = []
+    for number in range(1, segments):
+        target = duration * number / segments
+        nearest = min(keyframes, key=lambda keyframe: abs(keyframe - target))
+        if nearest > keyframes[0] and (not points or nearest > points[-1]):
+            points.append(nearest)
+    return points
+
+def encode_segments(input_file, output_file, filters, crf, segments, quiet=False, compare=False):
+    """
+    Encodes a video with libx265 in `segments` parts at once and joins them.
+
+    1. The video stream is cut at keyframes with the segment muxer and -c copy, so
+       every frame lands in exactly one part and nothing is decoded. The parts are
+       .mov so the display matrix (and with it FFmpeg's autorotation) is kept.
+    2. Each part is encoded by its own ffmpeg process with the same filters, CRF and
+       preset as a single-process encode, and an x265 thread pool of its share of
+       the CPUs. Every frame is encoded exactly once, so the result has the same
+       frames as a single-process encode; only the keyframe placement can differ.
+    3. The encoded parts are joined with the concat demuxer and -c copy, and the
+       audio and tags of the original are copied in once, in the same command.
+
+    Returns:
+        str: The output file, or None if it could not be made.
+    """
+    try:
+        info = probe(input_file, keyframes=True)
+    except (OSError, ProbeError) as e:
+        print(f"Cannot split the video ({e}); encoding it in one piece.")
+        return None
+    points = split_points(info.keyframes or [0.0], info.duration or 0, segments)
+    if not points:
+        print("Not enough keyframes to split the video; encoding it in one piece.")
+        return None
+
+    base = ["ffmpeg"] + (QUIET_OPTIONS if quiet else ["-hide_banner", "-y", "-nostdin"])
+    threads = max(1, (os.cpu_count() or 1) // (len(points) + 1))
+    work_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_file)))
+    start = time.perf_counter()
+    try:
+        subprocess.run(base + ["-i", input_file, "-map", "0:v:0", "-c", "copy", "-f", "segment",
+                               "-segment_times", ",".join(f"{point:.6f}" for point in points),
+                               "-reset_timestamps", "1", os.path.join(work_dir, "part_%04d.mov")], check=True)
+        parts = sorted(name for name in os.listdir(work_dir) if name.startswith("part_"))
+
+        def encode(part):
+            # .mov keeps the input's time base, so the joined frame timestamps are exact
+            encoded = os.path.join(work_dir, f"encoded_{part}")
+            command = base + ["-i", os.path.join(work_dir, part)]
+            if filters:
+                command.extend(["-vf", ",".join(filters)])
+            command.extend(["-c:v", "libx265", "-crf", str(crf), "-preset", "medium",
+                            "-x265-params", f"pools={threads}:log-level=error", encoded])
+            part_start = time.perf_counter()
+            subprocess.run(command, check=True)
+            return encoded, time.perf_counter() - part_start
+
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            results = list(executor.map(encode, parts))
+        encode_seconds = sum(seconds for _, seconds in results)
+
+        list_file = os.path.join(work_dir, "parts.txt")
+        with open(list_file, "w", encoding="utf-8") as file:
+            for encoded, _ in results:
+                # The concat demuxer reads shell-style quoting: ' is written as '\''
+                escaped = encoded.replace(os.sep, "/").replace("'", "'\\''")
+                file.write(f"file '{escaped}'\n")
+        # Tags such as creation_time come from the original, and one audio stream, as in a single-process encode
+        subprocess.run(base + ["-f", "concat", "-safe", "0", "-i", list_file, "-i", input_file,
+                               "-map", "0:v:0", "-map", "1:a:0?", "-map_metadata", "1", "-c", "copy", output_file],
+                       check=True)
+    except subprocess.CalledProcessError as e:
+        print("An error occurred:", e)
+        return None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    realtime = f", {info.duration / elapsed:.2f}x realtime" if info.duration else ""
+    print(f"Encoded {len(results)} segments in {elapsed:.1f} s{realtime} "
+          f"({encode_seconds:.1f} s of segment encoding, {encode_seconds / elapsed:.1f}x parallel)")
+    if compare:
+        # Time a single-process encode of the same input with the same settings
+        reference = f"{work_dir}_reference.mov"
+        command = base + ["-i", input_file, "-map", "0:v:0"] + (["-vf", ",".join(filters)] if filters else []) + \
+            ["-c:v", "libx265", "-crf", str(crf), "-preset", "medium", "-x265-params", "log-level=error", reference]
+        single_start = time.perf_counter()
+        try:
+            subprocess.run(command, check=True)
+            single = time.perf_counter() - single_start
+            print(f"Single-process encode: {single:.1f} s, speedup {single / elapsed:.2f}x")
+        except subprocess.CalledProcessError as e:
+            print("The single-process encode failed:", e)
+        finally:
+            if os.path.exists(reference):
+                os.remove(reference)
+    return output_file
+
+def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=False, quiet=False, segments=1,
+                  compare=False, fallback=True):
+    # Returns the output file, or None if it could not be made.
+    # encoder "copy" only rotates, by rewriting the display matrix with every stream copied;
+    # where that is not possible the video is re-encoded with libx265 ("sw") at `crf`,
+    # or, with fallback=False, None is returned so the caller can schedule the re-encode.
+    # segments > 1 encodes "sw" jobs in that many parts at once (see encode_segments);
+    # compare also times a single-process encode and reports the speedup
     # Get the file directory, name, and extension
     file_dir, file_name = os.path.split(input_file)
     file_root, file_ext = os.path.splitext(file_name)
     output_file = os.path.join(file_dir, f"{file_root}_compressed_{direction}{file_ext}" if direction == "none" else f"{file_root}_rotated_{direction}{file_ext}")
+
+    if encoder == "copy":
+        if direction == "none":
+            print("Nothing to do: the copy encoder only rotates. Choose 'nvidia', 'intel', or 'sw' to compress.")
+            return None
+        reason = "duplicate frame removal needs re-encoding" if decimate else \
+            rotate_stream_copy(input_file, direction, output_file, quiet)
+        if reason is None:
+            return output_file
+        if not fallback:
+            print(f"Cannot rotate without re-encoding: {reason}.")
+            return None
+        print(f"Cannot rotate without re-encoding: {reason}. Re-encoding with libx265.")
+        encoder = "sw"
     
     # Set the transpose filter if rotation is required
     transpose_filter = None
@@ -18,12 +190,20 @@ def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=Fals
         }[direction]
 
     # Base ffmpeg command
-    command = ["ffmpeg", "-i", input_file]
+    command = ["ffmpeg"] + (QUIET_OPTIONS if quiet else []) + ["-i", input_file]
 
     # Build the video filter chain
     filters = []
     if transpose_filter:
         filters.append(transpose_filter)
+
+    if encoder == "sw" and segments > 1:
+        if decimate:
+            # setpts=N/FRAME_RATE/TB would restart at zero in every segment
+            print("Duplicate frame removal cannot be split into segments; encoding in one piece.")
+        elif encode_segments(input_file, output_file, filters, crf, segments, quiet, compare):
+            print(f"Video processed successfully with {encoder} encoder at CRF {crf}. Saved as: {output_file}")
+            return output_file
     
     # Add the duplicate frame removal filter
     if decimate:
@@ -41,8 +221,8 @@ def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=Fals
     elif encoder == "sw":
         command.extend(["-c:v", "libx265", "-crf", str(crf), "-preset", "medium"])
     else:
-        print("Invalid encoder specified. Choose 'nvidia', 'intel', or 'sw'.")
-        return
+        print("Invalid encoder specified. Choose 'nvidia', 'intel', 'sw', or 'copy'.")
+        return None
 
     # Add the audio copy setting and output file
     command.extend(["-acodec", "copy", output_file])
@@ -52,19 +232,35 @@ def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=Fals
         subprocess.run(command, check=True)
         print(f"Video processed successfully with {encoder} encoder at CRF {crf}. Saved as: {output_file}")
         print(f"FFMPEG Command used: {command} ")
+        return output_file
     except subprocess.CalledProcessError as e:
         print("An error occurred:", e)
+        return None
 
 if __name__ == "__main__":
+    # --no-pause: do not wait for Enter at the end, for shell loops and scheduled runs
+    pause = "--no-pause" not in sys.argv
+    if not pause:
+        sys.argv.remove("--no-pause")
+    # --segments N: encode "sw" jobs in N parts at once; --compare: also time a single-process encode
+    segments = 1
+    if "--segments" in sys.argv:
+        position = sys.argv.index("--segments")
+        segments = int(sys.argv[position + 1])
+        del sys.argv[position:position + 2]
+    compare = "--compare" in sys.argv
+    if compare:
+        sys.argv.remove("--compare")
     if len(sys.argv) > 4:
         input_file = sys.argv[1]
         direction = sys.argv[2].lower()  # e.g., "right", "left", "180", or "none"
-        encoder = sys.argv[3].lower()    # "nvidia", "intel", or "sw"
+        encoder = sys.argv[3].lower()    # "nvidia", "intel", "sw", or "copy" (rotate only, no re-encoding)
         crf = int(sys.argv[4])           # Quality compression value
         if os.path.isfile(input_file) and direction in ["right", "left", "180", "none"]:
-            process_video(input_file, direction, encoder=encoder, crf=crf)
+            process_video(input_file, direction, encoder=encoder, crf=crf, segments=segments, compare=compare)
         else:
-            print("Please provide a valid video file, direction ('right', 'left', '180', or 'none'), encoder (nvidia, intel, or sw), and quality value (CRF).")
+            print("Please provide a valid video file, direction ('right', 'left', '180', or 'none'), encoder (nvidia, intel, sw, or copy), and quality value (CRF).")
     else:
-        print("Usage: python rotateVideo.py <input_file> <direction> <encoder> <quality>")
-    input("\nPress Enter to close...")
+        print("Usage: python rotateVideo.py <input_file> <direction> <encoder> <quality> [--segments N] [--compare] [--no-pause]")
+    if pause and sys.stdin.isatty():
+        input("\nPress Enter to close...")
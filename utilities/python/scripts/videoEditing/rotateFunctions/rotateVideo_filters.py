@@ -1,8 +1,12 @@
 import subprocess
 import sys
 import os
-import subprocess
+import json
 import re
+import tempfile
+import contextlib
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, "common"))
+from media_probe import ProbeError, probe
 
 def get_duplicate_frames(input_file, mpdecimate_options="hi=64*32:lo=64*24:frac=0.05"):
     """
@@ -68,7 +72,7 @@ def generate_trim_filter(duplicate_frames, fps):
     
 def get_fps(input_file):
     """
-    Retrieves the frames per second (fps) of the input video using FFmpeg.
+    Retrieves the frames per second (fps) of the input video from its (cached) ffprobe result.
 
     Args:
         input_file (str): Path to the video file.
@@ -76,32 +80,126 @@ def get_fps(input_file):
     Returns:
         float: Frames per second (fps) of the video.
     """
-    command = [
-        "ffmpeg", "-i", input_file, 
-        "-hide_banner"
-    ]
-    result = subprocess.run(command, stderr=subprocess.PIPE, text=True)
-    for line in result.stderr.splitlines():
-        if "fps" in line:
-            parts = line.split(", ")
-            for part in parts:
-                if "fps" in part:
-                    try:
-                        return float(part.split()[0])
-                    except ValueError:
-                        pass
-    raise RuntimeError(f"Unable to determine FPS for {input_file}")
-
-def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=True):
+    try:
+        fps = probe(input_file).fps
+    except (OSError, ProbeError) as e:
+        raise RuntimeError(f"Unable to determine FPS for {input_file}: {e}")
+    if fps is None:
+        raise RuntimeError(f"Unable to determine FPS for {input_file}")
+    return float(fps)
+
+# Options for unattended runs (see batchVideo.py): overwrite leftovers of an interrupted run,
+# never prompt, errors only
+QUIET_OPTIONS = ["-hide_banner", "-y", "-nostdin", "-nostats", "-loglevel", "error"]
+
+DEFAULT_MPDECIMATE_OPTIONS = "hi=64*32:lo=64*24:frac=0.05"
+# Runs of duplicate frames shorter than this are kept. Dropping single frames saves
+# little, and cutting the matching audio in tiny slivers would make it crackle.
+MIN_DROP_SECONDS = 0.5
+SHOWINFO_TIME = re.compile(r"\bpts_time:\s*(-?\d+(?:\.\d+)?)")
+
+
+def analyse_kept_ranges(input_file, mpdecimate_options=DEFAULT_MPDECIMATE_OPTIONS, min_drop=MIN_DROP_SECONDS):
+    """
+    Finds the parts of a video to keep, in one decode of its video stream.
+
+    mpdecimate drops duplicate frames and showinfo prints one line per frame that is
+    kept, so only the kept frames are logged (at info level, not debug) and the output
+    is read line by line as FFmpeg produces it. Consecutive kept frames are merged into
+    time ranges; a range only ends where at least `min_drop` seconds were dropped.
+    The frame rate and audio streams come from media_probe.
+
+    Returns:
+        dict: {"ranges": [[start, end], ...] in seconds, "has_audio": bool}
+    """
+    command = ["ffmpeg", "-hide_banner", "-nostdin", "-nostats", "-i", input_file,
+               "-map", "0:v:0", "-an", "-sn", "-dn",
+               "-vf", f"mpdecimate={mpdecimate_options},showinfo", "-f", "null", "-"]
+    info = probe(input_file)
+    kept = []
+    with subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True,
+                          errors="replace") as process:
+        for line in process.stderr:
+            if "pts_time:" in line:
+                match = SHOWINFO_TIME.search(line)
+                if match:
+                    kept.append(float(match.group(1)))
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg could not analyse {input_file}")
+
+    frame_time = 1 / info.fps if info.fps else min((b - a for a, b in zip(kept, kept[1:]) if b > a), default=0.04)
+    ranges = []
+    for time in kept:
+        if ranges and time - ranges[-1][1] < min_drop:
+            ranges[-1][1] = time + frame_time
+        else:
+            ranges.append([time, time + frame_time])
+    return {"ranges": [[round(start, 6), round(end, 6)] for start, end in ranges], "has_audio": info.has_audio}
+
+
+def kept_ranges(input_file, mpdecimate_options=DEFAULT_MPDECIMATE_OPTIONS, min_drop=MIN_DROP_SECONDS):
+    """
+    analyse_kept_ranges, cached next to the video in a hidden JSON file. The cache is
+    used while the video's size, modification time and the options are unchanged, so
+    encoding the same recording again (another direction, encoder or quality) does not
+    decode it twice.
+    """
+    file_dir, file_name = os.path.split(os.path.abspath(input_file))
+    cache_file = os.path.join(file_dir, f".{file_name}.decimate.json")
+    stat_result = os.stat(input_file)
+    signature = {"size": stat_result.st_size, "mtime_ns": stat_result.st_mtime_ns,
+                 "mpdecimate": mpdecimate_options, "min_drop": min_drop}
+    try:
+        with open(cache_file, encoding="utf-8") as file:
+            cached = json.load(file)
+        if cached.get("signature") == signature:
+            return cached["result"]
+    except (OSError, ValueError):
+        pass
+
+    result = analyse_kept_ranges(input_file, mpdecimate_options, min_drop)
+    try:
+        with open(cache_file, "w", encoding="utf-8") as file:
+            json.dump({"signature": signature, "result": result}, file)
+    except OSError:
+        pass
+    return result
+
+
+def range_expression(ranges, variable="t"):
+    """
+    Builds an FFmpeg expression that is non-zero inside any of the sorted `ranges`.
+
+    A flat sum of between() terms is evaluated term by term for every frame. This
+    nests if(lt(t,start),left,right) as a balanced binary search instead, so each
+    frame (or audio frame) costs about log2(len(ranges)) comparisons.
+    """
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return f"between({variable},{start},{end})"
+    middle = len(ranges) // 2
+    return (f"if(lt({variable},{ranges[middle][0]}),"
+            f"{range_expression(ranges[:middle], variable)},{range_expression(ranges[middle:], variable)})")
+
+
+def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=True, quiet=False,
+                  mpdecimate_options=DEFAULT_MPDECIMATE_OPTIONS, min_drop=MIN_DROP_SECONDS):
+    """
+    Rotates and re-encodes a video, dropping the stretches where the picture does not change.
+
+    The video is decoded once to find those stretches (or not at all when the result
+    is cached, see kept_ranges) and once to encode. The same time ranges are
+    selected from the audio, so it stays in sync; it is re-encoded as AAC because
+    it is cut.
+
+    Returns:
+        str: The output file, or None if it could not be made.
+    """
     # Get the file directory, name, and extension
     file_dir, file_name = os.path.split(input_file)
     file_root, file_ext = os.path.splitext(file_name)
     output_file = os.path.join(file_dir, f"{file_root}_processed_{direction}{file_ext}")
     
-    # Determine FPS dynamically
-    fps = get_fps(input_file)
-    print(f"Detected FPS: {fps}")
-    
     # Set the transpose filter if rotation is required
     transpose_filter = None
     if direction in ["right", "left", "180"]:
@@ -111,49 +209,77 @@ def process_video(input_file, direction, encoder="nvidia", crf=28, decimate=True
             "180": "transpose=2,transpose=2"
         }[direction]
 
-    # Generate filters
-    filters = []
-    if transpose_filter:
-        filters.append(transpose_filter)
-    
-    if decimate:
-        duplicate_frames = get_duplicate_frames(input_file)
-        if duplicate_frames:
-            trim_filter = generate_trim_filter(duplicate_frames, fps)
-            if trim_filter:
-                filters.append(trim_filter)
-    
-    # Combine filters
-    if filters:
-        filter_chain = ",".join(filters)
-    else:
-        filter_chain = None
-    
-    # Construct FFmpeg command
-    command = ["ffmpeg", "-i", input_file]
-    if filter_chain:
-        command.extend(["-vf", filter_chain])
-    
     if encoder == "nvidia":
-        command.extend(["-c:v", "hevc_nvenc", "-cq:v", str(crf), "-preset", "medium"])
+        encoding_options = ["-c:v", "hevc_nvenc", "-cq:v", str(crf), "-preset", "medium"]
     elif encoder == "intel":
-        command.extend(["-c:v", "hevc_qsv", "-global_quality", str(crf), "-preset", "medium"])
+        encoding_options = ["-c:v", "hevc_qsv", "-global_quality", str(crf), "-preset", "medium"]
     elif encoder == "sw":
-        command.extend(["-c:v", "libx265", "-crf", str(crf), "-preset", "medium"])
+        encoding_options = ["-c:v", "libx265", "-crf", str(crf), "-preset", "medium"]
     else:
         print("Invalid encoder specified.")
-        return
+        return None
 
-    command.extend(["-acodec", "copy", output_file])
+    # Generate filters
+    video_filters = [transpose_filter] if transpose_filter else []
+    audio_filters = []
+    kept = None
+    if decimate:
+        try:
+            kept = kept_ranges(input_file, mpdecimate_options, min_drop)
+            duration = probe(input_file).duration
+        except (OSError, RuntimeError, ProbeError) as e:
+            print("An error occurred:", e)
+            return None
+        ranges = kept["ranges"]
+        # Trim unless one range covers the whole video; a static stretch at the end is a drop too
+        if ranges and (len(ranges) > 1 or ranges[0][0] > 0
+                       or (duration and duration - ranges[-1][1] >= min_drop)):
+            kept_seconds = sum(end - start for start, end in ranges)
+            print(f"Keeping {kept_seconds:.1f} s in {len(ranges)} parts")
+            expression = range_expression(ranges)
+            video_filters.append(f"select='{expression}',setpts=N/FRAME_RATE/TB")
+            audio_filters.append(f"aselect='{expression}',asetpts=N/SR/TB")
+
+    command = ["ffmpeg"] + (QUIET_OPTIONS if quiet else []) + ["-i", input_file]
+    script_file = None
+    if audio_filters:
+        # The expression can be long, so the filter graph goes in a file rather than on the command line
+        graph = f"[0:v:0]{','.join(video_filters)}[v]"
+        maps = ["-map", "[v]"]
+        if kept["has_audio"]:
+            graph += f";[0:a:0]{','.join(audio_filters)}[a]"
+            maps += ["-map", "[a]", "-c:a", "aac", "-b:a", "192k"]
+        # A file of its own, so jobs on the same input (other direction or encoder) do not share it
+        descriptor, script_file = tempfile.mkstemp(prefix=f".{file_name}.", suffix=".filter.txt",
+                                                   dir=file_dir or os.curdir)
+        with open(descriptor, "w", encoding="utf-8") as file:
+            file.write(graph)
+        command.extend(["-filter_complex_script", script_file] + maps)
+    else:
+        if video_filters:
+            command.extend(["-vf", ",".join(video_filters)])
+        encoding_options = encoding_options + ["-acodec", "copy"]
+
+    command.extend(encoding_options + [output_file])
     
     try:
         subprocess.run(command, check=True)
         print(f"Video processed successfully. Output: {output_file}")
+        return output_file
     except subprocess.CalledProcessError as e:
         print("An error occurred:", e)
+        return None
+    finally:
+        if script_file:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(script_file)
 
 
 if __name__ == "__main__":
+    # --no-pause: do not wait for Enter at the end, for shell loops and scheduled runs
+    pause = "--no-pause" not in sys.argv
+    if not pause:
+        sys.argv.remove("--no-pause")
     if len(sys.argv) > 4:
         input_file = sys.argv[1]
         direction = sys.argv[2].lower()  # e.g., "right", "left", "180", or "none"
@@ -164,5 +290,6 @@ if __name__ == "__main__":
         else:
             print("Please provide a valid video file, direction ('right', 'left', '180', or 'none'), encoder (nvidia, intel, or sw), and quality value (CRF).")
     else:
-        print("Usage: python rotateVideo.py <input_file> <direction> <encoder> <quality>")
-    input("\nPress Enter to close...")
+        print("Usage: python rotateVideo_filters.py <input_file> <direction> <encoder> <quality> [--no-pause]")
+    if pause and sys.stdin.isatty():
+        input("\nPress Enter to close...")